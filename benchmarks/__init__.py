@@ -0,0 +1 @@
+"""Benchmarks of digest processing on synthetic digests."""
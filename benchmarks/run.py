@@ -0,0 +1,213 @@
+"""Time digest processing routines on a synthetic digest.
+
+Each benchmark runs in a fresh process, so the peak RSS reported for it (which
+includes loading its input) isn't inflated by earlier benchmarks. Results can
+be saved and later compared against, failing when throughput regresses.
+
+    python -m benchmarks.run --packets 50000 --save baseline.json
+    python -m benchmarks.run --packets 50000 --compare baseline.json
+"""
+
+import argparse
+import functools
+import json
+import logging
+import multiprocessing
+import pathlib
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import sqlite_utils
+
+from benchmarks import synthetic
+from wireshark_digest_to_sqlite import anonymize, digest, ethernet, ingest, stream
+
+
+def load_packets(digest_path):
+    """Return the list of packets in the digest at digest_path."""
+    with digest_path.open() as digest_file:
+        return list(stream.iter_packets(digest_file))
+
+
+def eth_addrs(packets):
+    """Return the source and destination ethernet addresses of packets."""
+    return [
+        packet["_source"]["layers"]["eth"][f"eth.{direction}"]
+        for packet in packets
+        for direction in ["src", "dst"]
+    ]
+
+
+def consume(iterable):
+    """Exhaust iterable."""
+    for _ in iterable:
+        pass
+
+
+# Each setup_ function prepares input outside of the timing and returns the
+# number of packets covered along with a callable doing the timed work.
+
+
+def setup_read(digest_path, work_dir):
+    def run():
+        with digest_path.open() as digest_file:
+            consume(stream.iter_packets(digest_file))
+
+    return len(load_packets(digest_path)), run
+
+
+def setup_nodes(digest_path, work_dir):
+    packets = load_packets(digest_path)
+    return len(packets), lambda: consume(digest.nodes(packets))
+
+
+def setup_labels(digest_path, work_dir):
+    packets = load_packets(digest_path)
+    return len(packets), lambda: consume(digest.labels(packets))
+
+
+def setup_promote_named_objects(digest_path, work_dir):
+    text = digest_path.read_text()
+    object_hook = functools.partial(
+        digest.promote_named_objects, object_map={}, strip_prefixes=True
+    )
+    packet_count = len(json.loads(text))
+    return packet_count, lambda: json.loads(text, object_hook=object_hook)
+
+
+def setup_anonymize_digest(digest_path, work_dir):
+    packets = load_packets(digest_path)
+    return len(packets), lambda: anonymize.anonymize_digest(packets)
+
+
+def setup_eth_addr(digest_path, work_dir):
+    packets = load_packets(digest_path)
+    addrs = eth_addrs(packets)
+    return len(packets), lambda: consume(map(ethernet.EthAddr, addrs))
+
+
+def setup_parse_eth_addr(digest_path, work_dir):
+    packets = load_packets(digest_path)
+    addrs = eth_addrs(packets)
+    ethernet.parse_eth_addr.cache_clear()
+    return len(packets), lambda: consume(map(ethernet.parse_eth_addr, addrs))
+
+
+def setup_ingest(digest_path, work_dir):
+    packets = load_packets(digest_path)
+    db = sqlite_utils.Database(work_dir / "ingest.db")
+    return len(packets), lambda: ingest.ingest_packets(db, packets)
+
+
+BENCHMARKS = {
+    "stream.iter_packets": setup_read,
+    "digest.nodes": setup_nodes,
+    "digest.labels": setup_labels,
+    "digest.promote_named_objects": setup_promote_named_objects,
+    "anonymize.anonymize_digest": setup_anonymize_digest,
+    "ethernet.EthAddr": setup_eth_addr,
+    "ethernet.parse_eth_addr": setup_parse_eth_addr,
+    "ingest.ingest_packets": setup_ingest,
+}
+
+
+def run_benchmark(name, digest_path, work_dir):
+    """Return the result of one benchmark. Run in its own process."""
+    packet_count, run = BENCHMARKS[name](digest_path, work_dir)
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    peak_rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "packets": packet_count,
+        "seconds": seconds,
+        "packets_per_second": packet_count / seconds,
+        "peak_rss_mib": peak_rss_kib / 1024,
+    }
+
+
+def run_isolated(name, digest_path, work_dir):
+    """Return the result of a benchmark run in a freshly spawned process."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as executor:
+        return executor.submit(run_benchmark, name, digest_path, work_dir).result()
+
+
+def regressions(results, baseline, tolerance):
+    """Return names of benchmarks slower than baseline by more than tolerance."""
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline
+        and result["packets_per_second"]
+        < (1 - tolerance) * baseline[name]["packets_per_second"]
+    ]
+
+
+PARSER = argparse.ArgumentParser(
+    description="Time digest processing routines on a synthetic digest.",
+)
+PARSER.add_argument(
+    "--digest",
+    help="digest to use instead of generating a synthetic one",
+    type=pathlib.Path,
+)
+PARSER.add_argument(
+    "--packets", help="packets in the synthetic digest", type=int, default=20_000
+)
+PARSER.add_argument(
+    "--mix",
+    help="share of packets per highest protocol, e.g. `tcp=0.5,tls=0.3,http=0.2`",
+    type=synthetic.parse_mix,
+    default=synthetic.DEFAULT_MIX,
+)
+PARSER.add_argument(
+    "--only", help="benchmarks to run", nargs="+", choices=list(BENCHMARKS)
+)
+PARSER.add_argument("--save", help="write results as json", type=pathlib.Path)
+PARSER.add_argument(
+    "--compare", help="fail on regressions against saved results", type=pathlib.Path
+)
+PARSER.add_argument(
+    "--tolerance",
+    help="fraction of baseline throughput that may be lost before failing",
+    type=float,
+    default=0.2,
+)
+
+
+def main(args):
+    """Run benchmarks and return the process exit code."""
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = pathlib.Path(tmp)
+        digest_path = args.digest
+        if digest_path is None:
+            digest_path = work_dir / "synthetic.json"
+            synthetic.main(digest_path, args.packets, args.mix)
+
+        results = {}
+        for name in args.only or BENCHMARKS:
+            result = results[name] = run_isolated(name, digest_path, work_dir)
+            print(
+                f"{name:<30} {result['packets']:>9d} packets "
+                f"{result['seconds']:>8.3f} s "
+                f"{result['packets_per_second']:>12,.0f} packets/s "
+                f"{result['peak_rss_mib']:>8.1f} MiB peak RSS"
+            )
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2))
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        slower = regressions(results, baseline, args.tolerance)
+        if slower:
+            logging.error("Throughput regressed for: %s", ", ".join(slower))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(PARSER.parse_args()))
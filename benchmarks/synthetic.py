@@ -0,0 +1,265 @@
+"""Generate synthetic digests shaped like `tshark -T json` output.
+
+Every packet carries `frame`, `eth`, `ip` and `tcp` layers. The protocol mix
+sets the share of packets that additionally carry a `tls` layer, or `tls` and
+`http` layers, like those in the `sample_digest` test fixture.
+"""
+
+import argparse
+import pathlib
+import random
+
+from wireshark_digest_to_sqlite import ethernet, stream
+
+DEFAULT_MIX = {"tcp": 0.55, "tls": 0.35, "http": 0.10}
+START_EPOCH = 1715735117.225239
+HANDSHAKE_SHARE = 0.1
+PROTO_STACKS = {
+    "tcp": ["tcp"],
+    "tls": ["tcp", "tls"],
+    "http": ["tcp", "tls", "http"],
+}
+
+
+def parse_mix(mix_spec):
+    """Return a protocol mix dict from a spec like `tcp=0.5,tls=0.3,http=0.2`."""
+    mix = {}
+    for part in mix_spec.split(","):
+        proto, _, weight = part.partition("=")
+        if proto not in DEFAULT_MIX:
+            raise ValueError(f"Unknown protocol `{proto}` in mix `{mix_spec}`.")
+        mix[proto] = float(weight)
+    return mix
+
+
+def addr_tree(addr, direction):
+    """Return an `eth.{direction}_tree` for a colon-separated address."""
+    eth_addr = ethernet.EthAddr(addr)
+    oui = f"{eth_addr.oui:d}"
+    local = f"{eth_addr.is_local:d}"
+    group = f"{eth_addr.is_group:d}"
+    return {
+        f"eth.{direction}_resolved": addr,
+        f"eth.{direction}.oui": oui,
+        "eth.addr": addr,
+        "eth.addr_resolved": addr,
+        "eth.addr.oui": oui,
+        f"eth.{direction}.lg": local,
+        "eth.lg": local,
+        f"eth.{direction}.ig": group,
+        "eth.ig": group,
+    }
+
+
+def hex_bytes(rng, count):
+    """Return count random bytes in colon-separated hex notation."""
+    return rng.randbytes(count).hex(":")
+
+
+def frame_layer(number, epoch, length, protocols):
+    """Return a `frame` layer."""
+    return {
+        "frame.encap_type": "1",
+        "frame.time_epoch": f"{epoch:.9f}",
+        "frame.time_relative": f"{epoch - START_EPOCH:.9f}",
+        "frame.number": str(number),
+        "frame.len": str(length),
+        "frame.cap_len": str(length),
+        "frame.marked": "0",
+        "frame.ignored": "0",
+        "frame.protocols": protocols,
+    }
+
+
+def eth_layer(src, dst):
+    """Return an `eth` layer with address trees."""
+    return {
+        "eth.dst": dst,
+        "eth.dst_tree": addr_tree(dst, "dst"),
+        "eth.src": src,
+        "eth.src_tree": addr_tree(src, "src"),
+        "eth.type": "0x0800",
+    }
+
+
+def ip_layer(rng, src, dst, length):
+    """Return an IPv4 `ip` layer."""
+    return {
+        "ip.version": "4",
+        "ip.hdr_len": "20",
+        "ip.dsfield": "0x00",
+        "ip.dsfield_tree": {"ip.dsfield.dscp": "0", "ip.dsfield.ecn": "0"},
+        "ip.len": str(length),
+        "ip.id": f"0x{rng.getrandbits(16):04x}",
+        "ip.flags": "0x40",
+        "ip.flags_tree": {"ip.flags.rb": "0", "ip.flags.df": "1", "ip.flags.mf": "0"},
+        "ip.ttl": "64",
+        "ip.proto": "6",
+        "ip.checksum": f"0x{rng.getrandbits(16):04x}",
+        "ip.src": src,
+        "ip.addr": [src, dst],
+        "ip.src_host": src,
+        "ip.host": [src, dst],
+        "ip.dst": dst,
+        "ip.dst_host": dst,
+    }
+
+
+def tcp_layer(rng, stream_index, srcport, dstport, payload_len):
+    """Return a `tcp` layer for a packet of a TCP stream."""
+    return {
+        "tcp.srcport": str(srcport),
+        "tcp.dstport": str(dstport),
+        "tcp.port": [str(srcport), str(dstport)],
+        "tcp.stream": str(stream_index),
+        "tcp.len": str(payload_len),
+        "tcp.seq": str(rng.getrandbits(16)),
+        "tcp.ack": str(rng.getrandbits(16)),
+        "tcp.hdr_len": "32",
+        "tcp.flags": "0x0018",
+        "tcp.flags_tree": {
+            "tcp.flags.ack": "1",
+            "tcp.flags.push": "1",
+            "tcp.flags.reset": "0",
+            "tcp.flags.syn": "0",
+            "tcp.flags.fin": "0",
+        },
+        "tcp.window_size": "64128",
+        "tcp.checksum": f"0x{rng.getrandbits(16):04x}",
+        "Timestamps": {
+            "tcp.time_relative": f"{rng.random():.9f}",
+            "tcp.time_delta": f"{rng.random() / 100:.9f}",
+        },
+        "tcp.payload": hex_bytes(rng, min(payload_len, 64)),
+    }
+
+
+def tls_layer(rng, server_name, payload_len):
+    """Return a `tls` layer, a client hello in about one in ten."""
+    record = {
+        "tls.record.version": "0x0303",
+        "tls.record.length": str(payload_len),
+    }
+    if rng.random() < HANDSHAKE_SHARE:
+        record["tls.record.content_type"] = "22"
+        record["tls.handshake"] = {
+            "tls.handshake.type": "1",
+            "tls.handshake.length": str(max(payload_len - 4, 0)),
+            "tls.handshake.extensions_server_name": server_name,
+            "tls.handshake.random": hex_bytes(rng, 32),
+        }
+    else:
+        record["tls.record.content_type"] = "23"
+        record["tls.app_data"] = hex_bytes(rng, min(payload_len, 64))
+    return {"tls.record": record}
+
+
+def http_layer(host, path):
+    """Return an `http` layer for a GET request."""
+    return {
+        f"GET {path} HTTP/1.1\\r\\n": {
+            "_ws.expert": {
+                "http.chat": "",
+                "_ws.expert.message": f"GET {path} HTTP/1.1\\r\\n",
+                "_ws.expert.severity": "2097152",
+                "_ws.expert.group": "33554432",
+            },
+            "http.request.method": "GET",
+            "http.request.uri": path,
+            "http.request.version": "HTTP/1.1",
+        },
+        "http.host": host,
+        "http.request.line": [
+            f"Host: {host}\r\n",
+            "User-Agent: curl/7.81.0\r\n",
+            "Accept: */*\r\n",
+        ],
+        "http.user_agent": "curl/7.81.0",
+        "http.accept": "*/*",
+        "http.request.full_uri": f"https://{host}{path}",
+        "http.request": "1",
+    }
+
+
+def synthetic_packets(count, mix=None, macs=20, streams=200, seed=0):
+    """Return iterable of count synthetic packets.
+
+    Addresses are drawn from macs distinct ethernet addresses and packets are
+    spread over streams TCP conversations. The same seed gives the same
+    packets.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    mac_pool = [hex_bytes(rng, ethernet.EthAddr.ETH_ADDR_BYTE_LEN) for _ in range(macs)]
+    conversations = [
+        (
+            f"192.168.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            f"93.184.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            rng.randrange(32768, 61000),
+            rng.choice([80, 443, 8443]),
+        )
+        for _ in range(streams)
+    ]
+    protos, weights = zip(*mix.items())
+
+    epoch = START_EPOCH
+    for number in range(1, count + 1):
+        epoch += rng.expovariate(1000)
+        stream_index = rng.randrange(streams)
+        ip_src, ip_dst, srcport, dstport = conversations[stream_index]
+        eth_src, eth_dst = rng.sample(mac_pool, 2) if macs > 1 else mac_pool * 2
+        payload_len = rng.randrange(0, 1400)
+        length = payload_len + 66
+        highest = rng.choices(protos, weights)[0]
+        proto_stack = PROTO_STACKS[highest]
+
+        layers = {
+            "frame": frame_layer(
+                number,
+                epoch,
+                length,
+                ":".join(["eth", "ethertype", "ip", *proto_stack]),
+            ),
+            "eth": eth_layer(eth_src, eth_dst),
+            "ip": ip_layer(rng, ip_src, ip_dst, length - 14),
+            "tcp": tcp_layer(rng, stream_index, srcport, dstport, payload_len),
+        }
+        host = f"www.example{stream_index % 7}.com"
+        if "tls" in proto_stack:
+            layers["tls"] = tls_layer(rng, host, payload_len)
+        if "http" in proto_stack:
+            layers["http"] = http_layer(host, f"/{rng.randrange(1000)}")
+        yield {
+            "_index": "packets-2024-05-14",
+            "_type": "doc",
+            "_score": None,
+            "_source": {"layers": layers},
+        }
+
+
+PARSER = argparse.ArgumentParser(
+    description="Write a synthetic json wireshark digest.",
+)
+PARSER.add_argument("output", help="path to place digest", type=pathlib.Path)
+PARSER.add_argument("--packets", help="number of packets", type=int, default=10_000)
+PARSER.add_argument(
+    "--mix",
+    help="share of packets per highest protocol, e.g. `tcp=0.5,tls=0.3,http=0.2`",
+    type=parse_mix,
+    default=DEFAULT_MIX,
+)
+PARSER.add_argument("--macs", help="distinct ethernet addresses", type=int, default=20)
+PARSER.add_argument("--seed", help="random seed", type=int, default=0)
+
+
+def main(output_path, packets, mix=None, macs=20, seed=0):
+    """Write a synthetic digest of packets packets to output_path."""
+    with output_path.open("w") as output_file:
+        stream.write_packets(
+            synthetic_packets(packets, mix, macs, seed=seed), output_file
+        )
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+    main(args.output, args.packets, args.mix, args.macs, args.seed)
@@ -3,6 +3,8 @@ import textwrap
 
 import pytest
 
+from wireshark_digest_to_sqlite import ingest
+
 
 @pytest.fixture
 def single_http_digest():
@@ -65,3 +67,26 @@ def sample_digest():
         digest_str,
         strict=False,
     )
+
+
+@pytest.fixture
+def to_ek():
+    """Return a function giving packets as `tshark -T ek` would write them."""
+
+    def convert(packets):
+        lines = []
+        for packet in packets:
+            lines.append(
+                json.dumps({"index": {"_index": packet["_index"], "_type": "doc"}})
+            )
+            layers = {
+                name: {
+                    f"{name}_{field}".replace(".", "_"): value
+                    for field, value in ingest.flatten_layer(name, layer).items()
+                }
+                for name, layer in packet["_source"]["layers"].items()
+            }
+            lines.append(json.dumps({"timestamp": "1715735117225", "layers": layers}))
+        return "\n".join(lines) + "\n"
+
+    return convert
@@ -6,7 +6,7 @@ from unittest import mock
 
 import pytest
 
-from wireshark_digest_to_sqlite import anonymize, ethernet
+from wireshark_digest_to_sqlite import anonymize, ethernet, stream
 
 HEX_ETH_ADDR = re.compile("^[0-9a-f]{2}(?::[0-9a-f]{2}){5}$", re.IGNORECASE)
 
@@ -106,10 +106,254 @@ def test_anonymize(sample_digest):
     anonymize.anonymize_digest(sample_digest)
     assert original_digest != sample_digest
 
-    contains_substrings_function = (
-        "wireshark_digest_to_sqlite.anonymize.contains_substrings"
+    leaked_addresses_function = (
+        "wireshark_digest_to_sqlite.anonymize.Anonymizer.leaked_addresses"
     )
-    with mock.patch(contains_substrings_function) as mock_contains:
-        mock_contains.return_value = True
+    with mock.patch(leaked_addresses_function) as mock_leaked:
+        mock_leaked.return_value = {"ac:de:48:01:02:03"}
         with pytest.raises(anonymize.ScrubbingException):
             anonymize.anonymize_digest(sample_digest)
+
+
+def test_substring_collector():
+    """Test the SubstringCollector class."""
+    collector = anonymize.SubstringCollector(
+        anonymize.ETH_ADDR_RUN, anonymize.ETH_ADDR_LEN, anonymize.HEX_BYTE_STEP
+    )
+    sample = {
+        "aa:bb:cc:dd:ee:ff": ["x 00:11:22:33:44:55:66", 7],
+        "split": ["00:11:22", ":33:44:55"],
+        "odd": "a0:11:22:33:44:55:6",
+    }
+    collector.scan(sample)
+    # the run of seven bytes holds candidates, but none are known
+    assert collector.found == {"aa:bb:cc:dd:ee:ff", "a0:11:22:33:44:55"}
+
+    collector.scan(sample, known={"11:22:33:44:55:66", "00:11:22:33:44:56"})
+    assert collector.found_any(["11:22:33:44:55:66", "0"]) == {"11:22:33:44:55:66"}
+    assert not collector.found_any(["00:11:22:33:44:56"])
+
+    collector = anonymize.SubstringCollector(re.compile(r"\d+"))
+    collector.scan(sample)
+    assert collector.found == {"00", "11", "22", "33", "44", "55", "66", "0", "6"}
+
+
+def test_anonymizer_leak_in_earlier_packet(sample_digest):
+    """Test an address is caught in a packet before its ethernet layer."""
+    leaked = sample_digest[-1]["_source"]["layers"]["eth"]["eth.src"]
+    sample_digest[0]["_source"]["layers"]["note"] = {"note.text": f"from {leaked}"}
+
+    anonymizer = anonymize.Anonymizer()
+    for packet in sample_digest:
+        anonymizer.anonymize_packet(packet)
+    assert anonymizer.leaked_addresses() == {leaked}
+    assert anonymize.contains_substrings(sample_digest, [leaked])
+    with pytest.raises(anonymize.ScrubbingException):
+        anonymizer.verify()
+
+
+@pytest.mark.parametrize("output_format", stream.OUTPUT_FORMATS)
+def test_main(sample_digest, tmp_path, output_format):
+    """Test anonymizing a digest file to each output format."""
+    digest_path = tmp_path / "digest.json"
+    digest_path.write_text(json.dumps(sample_digest, indent=2))
+    output_path = tmp_path / "anonymized.json"
+    anonymize.main(digest_path, output_path, output_format)
+
+    with output_path.open() as output_file:
+        if output_format == "ndjson":
+            anonymized = [json.loads(line) for line in output_file]
+        else:
+            anonymized = list(stream.iter_packets(output_file))
+    assert len(anonymized) == len(sample_digest)
+    original_addrs = {
+        packet["_source"]["layers"]["eth"]["eth.src"] for packet in sample_digest
+    }
+    assert not anonymize.contains_substrings(anonymized, original_addrs)
+
+
+def test_main_duplicate_keys(sample_digest, tmp_path):
+    """Test every value of a repeated key is kept in the anonymized digest."""
+    digest_path = tmp_path / "digest.json"
+    eth_type = sample_digest[0]["_source"]["layers"]["eth"]["eth.type"]
+    digest_path.write_text(
+        json.dumps(sample_digest[:1]).replace(
+            '"eth.type": ', '"eth.type": "0x86dd", "eth.type": '
+        )
+    )
+    output_path = tmp_path / "anonymized.json"
+    anonymize.main(digest_path, output_path)
+
+    anonymized = json.loads(output_path.read_text())
+    assert anonymized[0]["_source"]["layers"]["eth"]["eth.type"] == [
+        "0x86dd",
+        eth_type,
+    ]
+
+
+def test_main_repeated_eth_layers(sample_digest, tmp_path):
+    """Test the addresses of every eth layer of a tunneled packet are replaced."""
+    packet = copy.deepcopy(sample_digest[0])
+    layers = packet["_source"]["layers"]
+    inner = {"eth.dst": "02:00:00:00:00:01", "eth.src": "02:00:00:00:00:02"}
+    layers["inner_eth"] = inner
+    digest_path = tmp_path / "digest.json"
+    digest_path.write_text(json.dumps([packet]).replace('"inner_eth"', '"eth"'))
+    output_path = tmp_path / "anonymized.json"
+    anonymize.main(digest_path, output_path)
+
+    anonymized = json.loads(output_path.read_text())
+    eth_layers = anonymized[0]["_source"]["layers"]["eth"]
+    assert [layer["eth.src_tree"]["eth.addr"] for layer in eth_layers] == [
+        layer["eth.src"] for layer in eth_layers
+    ]
+    original_addrs = [layers["eth"]["eth.src"], layers["eth"]["eth.dst"]]
+    original_addrs += inner.values()
+    assert not anonymize.contains_substrings(anonymized, original_addrs)
+
+
+def test_randomize_packet_ethernet_addresses_trees(sample_digest):
+    """Test address trees are shared between packets only when asked."""
+    replaced = {}
+    first, second = (copy.deepcopy(sample_digest[0]) for _ in range(2))
+    for packet in (first, second):
+        anonymize.randomize_packet_ethernet_addresses(packet, replaced)
+    first_eth = first["_source"]["layers"]["eth"]
+    second_eth = second["_source"]["layers"]["eth"]
+    assert first_eth["eth.src"] == second_eth["eth.src"]
+    assert first_eth["eth.src_tree"] == second_eth["eth.src_tree"]
+    assert first_eth["eth.src_tree"] is not second_eth["eth.src_tree"]
+
+    first, second = (copy.deepcopy(sample_digest[0]) for _ in range(2))
+    for packet in (first, second):
+        anonymize.randomize_packet_ethernet_addresses(packet, replaced, True)
+    first_eth = first["_source"]["layers"]["eth"]
+    second_eth = second["_source"]["layers"]["eth"]
+    assert first_eth["eth.src_tree"] is second_eth["eth.src_tree"]
+    expected = anonymize.addr_tree_digest(first_eth["eth.src"], "src")
+    assert first_eth["eth.src_tree"] == expected
+
+
+def test_keyed_anonymizer(sample_digest):
+    """Test keyed anonymizers agree on pseudonyms without sharing state."""
+    anonymizers = [anonymize.Anonymizer(key=b"secret") for _ in range(2)]
+    first, second = (copy.deepcopy(sample_digest) for _ in range(2))
+    for packet in first:
+        anonymizers[0].anonymize_packet(packet)
+    for packet in reversed(second):
+        anonymizers[1].anonymize_packet(packet)
+    assert first == second
+    assert anonymizers[0].replaced == anonymizers[1].replaced
+
+    other = anonymize.Anonymizer(key=b"other")
+    for packet in sample_digest:
+        other.anonymize_packet(packet)
+    assert other.replaced.keys() == anonymizers[0].replaced.keys()
+    assert set(other.replaced.values()).isdisjoint(anonymizers[0].replaced.values())
+    for addr in other.replaced.values():
+        assert ethernet.EthAddr(addr).is_local
+        assert not ethernet.EthAddr(addr).is_group
+
+    replacement = anonymize.keyed_replacement(b"secret")
+    assert replacement("AC:DE:48:01:02:03") == replacement("ac:de:48:01:02:03")
+    assert HEX_ETH_ADDR.match(replacement("not an address"))
+
+
+def test_anonymize_ip_addresses(sample_digest):
+    """Test IP addresses and the fields naming them are replaced consistently."""
+    original_ip = copy.deepcopy(sample_digest[0]["_source"]["layers"]["ip"])
+    sample_digest[0]["_source"]["layers"]["ip"]["ip.dst_host"] = "example.com"
+    anonymizer = anonymize.Anonymizer(key=b"secret")
+    for packet in sample_digest:
+        anonymizer.anonymize_packet(packet)
+    anonymizer.verify()
+
+    ip_layer = sample_digest[0]["_source"]["layers"]["ip"]
+    src = anonymizer.replaced_ips[original_ip["ip.src"]]
+    dst = anonymizer.replaced_ips[original_ip["ip.dst"]]
+    assert ip_layer["ip.src"] == ip_layer["ip.src_host"] == src
+    assert ip_layer["ip.dst"] == ip_layer["ip.dst_host"] == dst
+    assert ip_layer["ip.addr"] == ip_layer["ip.host"] == [src, dst]
+    assert ip_layer["ip.ttl"] == original_ip["ip.ttl"]
+    assert not anonymize.contains_substrings(sample_digest, anonymizer.replaced_ips)
+
+
+def test_anonymize_ipv6_layers():
+    """Test addresses in repeated ipv6 layers and their trees are replaced."""
+    packet = {
+        "_source": {
+            "layers": {
+                "ipv6": [
+                    {"ipv6.src": "2001:db8::1", "ipv6.plen": "40"},
+                    {
+                        "ipv6.dst": "fe80::1",
+                        "ipv6.dst_tree": {"ipv6.dst_6to4_gw_ipv4": "192.0.2.1"},
+                    },
+                ]
+            }
+        }
+    }
+    anonymizer = anonymize.Anonymizer()
+    anonymizer.anonymize_packet(packet)
+    first, second = packet["_source"]["layers"]["ipv6"]
+    assert first["ipv6.src"] == anonymizer.replaced_ips["2001:db8::1"]
+    assert first["ipv6.plen"] == "40"
+    assert second["ipv6.dst"] == anonymizer.replaced_ips["fe80::1"]
+    gateway = second["ipv6.dst_tree"]["ipv6.dst_6to4_gw_ipv4"]
+    assert gateway == anonymizer.replaced_ips["192.0.2.1"]
+    assert not anonymizer.leaked_addresses()
+
+
+def test_anonymizer_ip_leak(sample_digest):
+    """Test an IP address outside the ip layer is caught as a leak."""
+    leaked = sample_digest[-1]["_source"]["layers"]["ip"]["ip.dst"]
+    sample_digest[0]["_source"]["layers"]["note"] = {"note.text": f"to {leaked}:443"}
+    anonymizer = anonymize.Anonymizer()
+    for packet in sample_digest:
+        anonymizer.anonymize_packet(packet)
+    assert anonymizer.leaked_addresses() == {leaked}
+
+
+def test_find_ip_addrs():
+    """Test strings that could be IP addresses are found in a text."""
+    text = (
+        "to 192.168.1.41:443 1.2.3.4.5 x2001:db8::1. fe80::1%eth0 1234567.1.1.1\n"
+        "aa:bb:cc:dd:ee:ff 21:05:17.225 ::1 1:2:3:4:5:6:7:8 1715735117.225239000\n"
+        "via 10.0.0.1."
+    )
+    assert anonymize.find_ip_addrs(text) == [
+        "192.168.1.41",
+        "10.0.0.1",
+        "2001:db8::1",
+        "fe80::1",
+        "::1",
+        "1:2:3:4:5:6:7:8",
+    ]
+
+
+def test_main_in_place(sample_digest, tmp_path):
+    """Test a digest anonymized onto itself is replaced, not truncated."""
+    digest_path = tmp_path / "digest.json.gz"
+    with stream.open_digest(digest_path, "w") as digest_file:
+        stream.write_packets(sample_digest, digest_file)
+    anonymize.main(digest_path, digest_path)
+
+    with stream.open_digest(digest_path) as digest_file:
+        anonymized = list(stream.read_packets(digest_file))
+    assert len(anonymized) == len(sample_digest)
+    assert not anonymize.contains_substrings(
+        anonymized, [sample_digest[0]["_source"]["layers"]["eth"]["eth.src"]]
+    )
+    assert list(tmp_path.iterdir()) == [digest_path]
+
+
+def test_main_failure(tmp_path):
+    """Test a failed run leaves neither partial output nor a changed output."""
+    digest_path = tmp_path / "digest.json"
+    digest_path.write_text('[{"_source": ')
+    output_path = tmp_path / "anonymized.json"
+    output_path.write_text("[]")
+    with pytest.raises(stream.MalformedDigest):
+        anonymize.main(digest_path, output_path)
+    assert output_path.read_text() == "[]"
+    assert not anonymize.partial_path(output_path).exists()
@@ -0,0 +1,107 @@
+"""Test routines from the batch module."""
+
+import json
+
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import batch, fieldtypes, ingest, stream
+
+
+def write_digests(sample_digest, directory):
+    """Write the sample digest in each digest format into directory."""
+    directory.mkdir()
+    json_path = directory / "a.json"
+    json_path.write_text(json.dumps(sample_digest, indent=2))
+    ndjson_path = directory / "b.ndjson"
+    with ndjson_path.open("w") as ndjson_file:
+        stream.write_packets(sample_digest, ndjson_file, "ndjson")
+    (directory / "notes.txt").write_text("not a digest")
+    return [json_path, ndjson_path]
+
+
+def test_input_files(sample_digest, tmp_path):
+    """Test directories and globs name the captures and digests in them."""
+    digests = write_digests(sample_digest, tmp_path / "in")
+    assert batch.input_files([str(tmp_path / "in")]) == digests
+    assert batch.input_files([str(tmp_path / "in" / "*.json")]) == digests[:1]
+    assert batch.input_files([str(digests[1])]) == digests[1:]
+
+
+def test_process_files(sample_digest, tmp_path):
+    """Test digests are loaded into their own and a merged database."""
+    digests = write_digests(sample_digest, tmp_path / "in")
+    merge_path = tmp_path / "all.db"
+    failed = batch.process_files(
+        digests, tmp_path / "out", workers=2, merge_path=merge_path
+    )
+    assert failed == []
+
+    for digest_path in digests:
+        db = sqlite_utils.Database(batch.output_db_path(tmp_path / "out", digest_path))
+        assert db["frame"].count == len(sample_digest)
+    merged = sqlite_utils.Database(merge_path)
+    assert merged["frame"].count == 2 * len(sample_digest)
+    sources = {row["source"] for row in merged.query("SELECT source FROM frame")}
+    assert sources == {"a.json.db", "b.ndjson.db"}
+    merged_flows = merged.execute("SELECT sum(packets) FROM flows").fetchone()[0]
+    assert merged_flows == 2 * len(sample_digest)
+    assert "idx_tcp_tcp.stream" in {index.name for index in merged["tcp"].indexes}
+
+    # unchanged files are skipped, and only merged again if missing
+    first_db_path = batch.output_db_path(tmp_path / "out", digests[0])
+    assert batch.is_loaded(first_db_path, digests[0])
+    assert batch.is_merged(merged, first_db_path)
+    for table in ingest.layer_tables(merged):
+        merged[table].delete_where("source = ?", ["b.ndjson.db"])
+    merged.execute("UPDATE frame SET frame_number = -frame_number")
+    merged.conn.commit()
+    batch.process_files(digests, tmp_path / "out", workers=2, merge_path=merge_path)
+    frame_numbers = dict(
+        merged.execute("SELECT source, max(frame_number) FROM frame GROUP BY source")
+    )
+    assert frame_numbers["a.json.db"] < 0
+    assert frame_numbers["b.ndjson.db"] > 0
+    assert merged["frame"].count == 2 * len(sample_digest)
+
+
+def test_process_file_capture(sample_digest, tmp_path):
+    """Test captures are dissected by tshark before they are loaded."""
+    digest_path = tmp_path / "dissected.json"
+    digest_path.write_text(json.dumps(sample_digest))
+    tshark_path = tmp_path / "tshark"
+    tshark_path.write_text(f'#!/bin/sh\ncat "{digest_path}"\n')
+    tshark_path.chmod(0o755)
+    capture_path = tmp_path / "capture.pcap"
+    capture_path.write_bytes(b"\xd4\xc3\xb2\xa1")
+    db_path = tmp_path / "capture.db"
+
+    options = {"tshark": tshark_path}
+    assert batch.process_file(capture_path, db_path, options) == len(sample_digest)
+    assert batch.process_file(capture_path, db_path, options) is None
+    capture_path.write_bytes(b"\xd4\xc3\xb2\xa1\x02")
+    assert batch.process_file(capture_path, db_path, options) == len(sample_digest)
+
+
+def test_process_file_checkpoint(sample_digest, tmp_path):
+    """Test the checkpoint holds the last frame number, not the packet count."""
+    digest_path = tmp_path / "tail.json"
+    digest_path.write_text(json.dumps(sample_digest[1:]))
+    db_path = tmp_path / "tail.db"
+    assert batch.process_file(digest_path, db_path, {}) == len(sample_digest) - 1
+
+    db = sqlite_utils.Database(db_path)
+    checkpoint = ingest.read_checkpoint(db, str(digest_path.resolve()))
+    assert checkpoint["last_frame_number"] == ingest.frame_number(sample_digest[-1])
+
+
+def test_merge_database_typed(sample_digest, tmp_path):
+    """Test the kinds of typed fields are merged along with their rows."""
+    digests = write_digests(sample_digest, tmp_path / "in")
+    merge_path = tmp_path / "all.db"
+    batch.process_files(
+        digests, tmp_path / "out", workers=2, merge_path=merge_path, typed=True
+    )
+    db = sqlite_utils.Database(batch.output_db_path(tmp_path / "out", digests[0]))
+    merged = sqlite_utils.Database(merge_path)
+    assert fieldtypes.read_catalog(merged) == fieldtypes.read_catalog(db)
+    assert fieldtypes.read_catalog(merged)["tcp"]["tcp.srcport"] == fieldtypes.INTEGER
@@ -0,0 +1,141 @@
+"""Test routines from the compressed module."""
+
+import gzip
+import json
+
+import pytest
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import (
+    anonymize,
+    batch,
+    compressed,
+    ingest,
+    shard,
+    stream,
+)
+
+COMPRESSIONS = [
+    compressed.GZIP,
+    pytest.param(
+        compressed.ZSTD,
+        marks=pytest.mark.skipif(
+            compressed.zstandard is None, reason="zstandard isn't installed"
+        ),
+    ),
+]
+
+
+def write_compressed(packets, digest_path, output_format="json", block_bytes=5000):
+    """Write packets to a compressed digest in small blocks."""
+    with compressed.open_text(digest_path, "w", block_bytes) as digest_file:
+        stream.write_packets(packets, digest_file, output_format)
+
+
+@pytest.mark.parametrize("suffix", COMPRESSIONS)
+@pytest.mark.parametrize("output_format", stream.OUTPUT_FORMATS)
+def test_open_digest(sample_digest, tmp_path, suffix, output_format):
+    """Test compressed digests read back as written, in any layout."""
+    digest_path = tmp_path / f"digest.json{suffix}"
+    with stream.open_digest(digest_path, "w") as digest_file:
+        stream.write_packets(sample_digest, digest_file, output_format)
+    with stream.open_digest(digest_path) as digest_file:
+        assert list(stream.read_packets(digest_file)) == sample_digest
+
+
+@pytest.mark.parametrize("suffix", COMPRESSIONS)
+def test_blocks(sample_digest, tmp_path, suffix):
+    """Test output is split into blocks that each begin at a packet."""
+    digest_path = tmp_path / f"digest.json{suffix}"
+    write_compressed(sample_digest, digest_path)
+    blocks = compressed.block_ranges(digest_path)
+    assert len(blocks) > 1
+    assert blocks[-1][1] == digest_path.stat().st_size
+
+    text = b""
+    for start, end, text_bytes in blocks:
+        block = compressed.read_blocks(digest_path, start, end)
+        assert len(block) == text_bytes
+        assert block.lstrip(b"[ \n").startswith(b"{")
+        text += block
+    assert json.loads(text) == sample_digest
+
+
+def test_gzip_members(sample_digest, tmp_path):
+    """Test block framed output is an ordinary gzip file."""
+    digest_path = tmp_path / "digest.json.gz"
+    write_compressed(sample_digest, digest_path)
+    assert json.loads(gzip.decompress(digest_path.read_bytes())) == sample_digest
+
+
+@pytest.mark.parametrize("suffix", COMPRESSIONS)
+@pytest.mark.parametrize("shard_bytes", [1, 20000, shard.SHARD_BYTES])
+def test_shard_ranges(sample_digest, tmp_path, suffix, shard_bytes):
+    """Test every packet is read from exactly one shard of whole blocks."""
+    digest_path = tmp_path / f"digest.json{suffix}"
+    write_compressed(sample_digest, digest_path)
+
+    ranges = shard.shard_ranges(digest_path, shard_bytes)
+    packets = []
+    for start, end in ranges:
+        packets.extend(shard.read_shard(digest_path, start, end))
+    assert packets == sample_digest
+    if shard_bytes == shard.SHARD_BYTES:
+        assert len(ranges) == 1
+    else:
+        assert len(ranges) > 1
+
+
+def test_single_block(sample_digest, tmp_path):
+    """Test a digest compressed in one piece is a single shard."""
+    digest_path = tmp_path / "digest.json.gz"
+    digest_path.write_bytes(gzip.compress(json.dumps(sample_digest).encode()))
+    ranges = shard.shard_ranges(digest_path, 1)
+    assert len(ranges) == 1
+    assert shard.read_shard(digest_path, *ranges[0]) == sample_digest
+
+
+def test_ingest_file_parallel(sample_digest, tmp_path):
+    """Test a compressed digest loads in parallel as it does serially."""
+    digest_path = tmp_path / "digest.json.gz"
+    write_compressed(sample_digest, digest_path)
+    db = sqlite_utils.Database(memory=True)
+    assert ingest.ingest_file(db, digest_path) == len(sample_digest)
+
+    parallel_db = sqlite_utils.Database(memory=True)
+    loaded = ingest.ingest_file_parallel(
+        parallel_db, digest_path, workers=2, shard_bytes=20000
+    )
+    assert loaded == len(sample_digest)
+    for table in ingest.layer_tables(db):
+        assert list(parallel_db[table].rows) == list(db[table].rows)
+
+
+@pytest.mark.parametrize("suffix", COMPRESSIONS)
+def test_anonymize(sample_digest, tmp_path, suffix):
+    """Test a compressed digest is anonymized into a compressed digest."""
+    digest_path = tmp_path / "digest.json.gz"
+    write_compressed(sample_digest, digest_path)
+    output_path = tmp_path / f"anon.json{suffix}"
+    plain_path = tmp_path / "anon.json"
+    key = b"k" * 32
+
+    anonymize.main(digest_path, output_path, key=key)
+    anonymize.main(digest_path, plain_path, key=key)
+    with stream.open_digest(output_path) as output_file:
+        assert json.load(output_file) == json.loads(plain_path.read_text())
+
+
+def test_batch_input_files(sample_digest, tmp_path):
+    """Test compressed digests are found among the inputs of a batch."""
+    digest_path = tmp_path / "a.json.gz"
+    write_compressed(sample_digest, digest_path)
+    (tmp_path / "notes.txt.gz").write_bytes(gzip.compress(b"not a digest"))
+    assert batch.input_files([str(tmp_path)]) == [digest_path]
+
+
+def test_missing_zstandard(tmp_path, monkeypatch):
+    """Test zstd digests need the zstandard package."""
+    monkeypatch.setattr(compressed, "zstandard", None)
+    with pytest.raises(compressed.MissingCompressor, match="zstandard"):
+        stream.open_digest(tmp_path / "digest.json.zst", "w")
@@ -2,6 +2,7 @@
 
 import functools
 import json
+import sys
 from collections.abc import Iterable
 
 import pytest
@@ -298,3 +299,185 @@ def test_promote_named_objects_on_pcap_data(sample_digest):
         "tcp",
     )
     assert packets[0].tcp_five_tuple == expected_five_tuple
+
+
+def test_walk(sample_json):
+    """Test the walk routine."""
+    sample = {"a": "1", "b": {"a": ["2", {"c": "3"}]}, "d.e": []}
+    assert list(digest.walk(sample)) == [
+        ("a", "a", "1"),
+        ("b", "b", {"a": ["2", {"c": "3"}]}),
+        ("b.a", "a", ["2", {"c": "3"}]),
+        ("b.a", "a", "2"),
+        ("b.a", "a", {"c": "3"}),
+        ("b.a.c", "c", "3"),
+        ("d.e", "d.e", []),
+    ]
+    assert list(digest.walk("1")) == []
+
+    walked = list(digest.walk(sample_json))
+    leaves = [value for _path, _key, value in walked if digest.is_leaf(value)]
+    assert leaves == list(digest.nodes(sample_json))
+    assert ("object.nestedObject.innerKey1", "innerKey1", "innerValue1") in walked
+
+
+def test_walk_prune():
+    """Test walk skips pruned subtrees."""
+    sample = {"a": {"b": "1", "bc": "2"}, "ab": "3"}
+    assert [path for path, _, _ in digest.walk(sample, prune=["a.b"])] == [
+        "a",
+        "a.bc",
+        "ab",
+    ]
+    assert [path for path, _, _ in digest.walk(sample, prune=["a"])] == ["ab"]
+
+
+def test_walk_deep():
+    """Test traversals don't recurse, so depth isn't limited by the stack."""
+    deep = "leaf"
+    for _ in range(sys.getrecursionlimit() * 2):
+        deep = {"k": [deep]}
+    assert list(digest.nodes(deep)) == ["leaf"]
+    assert len(list(digest.labels(deep))) == sys.getrecursionlimit() * 2
+    assert list(digest.keyed_nodes(deep)) == [("k", "leaf")]
+    *_, last = digest.walk(deep)
+    assert last == ("k" + ".k" * (sys.getrecursionlimit() * 2 - 1), "k", "leaf")
+
+
+def test_keyed_nodes(sample_json):
+    """Test the keyed_nodes routine."""
+    sample = {"a": "1", "b": {"c": "2", "d": ["3", {"e": "4"}, []]}}
+    expected = [("a", "1"), ("c", "2"), ("d", "3"), ("e", "4"), ("d", [])]
+    assert list(digest.keyed_nodes(sample)) == expected
+    keyed = list(digest.keyed_nodes(sample_json))
+    assert [value for _key, value in keyed] == list(digest.nodes(sample_json))
+
+
+def test_strings(sample_json):
+    """Test the strings routine."""
+    expected = {
+        *digest.labels(sample_json),
+        *(value for value in digest.nodes(sample_json) if isinstance(value, str)),
+    }
+    assert set(digest.strings(sample_json)) == expected
+    assert list(digest.strings("a")) == ["a"]
+
+
+def test_JsonView_on_pcap_data(sample_digest):
+    """Test JsonView gives the same attributes as promote_named_objects."""
+
+    class Frame(digest.JsonView):
+        __slots__ = ()
+
+        @property
+        def highest_protocol(self):
+            *_lower_protos, highest_proto = self.protocols.split(":")
+            return highest_proto
+
+    class Packet(digest.JsonView):
+        __slots__ = ()
+
+        @property
+        def tcp_five_tuple(self):
+            try:
+                ip = self._source.layers.ip
+                tcp = self._source.layers.tcp
+            except AttributeError:
+                connection = None
+            else:
+                connection = (ip.src, tcp.srcport, ip.dst, tcp.dstport, "tcp")
+            return connection
+
+    packets = [
+        digest.JsonView(packet, {"frame": Frame}, strip_prefixes=True).promote(Packet)
+        for packet in sample_digest
+    ]
+    # views wrap the loaded dicts rather than copying them
+    assert packets[0]._json_raw is sample_digest[0]
+
+    expected_protos = sample_digest[0]["_source"]["layers"]["frame"]["frame.protocols"]
+    frame = packets[0]._source.layers.frame
+    assert isinstance(frame, Frame)
+    assert frame.highest_protocol == expected_protos.split(":")[-1]
+
+    expected_ip = sample_digest[0]["_source"]["layers"]["ip"]
+    expected_tcp = sample_digest[0]["_source"]["layers"]["tcp"]
+    assert packets[0].tcp_five_tuple == (
+        expected_ip["ip.src"],
+        expected_tcp["tcp.srcport"],
+        expected_ip["ip.dst"],
+        expected_tcp["tcp.dstport"],
+        "tcp",
+    )
+
+    object_hook = functools.partial(
+        digest.promote_named_objects,
+        object_map={},
+        strip_prefixes=True,
+    )
+    promoted = json.loads(json.dumps(sample_digest), object_hook=object_hook)
+    layers = promoted[0]._source.layers
+    viewed_layers = packets[0]._source.layers
+    assert set(layers.ip.__dict__) - {"_json_raw"} <= set(dir(viewed_layers.ip))
+    assert layers.ip.addr == viewed_layers.ip.addr
+
+
+def test_JsonView_names():
+    """Test JsonView renaming, arrays of objects and missing attributes."""
+    view = digest.JsonView(
+        {"a.b": {"a.b.c": 1}, "d": [{"d.e": 1}, "f"]}, strip_prefixes=True
+    )
+    assert view.a_b.c == 1
+    assert view.d[0].e == 1
+    assert view.d[1] == "f"
+    assert "a_b" in dir(view)
+    with pytest.raises(AttributeError):
+        view.c
+
+    dotted = digest.JsonView({"a.b": {"a.b.c": 1}}, keep_dots=True, strip_prefixes=True)
+    assert getattr(dotted, "a.b").c == 1
+    assert view == digest.JsonView(view._json_raw)
+
+
+def test_attribute_name():
+    """Test renaming matches promote_named_objects and can be preloaded."""
+    digest.preload_attribute_names(["tcp.flags.ack"], strip_prefixes=True)
+
+    assert digest.attribute_name("tcp.flags.ack") == "tcp_flags_ack"
+    assert digest.attribute_name("tcp.flags.ack", keep_dots=True) == "tcp.flags.ack"
+    assert digest.attribute_name("tcp_flags_ack", "tcp_", keep_dots=True) == (
+        "flags_ack"
+    )
+    assert digest.attribute_name("a.b", "a.", keep_dots=True) == "b"
+    assert digest.attribute_name("a.b", "a_") == "b"
+
+
+def test_select(sample_json):
+    """Test select keeps selected subtrees and the containers leading there."""
+    sample = {"a": {"b": "1", "c": [{"d": "2", "e": "3"}, {"e": "4"}], "f": {}}}
+    assert digest.select(sample, ["d", "f"]) == {"a": {"c": [{"d": "2"}], "f": {}}}
+    assert digest.select(sample, ["a"]) == sample
+    assert digest.select(sample, ["x"]) == {}
+    assert digest.select("1", ["x"]) == "1"
+
+    selected = digest.select(sample_json, list(digest.labels(sample_json)))
+    assert selected == sample_json
+    assert set(digest.keyed_nodes(digest.select(sample_json, ["array"]))) <= set(
+        digest.keyed_nodes(sample_json)
+    )
+
+
+def test_merge_duplicate_keys(single_http_digest):
+    """Test repeated keys keep all their values, in order, when loading."""
+    http_text = single_http_digest.replace("\r\n", "\\r\\n")
+    loaded = json.loads(http_text, object_pairs_hook=digest.merge_duplicate_keys)
+    http = loaded[0]["_source"]["layers"]["http"]
+    request_lines = http["http.request.line"]
+    assert len(request_lines) == http_text.count('"http.request.line"')
+    assert request_lines[0] == "Host: www.example.com\r\n"
+    assert request_lines[-1] == "Accept-Language: en-US,en;q=0.9\r\n"
+    assert list(http)[:3] == ["GET / HTTP/1.1\r\n", "http.host", "http.request.line"]
+
+    pairs = [("a", "1"), ("b", ["2"]), ("a", ["3"]), ("a", "4")]
+    assert digest.merge_duplicate_keys(pairs) == {"a": ["1", ["3"], "4"], "b": ["2"]}
+    assert digest.merge_duplicate_keys([("a", "1")]) == {"a": "1"}
@@ -0,0 +1,79 @@
+"""Test routines from the ek module."""
+
+import io
+import json
+
+import pytest
+
+from wireshark_digest_to_sqlite import anonymize, ek, ingest, stream
+
+
+@pytest.fixture
+def field_names(sample_digest):
+    """Return the field names in the sample digest."""
+    return {
+        field
+        for packet in sample_digest
+        for layer in ingest.flatten_packet(packet).values()
+        for field in layer
+    }
+
+
+def test_read_packets_ek(sample_digest, field_names, to_ek):
+    """Test ek output is read as packets with the same flattened layers."""
+    known_names = ek.ek_field_names(field_names)
+    digest_file = io.StringIO(to_ek(sample_digest))
+    packets = list(stream.read_packets(digest_file, known_names=known_names))
+    assert len(packets) == len(sample_digest)
+    for packet, original in zip(packets, sample_digest):
+        assert packet["_index"] == original["_index"]
+        assert ingest.flatten_packet(packet) == ingest.flatten_packet(original)
+
+
+def test_field_name():
+    """Test field names are restored from ek names, exactly when known."""
+    assert ek.field_name("ip_ip_src", "ip") == "ip.src"
+    assert ek.field_name("tcp_tcp_flags_ack", "tcp") == "tcp.flags_ack"
+    known_names = ek.ek_field_names(["tcp.flags.ack"])
+    assert ek.field_name("tcp_tcp_flags_ack", "tcp", known_names) == "tcp.flags.ack"
+    assert ek.field_name("ip.src", "ip") == "ip.src"
+    assert ek.field_name("tcp_segments_tcp_segment", "tcp.segments") == ("tcp.segment")
+
+
+def test_normalize_packet():
+    """Test ek values are written as `-T json` would."""
+    document = {
+        "timestamp": "0",
+        "layers": {"tcp": {"tcp_tcp_srcport": 443, "tcp_tcp_flags_syn": True}},
+    }
+    packet = ek.normalize_packet(document)
+    assert packet["_source"]["layers"] == {
+        "tcp": {"tcp.srcport": "443", "tcp.flags_syn": "1"}
+    }
+
+
+def test_read_packets_formats(sample_digest):
+    """Test digests written in each format are read back the same."""
+    for output_format in stream.OUTPUT_FORMATS:
+        digest_file = io.StringIO()
+        stream.write_packets(sample_digest, digest_file, output_format)
+        digest_file.seek(0)
+        assert list(stream.read_packets(digest_file)) == sample_digest
+
+    with pytest.raises(stream.MalformedDigest):
+        list(stream.read_packets(io.StringIO('{"a": 1}\n')))
+
+
+def test_anonymize_ek(sample_digest, tmp_path, to_ek):
+    """Test flat ek packets are anonymized without leaking addresses."""
+    digest_path = tmp_path / "digest.ek"
+    digest_path.write_text(to_ek(sample_digest))
+    output_path = tmp_path / "anonymized.json"
+    anonymize.main(digest_path, output_path)
+
+    anonymized = json.loads(output_path.read_text())
+    assert len(anonymized) == len(sample_digest)
+    original_addrs = {
+        packet["_source"]["layers"]["eth"]["eth.src"] for packet in sample_digest
+    }
+    assert not anonymize.contains_substrings(anonymized, original_addrs)
@@ -91,3 +91,63 @@ def test_random_eth_addr(local, group):
 def test_eth_addr_oui(addr, oui):
     """Test the oui property of EthAddr."""
     assert ethernet.EthAddr(addr).oui == oui
+
+
+@pytest.mark.parametrize(
+    "addr",
+    [
+        "ed:b7:2f:d1:78:80",
+        "ED:B7:2F:D1:78:80",
+        "ed:b7:2f:d1:78: 8",
+        " d:b7:2f:d1:78:80",
+        "ed:b7:2f:d1:7x:80",
+        "edb72fd17880",
+        "ed.b7.2f.d1.78.80",
+    ],
+)
+def test_eth_addr_fast_path(addr):
+    """Test the `:` fast path parses as the regular expressions do."""
+    regex_matches = [
+        addr_format.match(addr) for addr_format in ethernet.EthAddr.HEX_ETH_ADDR_FORMATS
+    ]
+    regex_matches = [match for match in regex_matches if match]
+    if not regex_matches:
+        with pytest.raises(ethernet.UnrecognizedEthernetAddressFormat):
+            ethernet.EthAddr(addr)
+        return
+
+    try:
+        expected = bytes.fromhex("".join(regex_matches[0].groups()))
+    except ValueError:
+        with pytest.raises(ValueError):
+            ethernet.EthAddr(addr)
+    else:
+        assert ethernet.EthAddr(addr).normalized == expected
+
+
+def test_parse_eth_addr():
+    """Test parse_eth_addr reuses parsed addresses."""
+    addr = ethernet.parse_eth_addr("ac:de:48:01:02:03")
+    assert addr is ethernet.parse_eth_addr("ac:de:48:01:02:03")
+    assert addr.normalized == ethernet.EthAddr("ac:de:48:01:02:03").normalized
+    assert not hasattr(addr, "__dict__")
+    with pytest.raises(ethernet.UnrecognizedEthernetAddressFormat):
+        ethernet.parse_eth_addr("ac:de:48:01:02")
+
+
+@pytest.mark.parametrize(
+    "local, group",
+    list(itertools.product([True, False], [True, False])),
+)
+def test_keyed_eth_addr(local, group):
+    """Test EthAddr's keyed_eth_addr routine."""
+    key, data = b"secret", b"\xac\xde\x48\x01\x02\x03"
+    addr = ethernet.EthAddr.keyed_eth_addr(key, data, local, group)
+    assert addr.is_local == local
+    assert addr.is_group == group
+    same = ethernet.EthAddr.keyed_eth_addr(key, data, local, group)
+    assert same.normalized == addr.normalized
+    other_key = ethernet.EthAddr.keyed_eth_addr(b"other", data, local, group)
+    assert other_key.normalized != addr.normalized
+    other_data = ethernet.EthAddr.keyed_eth_addr(key, data[::-1], local, group)
+    assert other_data.normalized != addr.normalized
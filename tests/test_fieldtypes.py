@@ -0,0 +1,81 @@
+"""Test routines from the fieldtypes module."""
+
+import ipaddress
+import json
+
+import pytest
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import fieldtypes
+
+
+@pytest.mark.parametrize(
+    "value, kind",
+    [
+        ("443", fieldtypes.INTEGER),
+        ("-1", fieldtypes.INTEGER),
+        ("0", fieldtypes.INTEGER),
+        ("007", fieldtypes.TEXT),
+        (str(1 << 64), fieldtypes.TEXT),
+        ("1715735117.225239000", fieldtypes.REAL),
+        ("0x0800", fieldtypes.TEXT),
+        ("ed:b7:2f:d1:78:80", fieldtypes.MAC),
+        ("zz:zz:zz:zz:zz:zz", fieldtypes.TEXT),
+        ("192.168.1.41", fieldtypes.IP),
+        ("fe80::1", fieldtypes.IP),
+        ("www.example.com", fieldtypes.TEXT),
+        ("", fieldtypes.TEXT),
+        (None, fieldtypes.TEXT),
+    ],
+)
+def test_value_kind(value, kind):
+    """Test the narrowest kind for a value is found."""
+    assert fieldtypes.value_kind(value) == kind
+
+
+def test_infer_kind():
+    """Test kinds are inferred from samples, widening when they mix."""
+    assert fieldtypes.infer_kind(["1", None, ["2", "3"]]) == fieldtypes.INTEGER
+    assert fieldtypes.infer_kind(["1", "2.5"]) == fieldtypes.REAL
+    assert fieldtypes.infer_kind(["1", "a"]) == fieldtypes.TEXT
+    assert fieldtypes.infer_kind([None]) == fieldtypes.TEXT
+    assert fieldtypes.infer_kind(["1", "a"], sample_size=1) == fieldtypes.INTEGER
+
+
+@pytest.mark.parametrize(
+    "value, kind, expected",
+    [
+        ("443", fieldtypes.INTEGER, 443),
+        ("a", fieldtypes.INTEGER, "a"),
+        ("1.5", fieldtypes.REAL, 1.5),
+        ("2", fieldtypes.REAL, 2.0),
+        ("ed:b7:2f:d1:78:80", fieldtypes.MAC, bytes.fromhex("edb72fd17880")),
+        ("zz:zz:zz:zz:zz:zz", fieldtypes.MAC, "zz:zz:zz:zz:zz:zz"),
+        ("192.168.1.41", fieldtypes.IP, ipaddress.ip_address("192.168.1.41").packed),
+        ("192.168.1.41", fieldtypes.TEXT, "192.168.1.41"),
+        (None, fieldtypes.INTEGER, None),
+        (["1", "2"], fieldtypes.INTEGER, json.dumps([1, 2])),
+        (["a", "b"], fieldtypes.TEXT, json.dumps(["a", "b"])),
+    ],
+)
+def test_to_sqlite_value(value, kind, expected):
+    """Test values are stored by kind, or as they are when they don't fit."""
+    assert fieldtypes.to_sqlite_value(value, kind) == expected
+
+
+def test_merge_catalog():
+    """Test merged kinds are added, and widened where they differ."""
+    db = sqlite_utils.Database(memory=True)
+    fieldtypes.merge_catalog(db, {"tcp": {"tcp.len": fieldtypes.INTEGER}})
+    fieldtypes.merge_catalog(
+        db,
+        {
+            "tcp": {"tcp.len": fieldtypes.REAL},
+            "ip": {"ip.src": fieldtypes.IP},
+        },
+    )
+    fieldtypes.merge_catalog(db, {"ip": {"ip.src": fieldtypes.MAC}})
+    assert fieldtypes.read_catalog(db) == {
+        "tcp": {"tcp.len": fieldtypes.REAL},
+        "ip": {"ip.src": fieldtypes.TEXT},
+    }
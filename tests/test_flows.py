@@ -0,0 +1,65 @@
+"""Test routines from the flows module."""
+
+import pytest
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import flows, ingest
+
+
+@pytest.fixture
+def db():
+    """Return an empty in-memory database."""
+    return sqlite_utils.Database(memory=True)
+
+
+def test_flows(db, sample_digest):
+    """Test the flows table matches grouping the loaded packets."""
+    ingest.ingest_packets(db, sample_digest, batch_size=7)
+    grouped = db.execute(
+        'SELECT CAST(tcp."tcp.stream" AS INTEGER), count(*), '
+        'sum(frame."frame.len"), min(frame.frame_number), max(frame.frame_number) '
+        "FROM tcp JOIN frame USING (frame_number) GROUP BY 1 ORDER BY 1"
+    ).fetchall()
+    summed = db.execute(
+        "SELECT stream, packets, bytes, first_frame, last_frame FROM flows "
+        "WHERE protocol = 'tcp' ORDER BY stream"
+    ).fetchall()
+    assert summed == grouped
+
+    first_layers = sample_digest[0]["_source"]["layers"]
+    flow = db[flows.FLOWS_TABLE].get(("tcp", int(first_layers["tcp"]["tcp.stream"])))
+    assert flow["src_addr"] == first_layers["ip"]["ip.src"]
+    assert flow["dst_port"] == int(first_layers["tcp"]["tcp.dstport"])
+    assert flow["first_time"] == float(first_layers["frame"]["frame.time_epoch"])
+    assert flow["last_time"] >= flow["first_time"]
+    server_names = {row["server_name"] for row in db[flows.FLOWS_TABLE].rows}
+    assert "www.example.com" in server_names
+
+
+def test_flows_resumed(db, sample_digest):
+    """Test flows of a load resumed after a failed batch are counted once."""
+    half = len(sample_digest) // 2
+
+    def failing_packets():
+        yield from sample_digest[:half]
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError), ingest.Ingester(db, batch_size=10) as ingester:
+        for packet in failing_packets():
+            ingester.add_packet(packet)
+    last_frame = ingester.last_frame_number - ingester.pending_packets
+    with ingest.Ingester(db, batch_size=10, last_frame=last_frame) as ingester:
+        for packet in sample_digest:
+            if ingest.frame_number(packet) > last_frame:
+                ingester.add_packet(packet)
+
+    whole_db = sqlite_utils.Database(memory=True)
+    ingest.ingest_packets(whole_db, sample_digest)
+    assert list(db[flows.FLOWS_TABLE].rows) == list(whole_db[flows.FLOWS_TABLE].rows)
+
+
+def test_flow_key():
+    """Test packets are keyed by their TCP stream before their UDP stream."""
+    assert flows.flow_key({"tcp": {"tcp.stream": "4"}}) == ("tcp", 4)
+    assert flows.flow_key({"udp": {"udp.stream": ["2", "7"]}}) == ("udp", 2)
+    assert flows.flow_key({"eth": {"eth.src": "00:00:00:00:00:00"}}) is None
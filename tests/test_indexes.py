@@ -0,0 +1,57 @@
+"""Test routines from the indexes module."""
+
+import pytest
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import indexes, ingest
+
+
+@pytest.fixture
+def db(sample_digest):
+    """Return an in-memory database loaded with the sample digest."""
+    db = sqlite_utils.Database(memory=True)
+    ingest.ingest_packets(db, sample_digest)
+    return db
+
+
+def test_create_default_indexes(db):
+    """Test default indexes are made on the layer tables with the fields."""
+    created = indexes.create_default_indexes(db)
+    assert "idx_tcp_tcp.stream" in created
+    assert "idx_ip_ip.src" in created
+    assert "idx_frame_frame.time_epoch" in created
+    assert {index.name for index in db["tcp"].indexes} == {"idx_tcp_tcp.stream"}
+    assert "sqlite_stat1" in db.table_names()
+
+    assert indexes.create_default_indexes(db) == []
+
+
+def test_enable_full_text(db):
+    """Test searching text fields once full-text search is enabled."""
+    requests = db["http"].count_where('"http.request.line" IS NOT NULL')
+    assert indexes.enable_full_text(db) == ["http"]
+    assert db["http"].detect_fts() == "http_fts"
+    assert len(list(db["http"].search('"Host"'))) == requests
+
+    # rows loaded later are searchable once it's enabled again
+    db["http"].insert({ingest.FRAME_NUMBER: 0, "http.request.line": "Host: late"})
+    assert indexes.enable_full_text(db) == ["http"]
+    assert len(list(db["http"].search('"late"'))) == 1
+
+
+def test_recommend_indexes(db):
+    """Test covering indexes are recommended for queries with full scans."""
+    query = (
+        'SELECT "tcp.len", "tcp.srcport" FROM tcp '
+        'WHERE "tcp.dstport" = \'443\' ORDER BY "tcp.len"'
+    )
+    recommended = indexes.recommend_indexes(db, [query])
+    assert recommended == [("tcp", ["tcp.dstport", "tcp.len", "tcp.srcport"])]
+    assert indexes.index_statement(*recommended[0]).startswith(
+        'CREATE INDEX "idx_tcp_tcp.dstport_tcp.len_tcp.srcport" ON "tcp"'
+    )
+
+    indexes.create_indexes(db, recommended)
+    plan = db.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+    assert any("COVERING INDEX" in detail for *_ids, detail in plan)
+    assert indexes.recommend_indexes(db, [query]) == []
@@ -0,0 +1,320 @@
+"""Test routines from the ingest module."""
+
+import ipaddress
+import json
+
+import pytest
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import (
+    ethernet,
+    fieldtypes,
+    flows,
+    ingest,
+    shard,
+    stream,
+)
+
+
+@pytest.fixture
+def db():
+    """Return an empty in-memory database."""
+    return sqlite_utils.Database(memory=True)
+
+
+def test_leaf_items():
+    """Test the leaf_items routine."""
+    sample = {"a": "1", "b": {"c": "2", "d": ["3", {"e": "4"}]}}
+    expected = [("a", "1"), ("c", "2"), ("d", "3"), ("e", "4")]
+    assert list(ingest.leaf_items(sample)) == expected
+    assert list(ingest.leaf_items("1", "key")) == [("key", "1")]
+
+
+def test_flatten_layer(sample_digest):
+    """Test the flatten_layer routine."""
+    eth = sample_digest[0]["_source"]["layers"]["eth"]
+    row = ingest.flatten_layer("eth", eth)
+    assert row["eth.src"] == eth["eth.src"]
+    assert row["eth.dst.oui"] == eth["eth.dst_tree"]["eth.dst.oui"]
+    # eth.addr is in both the src and dst trees
+    assert row["eth.addr"] == [eth["eth.dst"], eth["eth.src"]]
+    assert "eth.src_tree" not in row
+
+    assert ingest.flatten_layer("data", "") == {"data": ""}
+
+
+def test_flatten_layer_labels(sample_digest):
+    """Test leaves keyed by labels are gathered into one column."""
+    text_lines = next(
+        packet["_source"]["layers"]["data-text-lines"]
+        for packet in sample_digest
+        if "data-text-lines" in packet["_source"]["layers"]
+    )
+    row = ingest.flatten_layer("data-text-lines", text_lines)
+    assert list(row) == [ingest.LABELS]
+    assert json.loads(row[ingest.LABELS]).keys() == text_lines.keys()
+
+
+def test_ingest_packets_labels(db, sample_digest):
+    """Test distinct body lines don't each add a column to their layer."""
+    template = next(
+        packet
+        for packet in sample_digest
+        if "data-text-lines" in packet["_source"]["layers"]
+    )
+    packets = []
+    for number in range(1, 101):
+        packet = json.loads(json.dumps(template))
+        layers = packet["_source"]["layers"]
+        layers["frame"]["frame.number"] = str(number)
+        layers["data-text-lines"] = {f"line {number} {i}\\n": "" for i in range(30)}
+        packets.append(packet)
+
+    assert ingest.ingest_packets(db, packets) == len(packets)
+    assert set(db["data-text-lines"].columns_dict) == {
+        ingest.FRAME_NUMBER,
+        ingest.LABELS,
+    }
+    assert not any("\r\n" in column for column in db["http"].columns_dict)
+    row = db["data-text-lines"].get(7)
+    assert "line 7 29\\n" in json.loads(row[ingest.LABELS])
+
+
+def test_ingest_packets(db, sample_digest):
+    """Test loading a digest into per-layer tables."""
+    loaded = ingest.ingest_packets(db, sample_digest, batch_size=2)
+    assert loaded == len(sample_digest)
+
+    layer_names = {
+        name for packet in sample_digest for name in packet["_source"]["layers"]
+    }
+    assert set(ingest.layer_tables(db)) == layer_names
+    assert db[flows.FLOWS_TABLE].exists()
+
+    frame_numbers = [
+        int(packet["_source"]["layers"]["frame"]["frame.number"])
+        for packet in sample_digest
+    ]
+    rows = list(db["frame"].rows_where(order_by=ingest.FRAME_NUMBER))
+    assert [row[ingest.FRAME_NUMBER] for row in rows] == frame_numbers
+
+    first_layers = sample_digest[0]["_source"]["layers"]
+    ip_row = db["ip"].get(frame_numbers[0])
+    assert ip_row["ip.src"] == first_layers["ip"]["ip.src"]
+    eth_row = db["eth"].get(frame_numbers[0])
+    assert json.loads(eth_row["eth.addr"]) == [
+        first_layers["eth"]["eth.dst"],
+        first_layers["eth"]["eth.src"],
+    ]
+
+
+def test_ingest_packets_fields(db, sample_digest):
+    """Test loading only some fields into tables of the layers holding them."""
+    loaded = ingest.ingest_packets(db, sample_digest, fields=["ip.src", "tls"])
+    assert loaded == len(sample_digest)
+    assert set(db.table_names()) == {"frame", "ip", "tls"}
+    assert set(db["frame"].columns_dict) == {ingest.FRAME_NUMBER, "frame.number"}
+    assert set(db["ip"].columns_dict) == {ingest.FRAME_NUMBER, "ip.src"}
+
+
+def test_ingest_packets_typed(db, sample_digest):
+    """Test values are stored by the kinds inferred for their fields."""
+    ingest.ingest_packets(db, sample_digest, typed=True)
+    first_layers = sample_digest[0]["_source"]["layers"]
+    number = int(first_layers["frame"]["frame.number"])
+
+    tcp_row = db["tcp"].get(number)
+    assert tcp_row["tcp.srcport"] == int(first_layers["tcp"]["tcp.srcport"])
+    frame_row = db["frame"].get(number)
+    assert frame_row["frame.time_epoch"] == float(
+        first_layers["frame"]["frame.time_epoch"]
+    )
+    eth_row = db["eth"].get(number)
+    assert (
+        eth_row["eth.src"]
+        == ethernet.EthAddr(first_layers["eth"]["eth.src"]).normalized
+    )
+    ip_row = db["ip"].get(number)
+    assert ip_row["ip.src"] == ipaddress.ip_address(first_layers["ip"]["ip.src"]).packed
+
+    catalog = fieldtypes.read_catalog(db)
+    assert catalog["tcp"]["tcp.srcport"] == fieldtypes.INTEGER
+    assert catalog["eth"]["eth.src"] == fieldtypes.MAC
+    assert catalog["ip"]["ip.id"] == fieldtypes.TEXT
+
+
+def test_ingester_batches(db, sample_digest):
+    """Test rows are only written once a batch fills or the ingester exits."""
+    with ingest.Ingester(db, batch_size=len(sample_digest) + 1) as ingester:
+        for packet in sample_digest:
+            ingester.add_packet(packet)
+        assert db.table_names() == []
+    assert db["frame"].count == len(sample_digest)
+
+
+def test_quote():
+    """Test the quote routine."""
+    assert ingest.quote("ip.src") == '"ip.src"'
+    assert ingest.quote('a"b') == '"a""b"'
+
+
+def test_ingest_file_checkpoints(db, sample_digest, tmp_path):
+    """Test reloading a file skips what its checkpoint says is loaded."""
+    digest_path = tmp_path / "digest.ndjson"
+    half = len(sample_digest) // 2
+    with digest_path.open("w") as digest_file:
+        stream.write_packets(sample_digest[:half], digest_file, "ndjson")
+
+    assert ingest.ingest_file(db, digest_path) == half
+    assert ingest.ingest_file(db, digest_path) == 0
+
+    # a file smaller than the hashed head still resumes once appended to
+    assert digest_path.stat().st_size < ingest.HASHED_HEAD_BYTES
+    with digest_path.open("a") as digest_file:
+        stream.write_packets(sample_digest[half:], digest_file, "ndjson")
+    assert ingest.ingest_file(db, digest_path) == len(sample_digest) - half
+    assert db["frame"].count == len(sample_digest)
+
+    fingerprint = ingest.file_fingerprint(digest_path)
+    checkpoint = ingest.read_checkpoint(db, fingerprint["source_path"])
+    assert checkpoint == {
+        **fingerprint,
+        "last_frame_number": ingest.frame_number(sample_digest[-1]),
+        "complete": 1,
+    }
+
+    # as if a load died after committing the first packet
+    first_frame = ingest.frame_number(sample_digest[0])
+    for table in ingest.layer_tables(db):
+        db[table].delete_where(f"{ingest.FRAME_NUMBER} > ?", [first_frame])
+    with db.conn:
+        ingest.write_checkpoint(db, fingerprint, first_frame)
+    assert ingest.ingest_file(db, digest_path) == len(sample_digest) - 1
+
+    digest_path.write_text(json.dumps(sample_digest))
+    with pytest.raises(ingest.ChangedSourceFile):
+        ingest.ingest_file(db, digest_path)
+
+
+def ring_files(sample_digest, directory):
+    """Write the sample digest as two ring buffer files numbering from 1."""
+    half = len(sample_digest) // 2
+    paths = []
+    for index, ring in enumerate([sample_digest[:half], sample_digest[half:]]):
+        packets = json.loads(json.dumps(ring))
+        for number, packet in enumerate(packets, 1):
+            packet["_source"]["layers"]["frame"]["frame.number"] = str(number)
+        path = directory / f"ring_{index}.json"
+        path.write_text(json.dumps(packets))
+        paths.append(path)
+    return paths
+
+
+def test_ingest_file_ring_buffer(db, sample_digest, tmp_path):
+    """Test files restarting frame numbers load and resume side by side."""
+    first, second = ring_files(sample_digest, tmp_path)
+    loaded = ingest.ingest_file(db, first)
+    assert ingest.ingest_file(db, second) == len(sample_digest) - loaded
+    assert db["frame"].count == len(sample_digest)
+    sources = {row[ingest.SOURCE] for row in db["frame"].rows}
+    assert sources == {str(first.resolve()), str(second.resolve())}
+
+    # as if the load of the second file died after committing frame 1
+    second_source = str(second.resolve())
+    for table in ingest.layer_tables(db):
+        db[table].delete_where(
+            f"{ingest.SOURCE} = ? AND {ingest.FRAME_NUMBER} > 1", [second_source]
+        )
+    db[flows.FLOWS_TABLE].delete_where(f"{flows.SOURCE} = ?", [second_source])
+    with db.conn:
+        ingest.write_checkpoint(db, ingest.file_fingerprint(second), 1)
+    assert ingest.ingest_file(db, first) == 0
+    assert ingest.ingest_file(db, second) == len(sample_digest) - loaded - 1
+    assert db["frame"].count == len(sample_digest)
+
+    streams = db.execute(
+        f"SELECT count(DISTINCT {flows.SOURCE}) FROM {flows.FLOWS_TABLE}"
+    ).fetchone()
+    assert streams == (2,)
+
+
+def test_ingest_file_unsourced(db, sample_digest, tmp_path):
+    """Test a file isn't loaded into tables made without source files."""
+    first, _ = ring_files(sample_digest, tmp_path)
+    ingest.ingest_packets(db, sample_digest[:1])
+    with pytest.raises(ingest.UnsourcedTable):
+        ingest.ingest_file(db, first)
+
+
+def test_ingest_file_duplicate_keys(db, single_http_digest, tmp_path):
+    """Test every value of a repeated key is loaded, serially or in parallel."""
+    digest_path = tmp_path / "http.json"
+    digest_path.write_text(single_http_digest.replace("\r\n", "\\r\\n"))
+    ingest.ingest_file(db, digest_path)
+    source = str(digest_path.resolve())
+    request_lines = json.loads(db["http"].get((source, 1))["http.request.line"])
+    assert len(request_lines) == single_http_digest.count('"http.request.line"')
+
+    parallel_db = sqlite_utils.Database(memory=True)
+    ingest.ingest_file_parallel(parallel_db, digest_path, workers=1)
+    assert list(parallel_db["http"].rows) == list(db["http"].rows)
+
+
+@pytest.mark.parametrize("output_format", ["ndjson", "ek"])
+def test_ingest_file_ndjson(db, sample_digest, tmp_path, output_format, to_ek):
+    """Test newline delimited digests load in parallel as they do in-process."""
+    digest_path = tmp_path / "digest.ndjson"
+    if output_format == "ek":
+        digest_path.write_text(to_ek(sample_digest))
+    else:
+        with digest_path.open("w") as digest_file:
+            stream.write_packets(sample_digest, digest_file, output_format)
+    loaded = ingest.ingest_file_parallel(db, digest_path, workers=2, shard_bytes=500)
+    assert loaded == len(sample_digest)
+
+    serial_db = sqlite_utils.Database(memory=True)
+    ingest.ingest_file(serial_db, digest_path)
+    for table in ingest.layer_tables(serial_db):
+        order_by = ingest.FRAME_NUMBER
+        serial_rows = list(serial_db[table].rows_where(order_by=order_by))
+        assert list(db[table].rows_where(order_by=order_by)) == serial_rows
+
+
+def test_ingest_file_parallel(db, sample_digest, tmp_path):
+    """Test loading with worker processes matches loading in-process."""
+    digest_path = tmp_path / "digest.json"
+    digest_path.write_text(json.dumps(sample_digest, indent=2))
+    loaded = ingest.ingest_file_parallel(db, digest_path, workers=2, shard_bytes=5000)
+    assert loaded == len(sample_digest)
+    assert ingest.ingest_file_parallel(db, digest_path, workers=2) == 0
+
+    serial_db = sqlite_utils.Database(memory=True)
+    ingest.ingest_file(serial_db, digest_path)
+    for table in ingest.layer_tables(serial_db):
+        order_by = ingest.FRAME_NUMBER
+        serial_rows = list(serial_db[table].rows_where(order_by=order_by))
+        assert list(db[table].rows_where(order_by=order_by)) == serial_rows
+    serial_flows = list(serial_db[flows.FLOWS_TABLE].rows_where(order_by="stream"))
+    assert list(db[flows.FLOWS_TABLE].rows_where(order_by="stream")) == serial_flows
+
+
+def test_ingest_file_parallel_memory(db, sample_digest, tmp_path, monkeypatch):
+    """Test shards are sized so the shards in flight fit in memory_bytes."""
+    digest_path = tmp_path / "digest.json"
+    digest_path.write_text(json.dumps(sample_digest))
+    sizes = []
+    shard_ranges = shard.shard_ranges
+
+    def recorded_shard_ranges(path, shard_bytes):
+        sizes.append(shard_bytes)
+        return shard_ranges(path, shard_bytes)
+
+    monkeypatch.setattr(shard, "shard_ranges", recorded_shard_ranges)
+    monkeypatch.setattr(ingest, "MIN_SHARD_BYTES", 1)
+    workers = 2
+    memory_bytes = 3000 * (workers + 1) * ingest.FLATTENED_GROWTH
+    loaded = ingest.ingest_file_parallel(
+        db, digest_path, workers=workers, memory_bytes=memory_bytes
+    )
+    assert loaded == len(sample_digest)
+    assert sizes == [memory_bytes // ((workers + 1) * ingest.FLATTENED_GROWTH)]
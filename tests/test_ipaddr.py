@@ -0,0 +1,61 @@
+"""Test routines from the ipaddr module."""
+
+import ipaddress
+
+import pytest
+
+from wireshark_digest_to_sqlite import ipaddr
+
+
+def common_prefix_len(first, second):
+    """Return the number of leading bits two addresses share."""
+    differing = int(first) ^ int(second)
+    return first.max_prefixlen - differing.bit_length()
+
+
+@pytest.mark.parametrize(
+    "addrs",
+    [
+        ["192.168.1.41", "192.168.1.42", "192.168.2.1", "10.0.0.1", "93.184.215.14"],
+        ["2001:db8::1", "2001:db8::2", "2001:db8:1::1", "fe80::1", "::1"],
+    ],
+)
+def test_ip_anonymizer_preserves_prefixes(addrs):
+    """Test pseudonyms share as long a prefix as the addresses they replace."""
+    anonymizer = ipaddr.IpAnonymizer(b"secret")
+    originals = [ipaddress.ip_address(addr) for addr in addrs]
+    pseudonyms = [ipaddress.ip_address(anonymizer.anonymize(o)) for o in originals]
+    assert all(p.version == o.version for p, o in zip(pseudonyms, originals))
+    assert len(set(pseudonyms)) == len(pseudonyms)
+    for first, first_pseudonym in zip(originals, pseudonyms):
+        for second, second_pseudonym in zip(originals, pseudonyms):
+            assert common_prefix_len(first, second) == common_prefix_len(
+                first_pseudonym, second_pseudonym
+            )
+
+
+def test_ip_anonymizer_keys():
+    """Test the same key always gives the same pseudonyms and others don't."""
+    addr = ipaddress.ip_address("192.168.1.41")
+    keyed = ipaddr.IpAnonymizer(b"secret").anonymize(addr)
+    assert ipaddr.IpAnonymizer(b"secret").anonymize(addr) == keyed
+    assert ipaddr.IpAnonymizer(b"other").anonymize(addr) != keyed
+    assert ipaddr.IpAnonymizer().anonymize(addr) != str(addr)
+
+
+def test_prefix_preserving_map_cache():
+    """Test mapped prefixes are cached and agree with uncached mapping."""
+    cached = ipaddr.PrefixPreservingMap(b"secret", 32, 24)
+    uncached = ipaddr.PrefixPreservingMap(b"secret", 32, 0)
+    values = [0xC0A80129, 0xC0A8012A, 0xC0A80201]
+    assert [cached.map(value) for value in values] == [
+        uncached.map(value) for value in values
+    ]
+    assert len(cached.prefixes) == len({value >> 8 for value in values})
+
+
+def test_parse_ip_addr():
+    """Test text that isn't an address is told apart."""
+    assert ipaddr.parse_ip_addr("::1") == ipaddress.IPv6Address("::1")
+    assert ipaddr.parse_ip_addr("0x6e18") is None
+    assert ipaddr.parse_ip_addr("64") is None
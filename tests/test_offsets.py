@@ -0,0 +1,159 @@
+"""Test routines from the offsets module."""
+
+import io
+import json
+import os
+
+import pytest
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import ingest, offsets, shard, stream
+
+
+def write_digest(packets, digest_path, output_format):
+    """Write packets to digest_path in one of stream's formats."""
+    with digest_path.open("w", encoding="utf-8") as digest_file:
+        stream.write_packets(packets, digest_file, output_format)
+
+
+@pytest.mark.parametrize("output_format", [*stream.OUTPUT_FORMATS, "ek"])
+def test_packet(sample_digest, tmp_path, output_format, to_ek):
+    """Test each packet is read back from its offset as the stream reads it."""
+    digest_path = tmp_path / "digest.json"
+    if output_format == "ek":
+        digest_path.write_text(to_ek(sample_digest), encoding="utf-8")
+    else:
+        write_digest(sample_digest, digest_path, output_format)
+    with digest_path.open(encoding="utf-8") as digest_file:
+        expected = list(stream.read_packets(digest_file))
+
+    assert offsets.build_index(digest_path) == len(sample_digest)
+    with offsets.DigestIndex(digest_path) as index:
+        assert len(index) == len(sample_digest)
+        assert index.packet(3) == expected[3]
+        assert list(index.packets()) == expected
+        assert list(index.packets(-2)) == expected[-2:]
+
+
+def test_packet_non_ascii(single_http_digest, tmp_path):
+    """Test offsets count bytes, not characters, of multibyte text."""
+    packets = json.loads(single_http_digest, strict=False) * 2
+    packets[0] = json.loads(json.dumps(packets[0]))
+    packets[0]["_source"]["layers"]["http"]["http.host"] = "bücher.example"
+    digest_path = tmp_path / "digest.json"
+    write_digest(packets, digest_path, "json")
+
+    offsets.build_index(digest_path)
+    with offsets.DigestIndex(digest_path) as index:
+        assert list(index.packets()) == packets
+
+
+def test_frame_and_time_range(sample_digest, tmp_path):
+    """Test packets are found by frame number and by time."""
+    digest_path = tmp_path / "digest.json"
+    write_digest(sample_digest, digest_path, "json")
+    offsets.build_index(digest_path)
+    times = [
+        float(packet["_source"]["layers"]["frame"]["frame.time_epoch"])
+        for packet in sample_digest
+    ]
+
+    with offsets.DigestIndex(digest_path) as index:
+        assert index.frame(7) == sample_digest[6]
+        assert index.frame(len(sample_digest) + 1) is None
+        assert list(index.time_range(times[10], times[20])) == sample_digest[10:20]
+        assert list(index.time_range(0, times[0])) == []
+
+
+def test_unsorted(sample_digest, tmp_path):
+    """Test frames and times out of order are still found."""
+    packets = sample_digest[5:] + sample_digest[:5]
+    digest_path = tmp_path / "digest.json"
+    write_digest(packets, digest_path, "json")
+    offsets.build_index(digest_path)
+    first_time = float(
+        sample_digest[0]["_source"]["layers"]["frame"]["frame.time_epoch"]
+    )
+    fifth_time = float(
+        sample_digest[4]["_source"]["layers"]["frame"]["frame.time_epoch"]
+    )
+
+    with offsets.DigestIndex(digest_path) as index:
+        assert not index.flags & (offsets.FRAMES_SORTED | offsets.TIMES_SORTED)
+        assert index.frame(2) == sample_digest[1]
+        assert list(index.time_range(first_time, fifth_time)) == sample_digest[:4]
+
+
+def test_without_frames_or_times(sample_digest, tmp_path):
+    """Test an index built without frames or times only reads by position."""
+    digest_path = tmp_path / "digest.json"
+    write_digest(sample_digest, digest_path, "json")
+    offsets.build_index(digest_path, frames=False, times=False)
+    size = offsets.index_path(digest_path).stat().st_size
+    assert size == offsets.HEADER.size + 8 * len(sample_digest)
+
+    with offsets.DigestIndex(digest_path) as index:
+        assert index.packet(1) == sample_digest[1]
+        with pytest.raises(ValueError, match="frame numbers"):
+            index.frame(1)
+        with pytest.raises(ValueError, match="times"):
+            index.time_range(0, 1)
+
+
+def test_stale(sample_digest, tmp_path):
+    """Test an index of a digest changed since isn't used."""
+    digest_path = tmp_path / "digest.json"
+    assert offsets.open_index(digest_path) is None
+    write_digest(sample_digest, digest_path, "json")
+    offsets.build_index(digest_path)
+    write_digest(sample_digest[1:], digest_path, "json")
+
+    with pytest.raises(offsets.StaleIndex):
+        offsets.DigestIndex(digest_path)
+    assert offsets.open_index(digest_path) is None
+
+
+def test_empty(tmp_path):
+    """Test a digest without packets has an empty index."""
+    digest_path = tmp_path / "digest.json"
+    digest_path.write_text("")
+    assert offsets.build_index(digest_path) == 0
+    with offsets.DigestIndex(digest_path) as index:
+        assert list(index.packets()) == []
+        assert index.shard_ranges(1) == []
+
+
+@pytest.mark.parametrize("shard_bytes", [1, 5000, shard.SHARD_BYTES])
+def test_shard_ranges(sample_digest, tmp_path, shard_bytes):
+    """Test shards split at indexed offsets match those searched for."""
+    digest_path = tmp_path / "digest.json"
+    write_digest(sample_digest, digest_path, "json")
+    searched = shard.shard_ranges(digest_path, shard_bytes)
+    offsets.build_index(digest_path)
+
+    with offsets.DigestIndex(digest_path) as index:
+        assert index.shard_ranges(shard_bytes) == searched
+    assert shard.shard_ranges(digest_path, shard_bytes) == searched
+
+
+def test_ingest_file_parallel(sample_digest, tmp_path):
+    """Test a digest is loaded in parallel from the shards of its index."""
+    digest_path = tmp_path / "digest.json"
+    write_digest(sample_digest, digest_path, "json")
+    offsets.build_index(digest_path)
+    db = sqlite_utils.Database(memory=True)
+
+    loaded = ingest.ingest_file_parallel(db, digest_path, workers=2, shard_bytes=5000)
+    assert loaded == len(sample_digest)
+    assert db["frame"].count == len(sample_digest)
+
+
+def test_main(sample_digest, tmp_path, capsys):
+    """Test the command line indexes a digest and prints a frame."""
+    digest_path = tmp_path / "digest.json"
+    write_digest(sample_digest, digest_path, "json")
+    offsets.main(digest_path, frame=2)
+    assert json.load(io.StringIO(capsys.readouterr().out)) == sample_digest[1]
+    mtime_ns = os.stat(offsets.index_path(digest_path)).st_mtime_ns
+    offsets.main(digest_path)
+    assert os.stat(offsets.index_path(digest_path)).st_mtime_ns == mtime_ns
@@ -0,0 +1,72 @@
+"""Test routines from the pipeline module."""
+
+import json
+import subprocess
+
+import pytest
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import anonymize, pipeline, tshark
+
+
+@pytest.fixture
+def fake_tshark(sample_digest, tmp_path):
+    """Return path to a stand-in for tshark that writes the sample digest."""
+    digest_path = tmp_path / "dissected.json"
+    digest_path.write_text(json.dumps(sample_digest, indent=2))
+    tshark_path = tmp_path / "tshark"
+    tshark_path.write_text(f'#!/bin/sh\necho "$@" >&2\ncat "{digest_path}"\n')
+    tshark_path.chmod(0o755)
+    return tshark_path
+
+
+def test_capture_packets(sample_digest, fake_tshark):
+    """Test packets are decoded from tshark's output."""
+    packets = tshark.capture_packets("capture.pcap", ["-n"], tshark=fake_tshark)
+    assert list(packets) == sample_digest
+
+
+def test_capture_packets_failure(tmp_path):
+    """Test tshark exiting with an error is raised."""
+    failing = tmp_path / "tshark"
+    failing.write_text("#!/bin/sh\necho '[]'\nexit 2\n")
+    failing.chmod(0o755)
+    with pytest.raises(subprocess.CalledProcessError):
+        list(tshark.capture_packets("capture.pcap", tshark=failing))
+
+
+@pytest.mark.parametrize("output_format", ["sqlite", "ndjson"])
+def test_main(sample_digest, fake_tshark, tmp_path, output_format):
+    """Test a capture is anonymized into a database or digest."""
+    output_path = tmp_path / "output"
+    pipeline.main("capture.pcap", output_path, output_format, tshark_path=fake_tshark)
+
+    if output_format == "sqlite":
+        db = sqlite_utils.Database(output_path)
+        assert db["frame"].count == len(sample_digest)
+        anonymized = [json.dumps(row) for row in db["eth"].rows]
+    else:
+        anonymized = output_path.read_text().splitlines()
+        assert len(anonymized) == len(sample_digest)
+    original_addrs = {
+        packet["_source"]["layers"]["eth"]["eth.src"] for packet in sample_digest
+    }
+    assert not anonymize.contains_substrings(anonymized, original_addrs)
+
+
+def test_capture_packets_ek(tmp_path):
+    """Test ek output is read with field names from tshark's glossary."""
+    ek_path = tmp_path / "dissected.ek"
+    ek_path.write_text(
+        '{"index": {"_index": "packets-2024-05-14", "_type": "doc"}}\n'
+        '{"timestamp": "0", "layers": {"tcp": {"tcp_tcp_flags_ack": true}}}\n'
+    )
+    tshark_path = tmp_path / "tshark"
+    tshark_path.write_text(
+        '#!/bin/sh\nif [ "$1" = "-G" ]; then\n'
+        "printf 'F\\tAcknowledgment\\ttcp.flags.ack\\tFT_BOOLEAN\\n'\n"
+        f'else cat "{ek_path}"; fi\n'
+    )
+    tshark_path.chmod(0o755)
+    packets = list(tshark.capture_packets("capture.pcap", [], "ek", tshark_path))
+    assert packets[0]["_source"]["layers"] == {"tcp": {"tcp.flags.ack": "1"}}
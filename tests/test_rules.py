@@ -0,0 +1,104 @@
+"""Test routines from the rules module."""
+
+import copy
+import json
+
+import pytest
+
+from wireshark_digest_to_sqlite import anonymize, rules
+
+HTTP_RULES = {
+    "http.host": "pseudonymize",
+    "http.user_agent": "hash",
+    "http.request.line": "redact",
+    "http.accept*": "drop",
+    "http.request.method": "drop",
+}
+
+
+def test_rule_table():
+    """Test exact names win over patterns and patterns apply in order."""
+    table = rules.RuleTable({"eth.src*": "redact", "eth.*": "drop", "eth.dst": "hash"})
+    assert table.action("eth.dst") == "hash"
+    assert table.action("eth.src_tree") == "redact"
+    assert table.action("eth.type") == "drop"
+    assert table.action("ip.src") is None
+    assert "ip.src" in table.dispatch
+
+    with pytest.raises(rules.InvalidRule):
+        rules.RuleTable({"http.host": "encrypt"})
+
+
+def test_rule_anonymizer(single_http_digest):
+    """Test each transform is applied to the fields its rules match."""
+    packet = json.loads(single_http_digest.replace("\r\n", "\\r\\n"))[0]
+    http = packet["_source"]["layers"]["http"]
+    anonymizer = rules.RuleAnonymizer(HTTP_RULES, key=b"secret")
+    anonymizer.anonymize_packet(packet)
+    anonymized = packet["_source"]["layers"]["http"]
+
+    assert anonymized["http.host"].startswith(rules.PSEUDONYM_PREFIX)
+    assert anonymized["http.host"] != http["http.host"]
+    assert len(anonymized["http.user_agent"]) == len("ff") * 32
+    assert anonymized["http.request.line"] == rules.REDACTED
+    assert "http.accept" not in anonymized
+    assert "http.accept_encoding" not in anonymized
+    assert anonymized["http.connection"] == http["http.connection"]
+    request = next(value for value in anonymized.values() if isinstance(value, dict))
+    assert "http.request.method" not in request
+    assert request["http.request.uri"] == "/"
+
+    again = rules.RuleAnonymizer(HTTP_RULES, key=b"secret")
+    assert again.transform("pseudonymize", http["http.host"]) == anonymized["http.host"]
+
+
+def test_rule_anonymizer_addresses():
+    """Test addresses are pseudonymized as addresses."""
+    anonymizer = rules.RuleAnonymizer({"*": "pseudonymize"}, key=b"secret")
+    packet = {
+        "_source": {
+            "layers": {
+                "arp": {
+                    "arp.src.hw_mac": "ac:de:48:01:02:03",
+                    "arp.src.proto_ipv4": "192.168.1.41",
+                }
+            }
+        }
+    }
+    anonymizer.anonymize_packet(packet)
+    arp = packet["_source"]["layers"]["arp"]
+    assert arp["arp.src.proto_ipv4"] == anonymize.Anonymizer(
+        key=b"secret"
+    ).ip_replacement("192.168.1.41")
+    assert (
+        anonymize.keyed_replacement(b"secret")("ac:de:48:01:02:03")
+        == (arp["arp.src.hw_mac"])
+    )
+
+
+def test_anonymizer_rules_keep_shared_trees(sample_digest):
+    """Test rules don't modify address trees shared between packets."""
+    anonymizer = anonymize.Anonymizer(
+        share_trees=True, field_rules={"eth.addr_resolved": "redact"}
+    )
+    packets = copy.deepcopy(sample_digest[:2])
+    for packet in packets:
+        anonymizer.anonymize_packet(packet)
+    anonymizer.verify()
+    eth = packets[0]["_source"]["layers"]["eth"]
+    assert eth["eth.src_tree"]["eth.addr_resolved"] == rules.REDACTED
+    cached = anonymize.cached_addr_tree_digest(eth["eth.src"], "src")
+    assert cached["eth.addr_resolved"] == eth["eth.src"]
+
+
+def test_main_rules(sample_digest, tmp_path):
+    """Test the rules of a rules file are applied by the anonymize tool."""
+    digest_path = tmp_path / "digest.json"
+    digest_path.write_text(json.dumps(sample_digest))
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"tls": "drop"}))
+    output_path = tmp_path / "anonymized.json"
+    anonymize.main(digest_path, output_path, field_rules=rules.load_rules(rules_path))
+
+    anonymized = json.loads(output_path.read_text())
+    assert not any("tls" in packet["_source"]["layers"] for packet in anonymized)
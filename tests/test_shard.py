@@ -0,0 +1,66 @@
+"""Test routines from the shard module."""
+
+import io
+import itertools
+import json
+
+import pytest
+
+from wireshark_digest_to_sqlite import shard, stream
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("shard_bytes", [1, 500, 5000, shard.SHARD_BYTES])
+def test_shard_ranges(sample_digest, tmp_path, indent, shard_bytes):
+    """Test every packet is read from exactly one shard."""
+    digest_path = tmp_path / "digest.json"
+    digest_path.write_text(json.dumps(sample_digest, indent=indent))
+
+    ranges = shard.shard_ranges(digest_path, shard_bytes)
+    assert ranges[-1][1] == digest_path.stat().st_size
+    assert all(end == start for (_, end), (start, _) in itertools.pairwise(ranges))
+
+    packets = []
+    for start, end in ranges:
+        packets.extend(shard.read_shard(digest_path, start, end))
+    assert packets == sample_digest
+    if shard_bytes == 1:
+        assert len(ranges) == len(sample_digest)
+
+
+@pytest.mark.parametrize("output_format", ["ndjson", "ek"])
+@pytest.mark.parametrize("shard_bytes", [1, 500, shard.SHARD_BYTES])
+def test_shard_ranges_lines(sample_digest, tmp_path, output_format, shard_bytes, to_ek):
+    """Test newline delimited digests split at lines, ek pairs kept whole."""
+    digest_path = tmp_path / "digest.ndjson"
+    if output_format == "ek":
+        digest_path.write_text(to_ek(sample_digest))
+    else:
+        with digest_path.open("w") as digest_file:
+            stream.write_packets(sample_digest, digest_file, output_format)
+
+    ranges = shard.shard_ranges(digest_path, shard_bytes)
+    assert ranges[-1][1] == digest_path.stat().st_size
+    packets = []
+    for start, end in ranges:
+        packets.extend(shard.read_shard(digest_path, start, end))
+    with digest_path.open() as digest_file:
+        assert packets == list(stream.read_packets(digest_file))
+    if shard_bytes == 1:
+        assert len(ranges) == len(sample_digest)
+
+
+def test_shard_ranges_empty(tmp_path):
+    """Test a digest without packets has no shards."""
+    digest_path = tmp_path / "digest.json"
+    digest_path.write_text("[\n]\n")
+    assert shard.shard_ranges(digest_path) == []
+
+
+def test_find_packet_start_skips_strings():
+    """Test a packet-like string inside a packet isn't taken as a packet."""
+    inner = json.dumps([{"_source": {}}])
+    raw = json.dumps([{"_source": {"text": inner}}, {"_source": {}}]).encode()
+    second = raw.rindex(b', {"_source"') + len(b", ")
+    assert shard.find_packet_start(io.BytesIO(raw), 0) == 1
+    assert shard.find_packet_start(io.BytesIO(raw), 2) == second
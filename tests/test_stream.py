@@ -0,0 +1,103 @@
+"""Test routines from the stream module."""
+
+import io
+import json
+
+import pytest
+
+from wireshark_digest_to_sqlite import anonymize, stream
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024, stream.CHUNK_SIZE])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_iter_packets(sample_digest, chunk_size, indent):
+    """Test iter_packets matches json.loads for any chunking of the input."""
+    digest_file = io.StringIO(json.dumps(sample_digest, indent=indent))
+    packets = stream.iter_packets(digest_file, chunk_size=chunk_size)
+    assert list(packets) == sample_digest
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("[]", []),
+        ("  [ \n ]  ", []),
+        ("[1, 23, 456]", [1, 23, 456]),
+        ('[{"a": [1, {"b": "]"}]}, "x"]', [{"a": [1, {"b": "]"}]}, "x"]),
+    ],
+)
+def test_iter_packets_small_arrays(raw, expected):
+    """Test iter_packets on small, edge case arrays."""
+    assert list(stream.iter_packets(io.StringIO(raw), chunk_size=1)) == expected
+
+
+@pytest.mark.parametrize("raw", ["", "{}", "[", "[1,", "[1 2]", '[{"a": 1]', "[1,]"])
+def test_iter_packets_malformed(raw):
+    """Test iter_packets rejects input that isn't a top-level array."""
+    with pytest.raises(stream.MalformedDigest):
+        list(stream.iter_packets(io.StringIO(raw), chunk_size=2))
+
+
+def test_iter_packets_decoder_kwargs(single_http_digest):
+    """Test keyword arguments are used to decode each packet."""
+    digest_file = io.StringIO(single_http_digest)
+    with pytest.raises(stream.MalformedDigest):
+        list(stream.iter_packets(digest_file))
+
+    digest_file = io.StringIO(single_http_digest)
+    [packet] = stream.iter_packets(digest_file, strict=False)
+    assert packet == json.loads(single_http_digest, strict=False)[0]
+
+
+def test_iter_packets_anonymize(sample_digest):
+    """Test streamed packets can be anonymized one at a time."""
+    digest_file = io.StringIO(json.dumps(sample_digest))
+    replaced = {}
+    for packet in stream.iter_packets(digest_file, chunk_size=64):
+        anonymize.randomize_packet_ethernet_addresses(packet, replaced)
+        assert not anonymize.contains_substrings(packet, replaced.keys())
+    assert replaced
+
+
+@pytest.mark.parametrize(
+    "output_format, dumps_kwargs",
+    [("json", {"indent": 2}), ("single-line", {})],
+)
+@pytest.mark.parametrize("packet_count", [0, 1, 3])
+def test_write_packets(sample_digest, output_format, dumps_kwargs, packet_count):
+    """Test write_packets lays out arrays as json.dumps does."""
+    packets = sample_digest[:packet_count]
+    output_file = io.StringIO()
+    written = stream.write_packets(iter(packets), output_file, output_format)
+    assert written == packet_count
+    expected = json.dumps(packets, ensure_ascii=False, **dumps_kwargs)
+    assert output_file.getvalue() == expected
+
+
+def test_write_packets_ndjson(sample_digest):
+    """Test write_packets writes one packet per line for ndjson."""
+    output_file = io.StringIO()
+    stream.write_packets(sample_digest, output_file, "ndjson")
+    lines = output_file.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == sample_digest
+
+    output_file = io.StringIO()
+    stream.write_packets([], output_file, "ndjson")
+    assert output_file.getvalue() == ""
+
+
+def test_iter_packets_fields(sample_digest):
+    """Test packets are cut down to the selected fields and layers."""
+    digest_file = io.StringIO(json.dumps(sample_digest))
+    fields = ["ip.src", "tcp.stream", "tls"]
+    packets = list(stream.iter_packets(digest_file, fields=fields))
+    assert len(packets) == len(sample_digest)
+
+    for packet, original in zip(packets, sample_digest):
+        layers = packet["_source"]["layers"]
+        original_layers = original["_source"]["layers"]
+        assert set(layers) == {"ip", "tcp", "tls"} & set(original_layers)
+        assert layers["ip"] == {"ip.src": original_layers["ip"]["ip.src"]}
+        assert layers["tcp"] == {"tcp.stream": original_layers["tcp"]["tcp.stream"]}
+        if "tls" in layers:
+            assert layers["tls"] == original_layers["tls"]
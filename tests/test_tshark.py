@@ -0,0 +1,18 @@
+from wireshark_digest_to_sqlite import tshark
+
+GLOSSARY = [
+    "P\tTransmission Control Protocol\ttcp",
+    "F\tSource Port\ttcp.srcport\tFT_UINT16\ttcp\tBASE_PT_TCP\t0x0\t",
+    "F\tSource Address\tip.src\tFT_IPv4\tip\t\t0x0\t",
+    "F\tLayer 3 Protocols\t_ws.lua.proto\tFT_STRING\t\t\t0x0\t",
+]
+
+
+def test_field_names():
+    """Test field names are read from glossary lines, optionally filtered."""
+    assert list(tshark.field_names(GLOSSARY)) == [
+        "tcp.srcport",
+        "ip.src",
+        "_ws.lua.proto",
+    ]
+    assert list(tshark.field_names(GLOSSARY, protocols={"ip"})) == ["ip.src"]
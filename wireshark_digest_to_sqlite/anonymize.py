@@ -1,11 +1,41 @@
-"""Tool to anonymize the ethernet information in a json wireshark digest."""
+"""Tool to anonymize the ethernet and IP addresses in a json wireshark digest."""
 
 import argparse
+import functools
 import json
 import logging
 import pathlib
+import re
 
-from wireshark_digest_to_sqlite import ethernet
+from wireshark_digest_to_sqlite import digest, ethernet, ipaddr, rules, stream
+
+# Runs of colon-separated hex bytes. An address is a run of six, but any six
+# consecutive bytes of a longer run (e.g. a payload dump) could be one too.
+ETH_ADDR_RUN = re.compile(r"[0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5,}")
+ETH_ADDR_LEN = ethernet.EthAddr.COLON_FORM_LEN
+HEX_BYTE_STEP = len("ff:")
+
+# The ends of dotted quads and the colon runs of IPv6 addresses. Patterns
+# starting with a literal are searched several times faster than ones
+# matching whole addresses, so the starts of addresses are found by
+# find_ip_addrs around each match.
+# A quad followed by more dotted digits is part of a longer dotted number
+# (e.g. a version), but one ending a sentence is still an address
+IPV4_TAIL = re.compile(r"\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}(?![0-9]|\.[0-9])")
+IPV6_COLON_RUN = re.compile(r":[0-9a-fA-F:.]*")
+DIGITS = frozenset("0123456789")
+DOTTED_DIGITS = DIGITS | {"."}
+HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+IPV4_OCTET_DIGITS = 3
+IPV6_GROUP_DIGITS = 4
+IPV6_ADDR_MAX_LEN = len("ffff:ffff:ffff:ffff:ffff:ffff:255.255.255.255")
+IPV6_FULL_FORM_COLONS = 7
+IP_LAYERS = ("ip", "ipv6")
+# Matched against field names without their protocol, e.g. `src_host` of
+# `ip.src_host` or `src_6to4_gw_ipv4` of `ipv6.src_6to4_gw_ipv4`
+IP_ADDR_FIELD = re.compile(r"src|dst|addr|host|resolved|ipv4|ipv6")
+HOST_NAME_SUFFIXES = ("_host", "_resolved")
+FIELD_CACHE_SIZE = 4096
 
 
 def addr_tree_digest(addr_for_tree, direction):
@@ -13,7 +43,7 @@ def addr_tree_digest(addr_for_tree, direction):
     Return the wireshark digest tree for an address. The oui values resolve
     to `Randomized`.
     """
-    addr = ethernet.EthAddr(addr_for_tree)
+    addr = ethernet.parse_eth_addr(addr_for_tree)
     oui = f"{addr.oui:d}"
     OUI_RESOLVED = "Randomized"
     local = f"{addr.is_local:d}"  # `True` becomes "1"
@@ -33,6 +63,90 @@ def addr_tree_digest(addr_for_tree, direction):
     }
 
 
+TREE_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=TREE_CACHE_SIZE)
+def cached_addr_tree_digest(addr_for_tree, direction):
+    """
+    Return the addr_tree_digest for an address and direction, built once per
+    pair. The same dict is returned on every call, so it must not be modified.
+    """
+    return addr_tree_digest(addr_for_tree, direction)
+
+
+def random_replacement(og_addr):
+    """Return a random local, unicast address to replace og_addr with."""
+    return str(ethernet.EthAddr.random_eth_addr(local=True, group=False))
+
+
+def keyed_replacement(key):
+    """
+    Return a function giving the local, unicast address to replace an address
+    with, derived from key and the address. Separate runs (or processes)
+    given the same key replace an address with the same pseudonym.
+    """
+
+    def replacement(og_addr):
+        try:
+            data = ethernet.parse_eth_addr(og_addr).normalized
+        except (ethernet.UnrecognizedEthernetAddressFormat, ValueError):
+            data = og_addr.encode()
+        return str(ethernet.EthAddr.keyed_eth_addr(key, data, local=True, group=False))
+
+    return replacement
+
+
+def anonymize_eth_layer(eth_layer, replaced, share_trees, replacement):
+    """
+    Replace (in place) the addresses of an eth layer, or of each one in a
+    list of them (a packet with repeated layers, e.g. VXLAN or GRE tunneling
+    Ethernet, has the values of its repeated keys listed). Arguments are as
+    for randomize_packet_ethernet_addresses.
+    """
+    if isinstance(eth_layer, list):
+        for entry in eth_layer:
+            anonymize_eth_layer(entry, replaced, share_trees, replacement)
+        return
+    if not isinstance(eth_layer, dict):
+        return
+    for direction in ["src", "dst"]:
+        og_addr = eth_layer.get(f"eth.{direction}")
+        if not og_addr:
+            continue
+        anon_addr = replaced.get(og_addr)
+        if anon_addr is None:
+            anon_addr = replaced[og_addr] = replacement(og_addr)
+        eth_layer[f"eth.{direction}"] = anon_addr
+        anon_addr_tree = cached_addr_tree_digest(anon_addr, direction)
+        if not share_trees:
+            anon_addr_tree = dict(anon_addr_tree)
+        for tree_key in anon_addr_tree:
+            eth_layer.pop(tree_key, None)
+        eth_layer[f"eth.{direction}_tree"] = anon_addr_tree
+
+
+def randomize_packet_ethernet_addresses(
+    packet, replaced, share_trees=False, replacement=random_replacement
+):
+    """
+    Replaces (in place) ethernet addresses found in a single packet with
+    randomized addresses. Addresses already in replaced keep their earlier
+    replacement; new ones are added to it. The address for a new one comes
+    from calling replacement with it.
+
+    The address trees placed in the packet are copies of cached trees. With
+    share_trees, the cached trees themselves are placed instead, which is
+    cheaper but only safe if the packet won't be modified afterwards (e.g.
+    it is serialized and dropped). Fields of the trees found directly in the
+    layer, as in flat `-T ek` packets, are replaced by the trees. Repeated
+    eth layers are each anonymized.
+    """
+    eth_layer = packet["_source"]["layers"].get("eth")
+    if eth_layer:
+        anonymize_eth_layer(eth_layer, replaced, share_trees, replacement)
+
+
 def randomize_ethernet_addresses(digest):
     """
     Replaces (in place) ethernet addresses found in digest with randomized
@@ -41,23 +155,74 @@ def randomize_ethernet_addresses(digest):
     """
     replaced = {}
     for packet in digest:
-        eth_layer = packet["_source"]["layers"].get("eth")
-        if not eth_layer:
-            continue
-        for direction in ["src", "dst"]:
-            og_addr = eth_layer.get(f"eth.{direction}")
-            if not og_addr:
-                continue
-            anon_addr = replaced.setdefault(
-                og_addr, str(ethernet.EthAddr.random_eth_addr(local=True, group=False))
-            )
-            eth_layer[f"eth.{direction}"] = anon_addr
-            anon_addr_tree = addr_tree_digest(anon_addr, direction)
-            eth_layer[f"eth.{direction}_tree"] = anon_addr_tree
+        randomize_packet_ethernet_addresses(packet, replaced)
 
     return replaced
 
 
+@functools.lru_cache(maxsize=FIELD_CACHE_SIZE)
+def is_ip_addr_field(key):
+    """Return if a field of an ip or ipv6 layer could hold an address."""
+    return bool(IP_ADDR_FIELD.search(key.partition(".")[2]))
+
+
+def address_field(name_field):
+    """Return the field holding the address a host name field names."""
+    for suffix in HOST_NAME_SUFFIXES:
+        if name_field.endswith(suffix):
+            return name_field.removesuffix(suffix)
+    # `ip.host` lists the names of the addresses in `ip.addr`
+    return f"{name_field.removesuffix('.host')}.addr"
+
+
+def replace_ip_value(value, replacement):
+    """Return value with each address replaced, or None if any isn't one."""
+    if isinstance(value, list):
+        replaced = [replace_ip_value(entry, replacement) for entry in value]
+        return None if None in replaced else replaced
+    if not isinstance(value, str):
+        return None
+    return replacement(value)
+
+
+def anonymize_ip_layer(layer, replacement):
+    """
+    Replace (in place) the addresses in an ip or ipv6 layer or its trees.
+    replacement is called with the text of each field value that could be an
+    address, and returns the text to replace it with or None if it isn't an
+    address. Fields naming an address that hold a resolved host name instead
+    (e.g. `ip.src_host`) are set to the replacement of their address, as
+    they would be without name resolution.
+    """
+    if isinstance(layer, list):
+        for entry in layer:
+            anonymize_ip_layer(entry, replacement)
+        return
+    if not isinstance(layer, dict):
+        return
+    host_names = []
+    for key, value in layer.items():
+        if isinstance(value, dict):
+            anonymize_ip_layer(value, replacement)
+        elif is_ip_addr_field(key):
+            replaced = replace_ip_value(value, replacement)
+            if replaced is not None:
+                layer[key] = replaced
+            elif key.endswith((*HOST_NAME_SUFFIXES, ".host")):
+                host_names.append(key)
+    for key in host_names:
+        if address_field(key) in layer:
+            layer[key] = layer[address_field(key)]
+
+
+def anonymize_packet_ip_addresses(packet, replacement):
+    """Replace (in place) the addresses in the ip and ipv6 layers of a packet."""
+    layers = packet["_source"]["layers"]
+    for name in IP_LAYERS:
+        if name in layers:
+            anonymize_ip_layer(layers[name], replacement)
+
+
 def contains_substrings(digest, values):
     """
     Returns if any of values is a substring of the string representation of the
@@ -67,39 +232,263 @@ def contains_substrings(digest, values):
     return any(value in digest_str for value in values)
 
 
+def _head(text, start, chars, max_len):
+    """Return where the run of up to max_len chars before start begins."""
+    head = start
+    while head > max(start - max_len, 0) and text[head - 1] in chars:
+        head -= 1
+    return head
+
+
+def find_ip_addrs(text):
+    """Return list of the strings in text that could be IP addresses.
+
+    Dotted quads that aren't part of longer dotted numbers are found, as are
+    colon runs with a `::` or all eight groups, which rules out ethernet
+    addresses, times of day and hex dumps.
+    """
+    found = []
+    for match in IPV4_TAIL.finditer(text):
+        start = match.start()
+        head = _head(text, start, DIGITS, IPV4_OCTET_DIGITS)
+        if head < start and not (head and text[head - 1] in DOTTED_DIGITS):
+            found.append(text[head : match.end()])
+    for match in IPV6_COLON_RUN.finditer(text):
+        run = match.group().rstrip(".")
+        # most runs are ethernet addresses, times or hex dumps
+        if len(run) > IPV6_ADDR_MAX_LEN or (
+            "::" not in run and run.count(":") != IPV6_FULL_FORM_COLONS
+        ):
+            continue
+        head = _head(text, match.start(), HEX_DIGITS, IPV6_GROUP_DIGITS)
+        if not (head and text[head - 1] in HEX_DIGITS):
+            found.append(text[head : match.start()] + run)
+    return found
+
+
+def scan_text(json_data):
+    """Return the labels and string values of json_data as one text.
+
+    Collectors search it in one go; the separator stops matches that span
+    two strings.
+    """
+    return "\n".join(digest.strings(json_data))
+
+
+class SubstringCollector:
+    """Collect the substrings of a JSON that could be sensitive values.
+
+    Every label and string value is scanned once for matches of pattern, and
+    only the distinct matches are kept. Whether any of a set of values
+    appears in what was scanned is then a set intersection, whatever the
+    number of values.
+
+    With a candidate_len, matches longer than it are runs holding candidates
+    every step characters (e.g. addresses in a hex dump). As a run can hold
+    as many candidates as it has bytes, those are only kept if they are among
+    the values known when the run is scanned.
+
+    With find, a function returning the candidates in a text, it is used
+    instead of a pattern.
+    """
+
+    def __init__(self, pattern=None, candidate_len=None, step=1, find=None):
+        """Initialize with a compiled pattern matching candidates or runs."""
+        self.pattern = pattern
+        self.candidate_len = candidate_len
+        self.step = step
+        self.find = find
+        self.found = set()
+
+    def scan(self, json_data, known=frozenset()):
+        """Add candidates among the labels and string values of json_data."""
+        self.scan_text(scan_text(json_data), known)
+
+    def scan_text(self, text, known=frozenset()):
+        """Add candidates in text, as from scan_text(json_data)."""
+        if self.find:
+            self.found.update(self.find(text))
+            return
+        for match in self.pattern.findall(text):
+            if self.candidate_len is None or len(match) == self.candidate_len:
+                self.found.add(match)
+                continue
+            for start in range(0, len(match) - self.candidate_len + 1, self.step):
+                candidate = match[start : start + self.candidate_len]
+                if candidate in known:
+                    self.found.add(candidate)
+
+    def found_any(self, values):
+        """Return the values that were found while scanning."""
+        return self.found.intersection(values)
+
+
 class ScrubbingException(Exception):
     """Raise if unable to fully anonymize a digest."""
 
 
+class Anonymizer:
+    """Replace ethernet and IP addresses packet by packet, watching for leaks.
+
+    Each packet is scanned for address-like strings right after its addresses
+    are replaced, so the whole digest is only walked once. Addresses that
+    only show up in a later packet's ethernet, ip or ipv6 layer are still
+    caught, as the scan results are compared with all replaced addresses at
+    the end. The exception is an ethernet address inside a longer hex dump,
+    which is only caught once the address has been replaced.
+
+    IP addresses are mapped preserving prefixes (see ipaddr), which maps
+    addresses onto addresses, so a pseudonym can be another original
+    address. Such addresses can't be told apart from leaks and aren't
+    reported.
+
+    Given field rules (see rules), they are applied to each packet once its
+    addresses are replaced, in the same pass.
+    """
+
+    def __init__(self, share_trees=False, key=None, field_rules=None):
+        """Initialize, see randomize_packet_ethernet_addresses for share_trees.
+
+        Without a key, addresses are replaced with random ones. With a key
+        (bytes), replacements are derived from it so they match across runs.
+        field_rules is a rules.RuleTable or a dict of rules.
+        """
+        self.replaced = {}
+        self.share_trees = share_trees
+        self.replacement = keyed_replacement(key) if key else random_replacement
+        self.collector = SubstringCollector(ETH_ADDR_RUN, ETH_ADDR_LEN, HEX_BYTE_STEP)
+        self.replaced_ips = {}
+        self.ip_anonymizer = ipaddr.IpAnonymizer(key)
+        self.ip_collector = SubstringCollector(find=find_ip_addrs)
+        self.rules = (
+            rules.RuleAnonymizer(field_rules, key, self.ip_anonymizer)
+            if field_rules
+            else None
+        )
+
+    def ip_replacement(self, text):
+        """Return the pseudonym of an IP address, or None if text isn't one."""
+        anon_addr = self.replaced_ips.get(text)
+        if anon_addr is None:
+            addr = ipaddr.parse_ip_addr(text)
+            if addr is None:
+                return None
+            anon_addr = self.replaced_ips[text] = self.ip_anonymizer.anonymize(addr)
+        return anon_addr
+
+    def anonymize_packet(self, packet):
+        """Replace (in place) the ethernet and IP addresses of a packet."""
+        randomize_packet_ethernet_addresses(
+            packet, self.replaced, self.share_trees, self.replacement
+        )
+        anonymize_packet_ip_addresses(packet, self.ip_replacement)
+        if self.rules:
+            self.rules.anonymize_packet(packet)
+        text = scan_text(packet)
+        self.collector.scan_text(text, self.replaced)
+        self.ip_collector.scan_text(text)
+
+    def leaked_addresses(self):
+        """Return original addresses seen anywhere in anonymized packets."""
+        originals = self.replaced_ips.keys() - set(self.replaced_ips.values())
+        return self.collector.found_any(self.replaced.keys()) | (
+            self.ip_collector.found_any(originals)
+        )
+
+    def verify(self):
+        """Raise ScrubbingException if any original address remains."""
+        if self.leaked_addresses():
+            raise ScrubbingException
+
+
 def anonymize_digest(digest):
-    """Replace ethernet addresses found in a digest with randomized addresses."""
-    replaced = randomize_ethernet_addresses(digest)
-    if contains_substrings(digest, replaced.keys()):
-        raise ScrubbingException
+    """Replace the ethernet and IP addresses found in a digest with pseudonyms."""
+    anonymizer = Anonymizer()
+    for packet in digest:
+        anonymizer.anonymize_packet(packet)
+    anonymizer.verify()
+
+
+def anonymize_packets(packets, anonymizer):
+    """Return iterable of packets each anonymized as it is reached."""
+    for packet in packets:
+        anonymizer.anonymize_packet(packet)
+        yield packet
 
 
 PARSER = argparse.ArgumentParser(
-    description="Anonymize the ethernet information in a json wireshark digest.",
+    description="Anonymize the addresses in a json wireshark digest.",
+)
+PARSER.add_argument(
+    "input", help="path to digest to anonymize, `-` for stdin", type=pathlib.Path
+)
+PARSER.add_argument(
+    "output", help="path to place anonymized digest, `-` for stdout", type=pathlib.Path
+)
+PARSER.add_argument(
+    "--format",
+    help="layout of the anonymized digest",
+    choices=stream.OUTPUT_FORMATS,
+    default="json",
+)
+PARSER.add_argument(
+    "--key-file",
+    help="file holding a secret key to derive consistent pseudonyms from",
+    type=pathlib.Path,
+)
+PARSER.add_argument(
+    "--rules",
+    help="JSON file of field names or patterns to hash, redact, pseudonymize or drop",
+    type=pathlib.Path,
 )
-PARSER.add_argument("input", help="path to digest to anonymize", type=pathlib.Path)
-PARSER.add_argument("output", help="path to place anonymized digest", type=pathlib.Path)
 
 
-def main(digest_path, output_path):
+def partial_path(output_path):
+    """Return the path a digest is written to until it replaces output_path."""
+    # the suffix is kept last, so the partial digest is compressed the same
+    return output_path.with_name(f"{output_path.stem}.partial{output_path.suffix}")
+
+
+def main(digest_path, output_path, output_format="json", key=None, field_rules=None):
     """
-    Anonymize wireshark digest at digest_path and overwrite.
+    Anonymize wireshark digest at digest_path and write it to output_path.
+    The digest can be in any format stream.read_packets reads.
+    Packets are read, anonymized and written one at a time. Given a key,
+    addresses get the same pseudonyms as in any other digest using that key,
+    and IP addresses keep their common prefixes. field_rules are applied as
+    by Anonymizer.
+    The values of repeated keys are kept, written as lists.
+    The output is written beside output_path and only replaces it once
+    complete, so output_path can be digest_path to anonymize it in place.
     """
-    digest = json.loads(digest_path.read_text())
+    # each packet is written and dropped right after it's anonymized
+    anonymizer = Anonymizer(share_trees=True, key=key, field_rules=field_rules)
+    to_stdout = str(output_path) == stream.STDIO_PATH
+    writing_path = output_path if to_stdout else partial_path(output_path)
     try:
-        anonymize_digest(digest)
+        with (
+            stream.open_digest(digest_path) as digest_file,
+            stream.open_digest(writing_path, "w") as output_file,
+        ):
+            packets = stream.read_packets(
+                digest_file, object_pairs_hook=digest.merge_duplicate_keys
+            )
+            packets = anonymize_packets(packets, anonymizer)
+            stream.write_packets(packets, output_file, output_format)
+    except BaseException:
+        if not to_stdout:
+            writing_path.unlink(missing_ok=True)
+        raise
+    if not to_stdout:
+        writing_path.replace(output_path)
+    try:
+        anonymizer.verify()
     except ScrubbingException:
-        logging.error(
-            "Failed to remove all instances of the original ethernet addresses!"
-        )
-    finally:
-        output_path.write_text(json.dumps(digest, indent=2, ensure_ascii=False))
+        logging.error("Failed to remove all instances of the original addresses!")
 
 
 if __name__ == "__main__":
     args = PARSER.parse_args()
-    main(args.input, args.output)
+    key = args.key_file.read_bytes() if args.key_file else None
+    field_rules = rules.load_rules(args.rules) if args.rules else None
+    main(args.input, args.output, args.format, key, field_rules)
@@ -0,0 +1,359 @@
+"""Anonymize and load many captures or digests into SQLite concurrently.
+
+Each input file is dissected (captures only), anonymized and loaded into its
+own database in a pool of worker processes, with at most a set number of
+tshark processes running at once. Per-file databases record the file they
+were loaded from, so files that are unchanged since are skipped on later
+runs. Optionally, every per-file database is merged into one database as it
+is finished, with a `source` column telling which file each row came from:
+
+    python -m wireshark_digest_to_sqlite.batch captures/ out/ \\
+        --workers 8 --max-tshark 4 --merge all.db --key-file key
+"""
+
+import argparse
+import contextlib
+import glob
+import logging
+import multiprocessing
+import os
+import pathlib
+import shlex
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import (
+    anonymize,
+    compressed,
+    digest,
+    fieldtypes,
+    flows,
+    indexes,
+    ingest,
+    stream,
+    tshark,
+)
+
+CAPTURE_SUFFIXES = (".pcap", ".pcapng", ".cap")
+DIGEST_SUFFIXES = (".json", ".ndjson", ".jsonl", ".ek")
+SOURCE = flows.SOURCE
+SOURCE_DB_ALIAS = "source_db"
+
+# Set in each worker process by _init_worker, bounding running tsharks
+_tshark_slots = None
+
+
+def input_files(patterns):
+    """Return the list of files named by paths, directories or globs.
+
+    Directories give the captures and digests directly in them, digests
+    compressed or not.
+    """
+    files = []
+    for pattern in patterns:
+        path = pathlib.Path(pattern)
+        if path.is_dir():
+            files.extend(
+                sorted(
+                    child
+                    for child in path.iterdir()
+                    if compressed.digest_suffix(child)
+                    in CAPTURE_SUFFIXES + DIGEST_SUFFIXES
+                )
+            )
+        elif glob.has_magic(pattern):
+            files.extend(sorted(map(pathlib.Path, glob.glob(pattern))))
+        else:
+            files.append(path)
+    return files
+
+
+def output_db_path(output_dir, input_path):
+    """Return the path of the database an input file is loaded into."""
+    return output_dir / f"{input_path.name}.db"
+
+
+def remove_db(db_path):
+    """Delete a database along with its write-ahead log files."""
+    for suffix in ["", "-wal", "-shm"]:
+        pathlib.Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+
+def is_loaded(db_path, input_path):
+    """Return if db_path holds all of input_path as it is now."""
+    if not db_path.exists():
+        return False
+    db = sqlite_utils.Database(db_path)
+    fingerprint = ingest.file_fingerprint(input_path)
+    try:
+        return ingest.resume_point(db, input_path, fingerprint) is None
+    except ingest.ChangedSourceFile:
+        return False
+    finally:
+        db.close()
+
+
+def _init_worker(tshark_slots):
+    """Share the semaphore bounding running tsharks with a worker process."""
+    global _tshark_slots  # noqa: PLW0603
+    _tshark_slots = tshark_slots
+
+
+def process_file(input_path, db_path, options):
+    """Anonymize and load one capture or digest into its own database.
+
+    options is a dict that may hold a `key` for pseudonyms, `fields` and
+    `typed` as for ingest.ingest_packets, the `tshark` executable and
+    `tshark_args` to run it with, and whether to `index` the database.
+    Captures are dissected by tshark once one of the worker's tshark slots is
+    free. Return the number of packets loaded, or None if the database was
+    already up to date.
+    """
+    if is_loaded(db_path, input_path):
+        return None
+    # an interrupted load can't resume mid-capture, so start over
+    remove_db(db_path)
+    fingerprint = ingest.file_fingerprint(input_path)
+    anonymizer = anonymize.Anonymizer(share_trees=True, key=options.get("key"))
+    db = sqlite_utils.Database(db_path)
+
+    def load(packets):
+        return ingest.ingest_packets(
+            db,
+            anonymize.anonymize_packets(packets, anonymizer),
+            fields=options.get("fields"),
+            typed=options.get("typed", False),
+        )
+
+    if compressed.digest_suffix(input_path) in DIGEST_SUFFIXES:
+        with stream.open_digest(input_path) as digest_file:
+            loaded = load(
+                stream.read_packets(
+                    digest_file, object_pairs_hook=digest.merge_duplicate_keys
+                )
+            )
+    else:
+        with _tshark_slots or contextlib.nullcontext():
+            loaded = load(
+                tshark.capture_packets(
+                    input_path,
+                    options.get("tshark_args", ()),
+                    tshark=options.get("tshark", tshark.TSHARK),
+                )
+            )
+    anonymizer.verify()
+
+    if options.get("index", True):
+        indexes.create_default_indexes(db)
+        indexes.enable_full_text(db)
+    ingest.ensure_checkpoint_table(db)
+    with db.conn:
+        ingest.write_checkpoint(
+            db, fingerprint, ingest.max_frame_number(db), complete=True
+        )
+    db.close()
+    return loaded
+
+
+def is_merged(db, db_path):
+    """Return if db holds rows merged from the database at db_path."""
+    return any(
+        db.execute(
+            f"SELECT 1 FROM {ingest.quote(table)} WHERE {SOURCE} = ? LIMIT 1",
+            [db_path.name],
+        ).fetchone()
+        for table in ingest.layer_tables(db)
+    )
+
+
+def merge_database(db, db_path):
+    """Copy the layer and flows tables of the database at db_path into db.
+
+    Rows are marked with the name of db_path in a `source` column, and rows
+    from an earlier merge of the same source are replaced. Tables and columns
+    are created as needed, and the kinds of typed fields are added to db's
+    catalog (see fieldtypes.merge_catalog).
+    """
+    source = db_path.name
+    source_db = sqlite_utils.Database(db_path)
+    tables = {
+        table: list(source_db[table].columns_dict)
+        for table in ingest.layer_tables(source_db)
+    }
+    has_flows = source_db[flows.FLOWS_TABLE].exists()
+    catalog = (
+        fieldtypes.read_catalog(source_db)
+        if source_db[fieldtypes.CATALOG_TABLE].exists()
+        else {}
+    )
+    source_db.close()
+
+    db.attach(SOURCE_DB_ALIAS, db_path)
+    try:
+        with db.conn:
+            for table, columns in tables.items():
+                if not db[table].exists():
+                    db.execute(
+                        f"CREATE TABLE {ingest.quote(table)} "
+                        f"({SOURCE} TEXT, {ingest.quote(ingest.FRAME_NUMBER)} INTEGER)"
+                    )
+                    db.execute(
+                        f"CREATE INDEX {ingest.quote(f'idx_{table}_{SOURCE}')} "
+                        f"ON {ingest.quote(table)} "
+                        f"({SOURCE}, {ingest.quote(ingest.FRAME_NUMBER)})"
+                    )
+                known = set(db[table].columns_dict)
+                for column in columns:
+                    if column not in known:
+                        db.execute(
+                            f"ALTER TABLE {ingest.quote(table)} "
+                            f"ADD COLUMN {ingest.quote(column)}"
+                        )
+                db.execute(
+                    f"DELETE FROM {ingest.quote(table)} WHERE {SOURCE} = ?", [source]
+                )
+                column_list = ", ".join(ingest.quote(column) for column in columns)
+                db.execute(
+                    f"INSERT INTO {ingest.quote(table)} ({SOURCE}, {column_list}) "
+                    f"SELECT ?, {column_list} "
+                    f"FROM {SOURCE_DB_ALIAS}.{ingest.quote(table)}",
+                    [source],
+                )
+            if has_flows:
+                flows.ensure_flows_table(db, SOURCE)
+                db.execute(
+                    f"DELETE FROM {flows.FLOWS_TABLE} WHERE {SOURCE} = ?", [source]
+                )
+                column_list = ", ".join(flows.COLUMNS)
+                db.execute(
+                    f"INSERT INTO {flows.FLOWS_TABLE} ({SOURCE}, {column_list}) "
+                    f"SELECT ?, {column_list} "
+                    f"FROM {SOURCE_DB_ALIAS}.{flows.FLOWS_TABLE}",
+                    [source],
+                )
+            if catalog:
+                fieldtypes.merge_catalog(db, catalog)
+    finally:
+        db.execute(f"DETACH DATABASE {SOURCE_DB_ALIAS}")
+
+
+def process_files(
+    input_paths, output_dir, workers=None, max_tshark=None, merge_path=None, **options
+):
+    """Anonymize and load input_paths into per-file databases in output_dir.
+
+    Files are processed by process_file in a pool of worker processes, and
+    at most max_tshark of them dissect captures at once. With merge_path,
+    each per-file database is merged into the database there as soon as it
+    is done. Return the list of input paths that failed.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    db_paths = {path: output_db_path(output_dir, path) for path in input_paths}
+    if len(set(db_paths.values())) < len(db_paths):
+        raise ValueError("Input files must have distinct names.")
+    workers = workers or os.cpu_count()
+    context = multiprocessing.get_context()
+    tshark_slots = context.BoundedSemaphore(max_tshark or workers)
+    merged = sqlite_utils.Database(merge_path) if merge_path else None
+    if merged:
+        ingest.tune_for_bulk_load(merged)
+        # merged rows are merged again as a whole, so it isn't indexed until done
+        options["index"] = False
+
+    failed = []
+    with ProcessPoolExecutor(
+        workers, mp_context=context, initializer=_init_worker, initargs=(tshark_slots,)
+    ) as executor:
+        futures = {
+            executor.submit(process_file, path, db_path, options): path
+            for path, db_path in db_paths.items()
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                loaded = future.result()
+            except Exception:
+                logging.exception("Failed to process %s.", path)
+                failed.append(path)
+                continue
+            if loaded is None:
+                logging.info("Skipping already loaded %s.", path)
+            else:
+                logging.info("Loaded %d packets from %s.", loaded, path)
+            if merged and (loaded is not None or not is_merged(merged, db_paths[path])):
+                merge_database(merged, db_paths[path])
+
+    if merged:
+        indexes.create_default_indexes(merged)
+        indexes.enable_full_text(merged)
+    return failed
+
+
+PARSER = argparse.ArgumentParser(
+    description="Anonymize and load many captures or digests into SQLite.",
+)
+PARSER.add_argument(
+    "inputs",
+    help="captures or digests, directories holding them, or globs",
+    nargs="+",
+)
+PARSER.add_argument(
+    "output_dir", help="directory to place per-file databases", type=pathlib.Path
+)
+PARSER.add_argument(
+    "--workers", help="files processed at once (default: CPU count)", type=int
+)
+PARSER.add_argument(
+    "--max-tshark",
+    help="captures dissected by tshark at once (default: workers)",
+    type=int,
+)
+PARSER.add_argument(
+    "--merge", help="database to merge every file into", type=pathlib.Path
+)
+PARSER.add_argument(
+    "--key-file",
+    help="file holding a secret key to derive consistent pseudonyms from",
+    type=pathlib.Path,
+)
+PARSER.add_argument(
+    "--fields",
+    help="wireshark fields (e.g. `ip.src`) or layers (e.g. `tls`) to load, "
+    "instead of all of them",
+    nargs="+",
+)
+PARSER.add_argument(
+    "--typed",
+    help="store values as integers, reals or bytes by their fields' kinds",
+    action="store_true",
+)
+PARSER.add_argument(
+    "--tshark-args",
+    help="further arguments to tshark, e.g. `-n -2`",
+    type=shlex.split,
+    default=[],
+)
+PARSER.add_argument("--tshark", help="tshark executable", default=tshark.TSHARK)
+
+
+def main(args):
+    """Process the files named by args and return the process exit code."""
+    failed = process_files(
+        input_files(args.inputs),
+        args.output_dir,
+        args.workers,
+        args.max_tshark,
+        args.merge,
+        key=args.key_file.read_bytes() if args.key_file else None,
+        fields=args.fields,
+        typed=args.typed,
+        tshark_args=args.tshark_args,
+        tshark=args.tshark,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(PARSER.parse_args()))
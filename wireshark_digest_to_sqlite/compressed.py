@@ -0,0 +1,197 @@
+"""Read and write gzip or zstd compressed digests in independent blocks.
+
+Digests named `*.gz` or `*.zst` are decompressed as they are read and
+compressed as they are written (see stream.open_digest), so they never
+touch the disk as plain text. zstd needs the optional zstandard package.
+
+Output is compressed in blocks of about BLOCK_BYTES of text, each a whole
+gzip member or zstd frame that begins at a packet. Concatenated members
+and frames are what the gzip and zstd tools produce and read anyway, and a
+run of whole blocks decompresses on its own, so a compressed digest still
+splits into shards for parallel workers (see shard.shard_ranges). Digests
+compressed by other tools are usually a single block, and a single shard.
+"""
+
+import gzip
+import io
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = ".gz"
+ZSTD = ".zst"
+COMPRESSIONS = (GZIP, ZSTD)
+
+BLOCK_BYTES = 1 << 22
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+READ_BYTES = 1 << 20
+# zlib window bits for a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class MissingCompressor(Exception):
+    """Raise when the package for a compression isn't installed."""
+
+
+def compression(path):
+    """Return the compression of the file at path by its suffix, or None."""
+    suffix = path.suffix
+    return suffix if suffix in COMPRESSIONS else None
+
+
+def digest_suffix(path):
+    """Return the suffix of a digest's name before any compression suffix."""
+    return path.with_suffix("").suffix if compression(path) else path.suffix
+
+
+def _zstandard():
+    """Return the zstandard module, which zstd compression needs."""
+    if zstandard is None:
+        raise MissingCompressor(
+            "zstd compressed digests need the zstandard package "
+            "(pip install zstandard)."
+        )
+    return zstandard
+
+
+def _compress(kind, data):
+    """Return data compressed as one gzip member or zstd frame."""
+    if kind == GZIP:
+        # no timestamp, so the same digest always compresses the same
+        return gzip.compress(data, GZIP_LEVEL, mtime=0)
+    return _zstandard().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def _decompressor(kind):
+    """Return a decompression object for one gzip member or zstd frame."""
+    if kind == GZIP:
+        return zlib.decompressobj(GZIP_WBITS)
+    return _zstandard().ZstdDecompressor().decompressobj()
+
+
+class BlockWriter(io.TextIOBase):
+    """Write text to a binary file compressed in blocks of whole packets.
+
+    A block is ended once it holds block_bytes, before the next write that
+    starts a packet (with `{`, as stream.write_packets writes them).
+    """
+
+    def __init__(self, raw_file, kind, block_bytes=BLOCK_BYTES):
+        """Initialize with a binary file to write and its compression."""
+        super().__init__()
+        self.raw_file = raw_file
+        self.kind = kind
+        self.block_bytes = block_bytes
+        self.pending = []
+        self.pending_bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        """Add text to the current block, first ending it if it is full."""
+        if self.pending_bytes >= self.block_bytes and text.startswith("{"):
+            self.end_block()
+        data = text.encode("utf-8")
+        self.pending.append(data)
+        self.pending_bytes += len(data)
+        return len(text)
+
+    def end_block(self):
+        """Compress the pending text into a block of its own."""
+        if self.pending:
+            self.raw_file.write(_compress(self.kind, b"".join(self.pending)))
+        self.pending = []
+        self.pending_bytes = 0
+
+    def close(self):
+        """Write the last block and close the file."""
+        if not self.closed:
+            self.end_block()
+            self.raw_file.close()
+        super().close()
+
+
+def open_text(path, mode="r", block_bytes=BLOCK_BYTES):
+    """Return a text file that decompresses or compresses the file at path.
+
+    Text written is compressed in blocks of about block_bytes.
+    """
+    kind = compression(path)
+    if "w" in mode:
+        if kind == ZSTD:
+            _zstandard()
+        return BlockWriter(path.open("wb"), kind, block_bytes)
+    if kind == GZIP:
+        return gzip.open(path, "rt", encoding="utf-8")
+    reader = (
+        _zstandard()
+        .ZstdDecompressor()
+        .stream_reader(path.open("rb"), read_across_frames=True, closefd=True)
+    )
+    return io.TextIOWrapper(reader, encoding="utf-8")
+
+
+def block_ranges(path):
+    """Return list of (start, end, text bytes) of the blocks of a file.
+
+    start and end are byte offsets in the file. Blocks are found by
+    decompressing the whole file once, keeping none of the text.
+    """
+    kind = compression(path)
+    blocks = []
+    start = text_bytes = 0
+    decompressor = _decompressor(kind)
+    with path.open("rb") as raw_file:
+        data = raw_file.read(READ_BYTES)
+        while data:
+            text_bytes += len(decompressor.decompress(data))
+            data = b""
+            if decompressor.eof:
+                # what is left of the read belongs to the next block
+                data = decompressor.unused_data
+                end = raw_file.tell() - len(data)
+                blocks.append((start, end, text_bytes))
+                start, text_bytes = end, 0
+                decompressor = _decompressor(kind)
+            if not data:
+                data = raw_file.read(READ_BYTES)
+    return blocks
+
+
+def shard_ranges(path, shard_bytes):
+    """Return list of (start, end) byte ranges of runs of whole blocks.
+
+    Each run holds about shard_bytes of text, or a single larger block.
+    """
+    ranges = []
+    run_start = run_bytes = 0
+    for start, end, text_bytes in block_ranges(path):
+        if not run_bytes:
+            run_start = start
+        run_bytes += text_bytes
+        if run_bytes >= shard_bytes:
+            ranges.append((run_start, end))
+            run_bytes = 0
+    if run_bytes:
+        ranges.append((run_start, end))
+    return ranges
+
+
+def read_blocks(path, start, end):
+    """Return the text (bytes) of the whole blocks in [start, end) of a file."""
+    with path.open("rb") as raw_file:
+        raw_file.seek(start)
+        data = raw_file.read(end - start)
+    if compression(path) == GZIP:
+        return gzip.decompress(data)
+    return (
+        _zstandard()
+        .ZstdDecompressor()
+        .stream_reader(io.BytesIO(data), read_across_frames=True)
+        .read()
+    )
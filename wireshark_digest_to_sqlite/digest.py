@@ -1,34 +1,221 @@
 """Provide utility functions for working with deeply nested JSONs."""
 
+import functools
 import itertools
+import operator
+
+RENAME_CACHE_SIZE = 1 << 16
+
+
+def is_leaf(json_data):
+    """Return if json_data is a leaf node (non-dict and non-array, or empty)."""
+    return not (isinstance(json_data, (dict, list)) and json_data)
+
+
+def _path_filter(prune):
+    """Return a function telling if a path is pruned, or None if none are."""
+    prune = tuple(prune)
+    if not prune:
+        return None
+    pruned_trees = tuple(f"{prefix}." for prefix in prune)
+    return lambda path: path in prune or path.startswith(pruned_trees)
+
+
+def _walk_keys(json_data, leaves=False):
+    """Return iterable of (key, value, in_array) for every value below json_data.
+
+    With leaves, give (key, value) for leaf nodes alone. Use an explicit
+    stack of iterators rather than recursion so deep JSONs cost no extra
+    generator frames. This is the traversal of every routine that needs no
+    paths; _walk adds them.
+    """
+    # frames are (iterator, key, in_array); dict iterators give (key, value)
+    # pairs and array entries take the key of their array
+    stack = []
+    if isinstance(json_data, dict):
+        stack.append((iter(json_data.items()), None, False))
+    elif isinstance(json_data, list):
+        stack.append((iter(json_data), None, True))
+
+    while stack:
+        items, array_key, in_array = stack[-1]
+        for item in items:
+            if in_array:
+                key, value = array_key, item
+            else:
+                key, value = item
+            if not leaves:
+                yield key, value, in_array
+            if isinstance(value, str) or not (
+                value and isinstance(value, (dict, list))
+            ):
+                if leaves:
+                    yield key, value
+            elif isinstance(value, dict):
+                stack.append((iter(value.items()), None, False))
+                break
+            else:
+                stack.append((iter(value), key, True))
+                break
+        else:
+            stack.pop()
+
+
+def _walk(json_data, prune=()):
+    """Return iterable of (path, key, value, in_array) below json_data.
+
+    Values are visited as by _walk_keys, each with the dotted path to it.
+    """
+    is_pruned = _path_filter(prune)
+    # frames are (iterator, path, key, in_array) as for _walk_keys
+    stack = []
+    if isinstance(json_data, dict):
+        stack.append((iter(json_data.items()), "", None, False))
+    elif isinstance(json_data, list):
+        stack.append((iter(json_data), "", None, True))
+
+    while stack:
+        items, path, array_key, in_array = stack[-1]
+        for item in items:
+            if in_array:
+                key, value, child_path = array_key, item, path
+            else:
+                key, value = item
+                child_path = f"{path}.{key}" if path else key
+                if is_pruned and is_pruned(child_path):
+                    continue
+            yield child_path, key, value, in_array
+            if isinstance(value, str):
+                continue
+            if isinstance(value, dict):
+                stack.append((iter(value.items()), child_path, None, False))
+                break
+            if isinstance(value, list):
+                stack.append((iter(value), child_path, key, True))
+                break
+        else:
+            stack.pop()
+
+
+def walk(json_data, prune=()):
+    """Return iterable of (dotted_path, key, value) for every value in a JSON.
+
+    Values are visited depth first in document order, each parent before its
+    children. The dotted path joins the keys leading to a value, so it ends in
+    the value's own key. Array entries share the key and path of their array,
+    so repeated fields (e.g. `ip.addr`) are reported under one path.
+
+    Subtrees whose path is in prune, or starts with an entry of prune followed
+    by a `.`, are skipped without being visited.
+    """
+    for path, key, value, _in_array in _walk(json_data, prune=prune):
+        yield path, key, value
+
+
+# Picks the value out of the (key, value) pairs of _walk_keys
+_VALUE = operator.itemgetter(1)
 
 
 def nodes(json_data):
     """Return iterable of all leaf nodes (non-dict and non-array) in a JSON."""
-    to_visit = None
-    if isinstance(json_data, list):
-        to_visit = json_data
-    elif isinstance(json_data, dict):
-        to_visit = json_data.values()
-
-    if to_visit:
-        for value in to_visit:
-            yield from nodes(value)
-    else:
-        yield json_data
+    if is_leaf(json_data):
+        return iter([json_data])
+    return map(_VALUE, _walk_keys(json_data, leaves=True))
 
 
 def labels(json_data):
     """Return iterable of the labels (dictionary keys) at any level in a JSON."""
-    if isinstance(json_data, list):
-        for value in json_data:
-            yield from labels(value)
-    elif isinstance(json_data, dict):
-        for key, value in json_data.items():
+    for key, _value, in_array in _walk_keys(json_data):
+        if not in_array:
             yield key
-            yield from labels(value)
+
+
+def keyed_nodes(json_data):
+    """Return iterable of (key, value) for all leaf nodes in a JSON.
+
+    The key of a leaf in an array is the key of the array.
+    """
+    return _walk_keys(json_data, leaves=True)
+
+
+def strings(json_data):
+    """Return iterable of every label and string leaf node in a JSON."""
+    if isinstance(json_data, str):
+        yield json_data
+    for key, value, in_array in _walk_keys(json_data):
+        if not in_array:
+            yield key
+        if isinstance(value, str):
+            yield value
+
+
+def _keyed_children(json_data, array_key):
+    """Return iterable of (key, value) for the children of a dict or array."""
+    if isinstance(json_data, dict):
+        return iter(json_data.items())
+    return ((array_key, entry) for entry in json_data)
+
+
+def _add_child(container, key, value):
+    """Add value under key to a dict, or append it to an array."""
+    if isinstance(container, dict):
+        container[key] = value
     else:
-        pass
+        container.append(value)
+
+
+def select(json_data, keys):
+    """Return a copy of a JSON holding only the values at keys.
+
+    A value whose key is in keys is kept whole, along with the dicts and
+    arrays leading to it; others are dropped. As for keyed_nodes, array
+    entries share the key of their array. Selected values are not copied.
+    """
+    if is_leaf(json_data):
+        return json_data
+    keys = frozenset(keys)
+    root = type(json_data)()
+    # frames are (children, selected, parent's selected, key in parent)
+    stack = [(_keyed_children(json_data, None), root, None, None)]
+    while stack:
+        children, selected, parent, parent_key = stack[-1]
+        for key, value in children:
+            if key in keys:
+                _add_child(selected, key, value)
+            elif not is_leaf(value):
+                child = type(value)()
+                stack.append((_keyed_children(value, key), child, selected, key))
+                break
+        else:
+            stack.pop()
+            if selected and parent is not None:
+                _add_child(parent, parent_key, selected)
+    return root
+
+
+def merge_duplicate_keys(pairs):
+    """Return a dict of a JSON object's pairs, gathering repeated keys' values.
+
+    tshark can write objects that repeat a key (e.g. one `http.request.line`
+    per header), of which json.loads keeps only the last value. Use this as
+    the `object_pairs_hook` when loading to instead get a list of every value
+    of a repeated key, in order, like `tshark --no-duplicate-keys` writes.
+    Keys keep the position of their first occurrence.
+    """
+    obj = dict(pairs)
+    if len(obj) == len(pairs):
+        return obj
+    obj = {}
+    repeated = set()
+    for key, value in pairs:
+        if key not in obj:
+            obj[key] = value
+        elif key in repeated:
+            obj[key].append(value)
+        else:
+            obj[key] = [obj[key], value]
+            repeated.add(key)
+    return obj
 
 
 def strip_matching_prefix(to_strip, to_match_prefix):
@@ -41,6 +228,41 @@ def strip_matching_prefix(to_strip, to_match_prefix):
     return to_strip.removeprefix(matching_prefix)
 
 
+@functools.lru_cache(maxsize=RENAME_CACHE_SIZE)
+def _renamed(key, prefix, keep_dots):
+    """Return attribute_name(key, prefix, keep_dots), cached."""
+    name = key if keep_dots else key.replace(".", "_")
+    if prefix:
+        name = strip_matching_prefix(name, prefix)
+    return name
+
+
+def attribute_name(key, prefix=None, keep_dots=False):
+    """Return the attribute name promote_named_objects gives a key.
+
+    '.'s are replaced with '_'s unless keep_dots, then any shared prefix with
+    prefix is stripped. Field names come from a small vocabulary, so results
+    are cached across objects and loads; see preload_attribute_names.
+    """
+    # always pass the cache positional arguments so calls share entries
+    return _renamed(key, prefix, keep_dots)
+
+
+def preload_attribute_names(keys, keep_dots=False, strip_prefixes=False):
+    """Cache the attribute names of keys, e.g. from `tshark -G fields`.
+
+    With strip_prefixes, also cache names stripped of the prefix a key gets
+    inside the object of its protocol (the part of the key before the first
+    `.`), as for the layers of a packet.
+    """
+    delimeter = "." if keep_dots else "_"
+    for key in keys:
+        name = attribute_name(key, keep_dots=keep_dots)
+        if strip_prefixes:
+            protocol, _, _ = key.partition(".")
+            attribute_name(name, f"{protocol}{delimeter}", keep_dots=True)
+
+
 class JsonObject:
     """Provide alternative to dict in reading JSON objects.
 
@@ -86,7 +308,8 @@ class JsonObject:
         if val_for_prefix_strip:
             promoted = subclass(
                 {
-                    strip_matching_prefix(key, val_for_prefix_strip): value
+                    # keys were already renamed, so only strip the prefix
+                    attribute_name(key, val_for_prefix_strip, keep_dots=True): value
                     for key, value in self._json_raw.items()
                 }
             )
@@ -118,7 +341,7 @@ def promote_named_objects(obj, object_map, keep_dots=False, strip_prefixes=False
     for key, preprocessed in obj.items():
         promo_cls = object_map.get(key, JsonObject)
         delimeter = "." if keep_dots else "_"
-        new_key = key if keep_dots else key.replace(".", "_")
+        new_key = attribute_name(key, keep_dots=keep_dots)
         strip_key = f"{new_key}{delimeter}" if strip_prefixes else None
         if isinstance(preprocessed, JsonObject):
             reprocessed = preprocessed.promote(promo_cls, strip_key)
@@ -135,3 +358,100 @@ def promote_named_objects(obj, object_map, keep_dots=False, strip_prefixes=False
             reprocessed = preprocessed
         dst_obj[new_key] = reprocessed
     return JsonObject(dst_obj)
+
+
+class JsonView:
+    """Provide attribute access to a JSON object without copying it.
+
+    An alternative to loading with `promote_named_objects` as the object_hook.
+    Load plain dicts and wrap the top-level one (or each packet) in a view. The
+    view keeps only a reference to its dict, and resolves attribute names to
+    keys, with the keep_dots and strip_prefixes renaming of
+    promote_named_objects, the first time an attribute is looked up.
+
+    Nested objects are wrapped in views as they're accessed, as instances of
+    the class object_map gives for their key (JsonView if none). So the cost
+    of renaming and promotion is only paid for objects actually touched.
+    Subclass this for "types" of objects as with JsonObject.
+    """
+
+    __slots__ = ("_json_raw", "_names", "_options", "_prefix")
+
+    def __init__(
+        self,
+        obj_dict,
+        object_map=None,
+        keep_dots=False,
+        strip_prefixes=False,
+        prefix=None,
+    ):
+        """Initialize with a dict to view and the renaming options to use.
+
+        prefix is what to strip from this object's keys, which views make
+        from their parent's key when strip_prefixes is set.
+        """
+        self._json_raw = obj_dict
+        self._options = (object_map or {}, keep_dots, strip_prefixes)
+        self._prefix = prefix
+        self._names = None
+
+    def _attribute_names(self):
+        """Return the mapping of attribute names to keys, made on first use."""
+        if self._names is None:
+            _object_map, keep_dots, _strip_prefixes = self._options
+            self._names = {
+                attribute_name(key, self._prefix, keep_dots): key
+                for key in self._json_raw
+            }
+        return self._names
+
+    def _wrap(self, key, value):
+        """Return value, with objects in it viewed as promoted for key."""
+        if isinstance(value, list):
+            return [self._wrap(key, entry) for entry in value]
+        if not isinstance(value, dict):
+            return value
+        object_map, keep_dots, strip_prefixes = self._options
+        view_cls = object_map.get(key, JsonView)
+        prefix = None
+        if strip_prefixes:
+            delimiter = "." if keep_dots else "_"
+            prefix = f"{attribute_name(key, keep_dots=keep_dots)}{delimiter}"
+        view = view_cls.__new__(view_cls)
+        JsonView.__init__(view, value, *self._options, prefix=prefix)
+        return view
+
+    def __getattr__(self, name):
+        """Return the value for the key that name resolves to."""
+        if name.startswith("_") and name in JsonView.__slots__:
+            raise AttributeError(name)
+        try:
+            key = self._attribute_names()[name]
+        except KeyError:
+            raise AttributeError(
+                f"`{type(self).__name__}` has no attribute `{name}`."
+            ) from None
+        return self._wrap(key, self._json_raw[key])
+
+    def __dir__(self):
+        """Return attribute names, including those resolved from keys."""
+        return [*super().__dir__(), *self._attribute_names()]
+
+    def __repr__(self):
+        """Return a string with the defining key/value pairs."""
+        item_descriptions = (
+            f"{name}={getattr(self, name)}" for name in self._attribute_names()
+        )
+        return f"{type(self).__name__}({', '.join(item_descriptions)})"
+
+    def __eq__(self, other):
+        """Return if self views the same key/value pairs as other."""
+        return self._json_raw == other._json_raw
+
+    __hash__ = None
+
+    def promote(self, subclass):
+        """Return a view of the same object as an instance of subclass."""
+        promoted = subclass.__new__(subclass)
+        JsonView.__init__(promoted, self._json_raw, *self._options, self._prefix)
+        return promoted
@@ -0,0 +1,108 @@
+"""Normalize `tshark -T ek` output into the packet shape of `tshark -T json`.
+
+ek output is newline delimited JSON meant for bulk loading into
+Elasticsearch. Each packet is an `index` action line, then a document line
+whose `layers` hold each protocol's fields flat, with names like
+`ip_ip_src`. Values may be JSON numbers or booleans where `-T json` would
+write strings.
+
+Names made by replacing a field name's `.`s with `_`s can't always be
+reversed. Given the field names tshark knows (see tshark.glossary_field_names)
+they are mapped back exactly; otherwise only the `.` after the protocol is
+restored, so `tcp_tcp_flags_ack` becomes `tcp.flags_ack`.
+"""
+
+import functools
+
+from wireshark_digest_to_sqlite import digest
+
+FIELD_NAME_CACHE_SIZE = 1 << 16
+
+
+def is_index_line(document):
+    """Return if a decoded ek line is an index action rather than a packet."""
+    return isinstance(document, dict) and "index" in document and len(document) == 1
+
+
+def is_ek_document(document):
+    """Return if a decoded JSON value is an ek packet document."""
+    return isinstance(document, dict) and "layers" in document
+
+
+def ek_field_names(field_names):
+    """Return a dict of field names by their form with `_`s for `.`s."""
+    return {name.replace(".", "_"): name for name in field_names}
+
+
+def _prefix(layer_name):
+    """Return the prefix of the ek names of fields in a layer."""
+    return f"{layer_name.replace('.', '_')}_"
+
+
+@functools.lru_cache(maxsize=FIELD_NAME_CACHE_SIZE)
+def _field_name(ek_name, layer_name):
+    """Return the field name for an ek name without knowing the field names."""
+    field = ek_name.removeprefix(_prefix(layer_name))
+    protocol, _, rest = field.partition("_")
+    if protocol and rest and _prefix(layer_name).startswith(f"{protocol}_"):
+        return f"{protocol}.{rest}"
+    return field
+
+
+def field_name(ek_name, layer_name, known_names=None):
+    """Return the field name an ek name stands for in a layer.
+
+    ek names are a field name prefixed with the layer name, with `_`s for
+    `.`s. known_names is a dict as from ek_field_names. Names that
+    are already dotted are left as they are.
+    """
+    if "." in ek_name:
+        return ek_name
+    if known_names:
+        name = known_names.get(ek_name.removeprefix(_prefix(layer_name)))
+        if name:
+            return name
+    return _field_name(ek_name, layer_name)
+
+
+def json_value(value):
+    """Return an ek value as `tshark -T json` would write it."""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, list):
+        return [json_value(entry) for entry in value]
+    return value
+
+
+def normalize_layer(layer_name, layer, known_names=None):
+    """Return an ek layer with json field names and values."""
+    if isinstance(layer, list):
+        return [normalize_layer(layer_name, entry, known_names) for entry in layer]
+    if not isinstance(layer, dict):
+        return json_value(layer)
+    return digest.merge_duplicate_keys(
+        [
+            (field_name(name, layer_name, known_names), json_value(value))
+            for name, value in layer.items()
+        ]
+    )
+
+
+def normalize_packet(document, index=None, known_names=None):
+    """Return a packet in the `tshark -T json` shape from an ek document.
+
+    index is the index action line that preceded the document, if any.
+    """
+    action = (index or {}).get("index", {})
+    layers = {
+        name: normalize_layer(name, layer, known_names)
+        for name, layer in document["layers"].items()
+    }
+    return {
+        "_index": action.get("_index"),
+        "_type": action.get("_type", "doc"),
+        "_score": None,
+        "_source": {"layers": layers},
+    }
@@ -1,6 +1,9 @@
 """Provide capabilities to parse ethernet addresses and generate random ones
 to specification."""
 
+import functools
+import hashlib
+import hmac
 import re
 import secrets
 
@@ -36,10 +39,13 @@ class UnrecognizedEthernetAddressFormat(Exception):
 
 
 class EthAddr:
+    __slots__ = ("human_friendly_form", "normalized")
+
     OUI_BYTES = 3
     LOCAL_MASK = 0x01
     GROUP_MASK = 0x02
     ETH_ADDR_BYTE_LEN = 6
+    COLON_FORM_LEN = 3 * ETH_ADDR_BYTE_LEN - 1
 
     HEX_ETH_ADDR_FORMATS = tuple(
         re.compile(
@@ -61,6 +67,22 @@ class EthAddr:
     )
 
     def __init__(self, human_friendly_form):
+        # fast path for the `:` format that wireshark uses
+        if (
+            len(human_friendly_form) == self.COLON_FORM_LEN
+            and human_friendly_form[2::3] == ":::::"
+        ):
+            try:
+                normalized = bytes.fromhex(human_friendly_form.replace(":", ""))
+            except ValueError:
+                pass
+            else:
+                # fromhex skips whitespace, which would make for fewer bytes
+                if len(normalized) == self.ETH_ADDR_BYTE_LEN:
+                    self.normalized = normalized
+                    self.human_friendly_form = human_friendly_form
+                    return
+
         match_attempts = [
             addr_format.match(human_friendly_form)
             for addr_format in self.HEX_ETH_ADDR_FORMATS
@@ -126,6 +148,34 @@ class EthAddr:
         addr = first_byte + secrets.token_bytes(cls.ETH_ADDR_BYTE_LEN - 1)
         return cls(addr.hex(":"))
 
+    @classmethod
+    def keyed_eth_addr(cls, key, data, local=False, group=False):
+        """
+        Derive an ethernet address in colon-separated hex notation from an
+        HMAC-SHA256 of data (bytes) under key (bytes). The same key and data
+        always give the same address. Arguments set if the address is local
+        or not and group or unicast.
+        """
+        digest = hmac.digest(key, data, hashlib.sha256)
+        first_byte = set_mask_bits(digest[0], cls.LOCAL_MASK, local)
+        first_byte = set_mask_bits(first_byte, cls.GROUP_MASK, group)
+
+        addr = bytes([first_byte]) + digest[1 : cls.ETH_ADDR_BYTE_LEN]
+        return cls(addr.hex(":"))
+
     def __repr__(self):
         """Return the human readable form of an ethernet address."""
         return self.human_friendly_form
+
+
+PARSE_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_eth_addr(human_friendly_form):
+    """
+    Return an EthAddr for human_friendly_form, reusing the EthAddr from an
+    earlier call with the same text. Captures repeat a small set of addresses
+    many times, so most calls skip parsing. Treat the result as read-only.
+    """
+    return EthAddr(human_friendly_form)
@@ -0,0 +1,176 @@
+"""Infer how to store the values of wireshark fields in SQLite.
+
+tshark writes every field value as a string, even ports, lengths and epochs.
+The kind of a field is inferred from a sample of its values, and values are
+stored as INTEGER, REAL or BLOB (ethernet and IP addresses as their bytes)
+accordingly. Values that don't fit their field's kind are stored as they are,
+and columns are left without a declared type so SQLite never converts them,
+so nothing is lost when a sample misleads.
+
+The kind chosen for each field is recorded in a catalog table.
+"""
+
+import ipaddress
+import itertools
+import json
+import re
+
+from wireshark_digest_to_sqlite import ethernet
+
+INTEGER = "INTEGER"
+REAL = "REAL"
+MAC = "MAC"
+IP = "IP"
+TEXT = "TEXT"
+
+CATALOG_TABLE = "_field_types"
+SAMPLE_SIZE = 100
+
+# No leading zeros, so the text of an integer comes back from it unchanged
+DECIMAL_INTEGER = re.compile(r"-?(?:0|[1-9][0-9]*)")
+DECIMAL_REAL = re.compile(r"-?[0-9]+\.[0-9]+")
+SQLITE_INTEGER_BITS = 64
+
+
+def _integer(value):
+    """Return value as an int, or None if it isn't a decimal SQLite integer."""
+    if not DECIMAL_INTEGER.fullmatch(value):
+        return None
+    number = int(value)
+    if number.bit_length() >= SQLITE_INTEGER_BITS:
+        return None
+    return number
+
+
+def _eth_addr(value):
+    """Return the bytes of a `:` separated ethernet address, or None."""
+    if len(value) != ethernet.EthAddr.COLON_FORM_LEN or value[2::3] != ":::::":
+        return None
+    try:
+        return ethernet.parse_eth_addr(value).normalized
+    except (ethernet.UnrecognizedEthernetAddressFormat, ValueError):
+        return None
+
+
+def _ip_addr(value):
+    """Return the packed bytes of an IPv4 or IPv6 address, or None."""
+    try:
+        return ipaddress.ip_address(value).packed
+    except ValueError:
+        return None
+
+
+def value_kind(value):
+    """Return the narrowest kind that can hold a field value."""
+    if not isinstance(value, str):
+        return TEXT
+    if _integer(value) is not None:
+        return INTEGER
+    if DECIMAL_REAL.fullmatch(value):
+        return REAL
+    if _eth_addr(value) is not None:
+        return MAC
+    if _ip_addr(value) is not None:
+        return IP
+    return TEXT
+
+
+def infer_kind(values, sample_size=SAMPLE_SIZE):
+    """Return the kind of a field from a sample of its values.
+
+    Repeated fields are sampled by their entries. Integers mixed with reals
+    are REAL, and any other mix of kinds is TEXT.
+    """
+    entries = (
+        entry
+        for value in values
+        if value is not None
+        for entry in (value if isinstance(value, list) else [value])
+    )
+    return widest_kind(
+        value_kind(entry) for entry in itertools.islice(entries, sample_size)
+    )
+
+
+def widest_kind(kinds):
+    """Return the kind that can hold values of all of kinds, TEXT for none."""
+    kinds = set(kinds)
+    if len(kinds) == 1:
+        return kinds.pop()
+    if kinds == {INTEGER, REAL}:
+        return REAL
+    return TEXT
+
+
+def _convert_scalar(value, kind):
+    """Return a single value stored as kind, or unchanged if it doesn't fit."""
+    if not isinstance(value, str):
+        return value
+    if kind == INTEGER:
+        converted = _integer(value)
+    elif kind == REAL:
+        is_number = DECIMAL_REAL.fullmatch(value) or DECIMAL_INTEGER.fullmatch(value)
+        converted = float(value) if is_number else None
+    elif kind == MAC:
+        converted = _eth_addr(value)
+    elif kind == IP:
+        converted = _ip_addr(value)
+    else:
+        converted = None
+    return value if converted is None else converted
+
+
+def to_sqlite_value(value, kind=TEXT):
+    """Return value in the form SQLite stores for kind.
+
+    Repeated fields are stored as JSON arrays, of numbers for numeric kinds
+    and of the original strings otherwise.
+    """
+    if isinstance(value, list):
+        if kind in (INTEGER, REAL):
+            value = [_convert_scalar(entry, kind) for entry in value]
+        return json.dumps(value, ensure_ascii=False)
+    return _convert_scalar(value, kind)
+
+
+def ensure_catalog_table(db):
+    """Create the field type catalog table if db doesn't have one."""
+    db.execute(
+        f"CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} ("
+        "table_name TEXT, field TEXT, kind TEXT, PRIMARY KEY (table_name, field))"
+    )
+
+
+def read_catalog(db):
+    """Return a dict of table name to a dict of field to kind."""
+    ensure_catalog_table(db)
+    catalog = {}
+    for table, field, kind in db.execute(
+        f"SELECT table_name, field, kind FROM {CATALOG_TABLE}"
+    ):
+        catalog.setdefault(table, {})[field] = kind
+    return catalog
+
+
+def write_catalog(db, table, kinds):
+    """Record the kinds of fields (a dict of field to kind) of table."""
+    db.conn.executemany(
+        f"INSERT OR REPLACE INTO {CATALOG_TABLE} (table_name, field, kind) "
+        "VALUES (?, ?, ?)",
+        [(table, field, kind) for field, kind in kinds.items()],
+    )
+
+
+def merge_catalog(db, catalog):
+    """Add the kinds of a catalog to db's, widening fields of two kinds."""
+    recorded = read_catalog(db)
+    for table, kinds in catalog.items():
+        known = recorded.get(table, {})
+        write_catalog(
+            db,
+            table,
+            {
+                field: widest_kind({kind, known.get(field, kind)})
+                for field, kind in kinds.items()
+            },
+        )
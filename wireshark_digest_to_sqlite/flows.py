@@ -0,0 +1,201 @@
+"""Aggregate packets into TCP and UDP conversations while they are loaded.
+
+Packets are grouped by their `tcp.stream` or `udp.stream` index into flows,
+and the packets, bytes, first and last times and frames, endpoints and TLS
+server name of each flow are summed up in a `flows` table:
+
+    SELECT server_name, sum(bytes) FROM flows GROUP BY server_name
+
+Totals are accumulated in memory for the packets of a batch, then added to
+the table in the same transaction as the batch's rows, so flows stay in step
+with the layer tables when a load is resumed.
+"""
+
+FLOWS_TABLE = "flows"
+# Column telling which file a flow is from, where a database holds several
+SOURCE = "source"
+STREAM_FIELDS = {"tcp": "tcp.stream", "udp": "udp.stream"}
+SERVER_NAME_FIELD = "tls.handshake.extensions_server_name"
+# Fields flows are made from, which must be loaded when only some are
+FLOW_FIELDS = (
+    *STREAM_FIELDS.values(),
+    "frame.len",
+    "frame.time_epoch",
+    "ip.src",
+    "ip.dst",
+    "ipv6.src",
+    "ipv6.dst",
+    "tcp.srcport",
+    "tcp.dstport",
+    "udp.srcport",
+    "udp.dstport",
+    SERVER_NAME_FIELD,
+)
+
+COLUMNS = {
+    "protocol": "TEXT",
+    "stream": "INTEGER",
+    "src_addr": "TEXT",
+    "src_port": "INTEGER",
+    "dst_addr": "TEXT",
+    "dst_port": "INTEGER",
+    "server_name": "TEXT",
+    "packets": "INTEGER",
+    "bytes": "INTEGER",
+    "first_time": "REAL",
+    "last_time": "REAL",
+    "first_frame": "INTEGER",
+    "last_frame": "INTEGER",
+}
+
+# How the totals of a batch are added to a flow's row from earlier batches.
+# Unqualified columns are the row's, `excluded` ones the batch's.
+MERGED_COLUMNS = {
+    "src_addr": "coalesce(src_addr, excluded.src_addr)",
+    "src_port": "coalesce(src_port, excluded.src_port)",
+    "dst_addr": "coalesce(dst_addr, excluded.dst_addr)",
+    "dst_port": "coalesce(dst_port, excluded.dst_port)",
+    "server_name": "coalesce(server_name, excluded.server_name)",
+    "packets": "packets + excluded.packets",
+    "bytes": "bytes + excluded.bytes",
+    "first_time": (
+        "coalesce(min(first_time, excluded.first_time), first_time, "
+        "excluded.first_time)"
+    ),
+    "last_time": (
+        "coalesce(max(last_time, excluded.last_time), last_time, excluded.last_time)"
+    ),
+    "first_frame": "min(first_frame, excluded.first_frame)",
+    "last_frame": "max(last_frame, excluded.last_frame)",
+}
+
+
+def first(value):
+    """Return the first of a repeated field's values, or a single value."""
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def to_number(value, convert):
+    """Return a field value converted by int or float, or None if it can't be."""
+    try:
+        return convert(first(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def flow_key(flattened):
+    """Return (protocol, stream index) of a flattened packet, or None.
+
+    Packets with both are in TCP flows.
+    """
+    for protocol, field in STREAM_FIELDS.items():
+        stream = to_number(flattened.get(protocol, {}).get(field), int)
+        if stream is not None:
+            return protocol, stream
+    return None
+
+
+def endpoints(flattened, protocol):
+    """Return (source address, port, destination address, port) of a packet."""
+    ip = flattened.get("ip") or {}
+    ipv6 = flattened.get("ipv6") or {}
+    transport = flattened.get(protocol, {})
+    return (
+        first(ip.get("ip.src") or ipv6.get("ipv6.src")),
+        to_number(transport.get(f"{protocol}.srcport"), int),
+        first(ip.get("ip.dst") or ipv6.get("ipv6.dst")),
+        to_number(transport.get(f"{protocol}.dstport"), int),
+    )
+
+
+def ensure_flows_table(db, source_column=None):
+    """Create the flows table if db doesn't have one.
+
+    With source_column, flows are also keyed by the file they are from.
+    """
+    columns = {source_column: "TEXT", **COLUMNS} if source_column else COLUMNS
+    key = [source_column] if source_column else []
+    column_list = ", ".join(f"{column} {kind}" for column, kind in columns.items())
+    db.execute(
+        f"CREATE TABLE IF NOT EXISTS {FLOWS_TABLE} "
+        f"({column_list}, PRIMARY KEY ({', '.join([*key, 'protocol', 'stream'])}))"
+    )
+
+
+class FlowAggregator:
+    """Sum up flattened packets into flows and add the totals to a database.
+
+    The endpoints of a flow are those of its first packet, so the source is
+    usually the client. Given the source file of the packets, flows are
+    keyed by it too, since stream indexes start over in each file.
+    """
+
+    def __init__(self, source=None):
+        """Initialize with no pending flows."""
+        self.source = source
+        self.pending = {}
+
+    def add(self, number, flattened):
+        """Add a flattened packet with frame number to the totals of its flow."""
+        key = flow_key(flattened)
+        if key is None:
+            return
+        frame = flattened.get("frame", {})
+        time = to_number(frame.get("frame.time_epoch"), float)
+        flow = self.pending.get(key)
+        if flow is None:
+            src_addr, src_port, dst_addr, dst_port = endpoints(flattened, key[0])
+            flow = self.pending[key] = {
+                "protocol": key[0],
+                "stream": key[1],
+                "src_addr": src_addr,
+                "src_port": src_port,
+                "dst_addr": dst_addr,
+                "dst_port": dst_port,
+                "server_name": None,
+                "packets": 0,
+                "bytes": 0,
+                "first_time": time,
+                "last_time": time,
+                "first_frame": number,
+                "last_frame": number,
+            }
+        flow["packets"] += 1
+        flow["bytes"] += to_number(frame.get("frame.len"), int) or 0
+        if time is not None and flow["first_time"] is not None:
+            flow["first_time"] = min(flow["first_time"], time)
+            flow["last_time"] = max(flow["last_time"], time)
+        elif time is not None:
+            flow["first_time"] = flow["last_time"] = time
+        flow["first_frame"] = min(flow["first_frame"], number)
+        flow["last_frame"] = max(flow["last_frame"], number)
+        if flow["server_name"] is None:
+            tls = flattened.get("tls", {})
+            flow["server_name"] = first(tls.get(SERVER_NAME_FIELD))
+
+    def write(self, db):
+        """Add the pending totals to the flows table of db and clear them.
+
+        Run inside the transaction that writes the packets they are from.
+        """
+        if not self.pending:
+            return
+        key = [SOURCE] if self.source else []
+        ensure_flows_table(db, SOURCE if self.source else None)
+        columns = [*key, *COLUMNS]
+        updates = ", ".join(
+            f"{column} = {merged}" for column, merged in MERGED_COLUMNS.items()
+        )
+        db.conn.executemany(
+            f"INSERT INTO {FLOWS_TABLE} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT ({', '.join([*key, 'protocol', 'stream'])}) "
+            f"DO UPDATE SET {updates}",
+            [
+                (*[self.source] * len(key), *(flow[column] for column in COLUMNS))
+                for flow in self.pending.values()
+            ],
+        )
+        self.pending = {}
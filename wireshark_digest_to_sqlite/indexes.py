@@ -0,0 +1,193 @@
+"""Index a SQLite database of wireshark digests for the queries run on it.
+
+Indexes slow down inserts, so they are made once a load is done: defaults for
+the fields most often filtered on, full-text search over text-heavy fields,
+and covering indexes recommended from the plans of given queries.
+
+    python -m wireshark_digest_to_sqlite.indexes capture.db \\
+        --query 'SELECT "tcp.len" FROM tcp WHERE "tcp.stream" = 4' --create
+"""
+
+import argparse
+import logging
+import pathlib
+import re
+
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import ingest
+
+# `ip.addr` holds both addresses of a packet as one JSON array, so filters on
+# it are served by indexes on the source and destination instead.
+DEFAULT_INDEXED_FIELDS = (
+    "tcp.stream",
+    "ip.src",
+    "ip.dst",
+    "frame.time_epoch",
+    "tls.handshake.extensions_server_name",
+)
+FULL_TEXT_FIELDS = ("http.request.line",)
+
+# Plan details of a table read that uses no index, e.g. `SCAN tcp`
+FULL_SCAN = re.compile(r"^SCAN (\S+)$")
+WHERE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+
+
+def index_name(table, columns):
+    """Return the name given to an index of columns of table."""
+    return "_".join(["idx", table, *columns])
+
+
+def tables_with_column(db, column):
+    """Return the names of the layer tables in db that have column."""
+    return [
+        table for table in ingest.layer_tables(db) if column in db[table].columns_dict
+    ]
+
+
+def create_default_indexes(db, fields=DEFAULT_INDEXED_FIELDS):
+    """Index fields in every layer table that has them, then ANALYZE.
+
+    Return the names of the indexes created.
+    """
+    created = []
+    for field in fields:
+        for table in tables_with_column(db, field):
+            name = index_name(table, [field])
+            if name not in {index.name for index in db[table].indexes}:
+                db[table].create_index([field], name, if_not_exists=True)
+                created.append(name)
+    if created:
+        db.analyze()
+    return created
+
+
+def enable_full_text(db, fields=FULL_TEXT_FIELDS):
+    """Build FTS5 tables over fields in every layer table that has them.
+
+    The FTS table of a layer (e.g. `http_fts`) is rebuilt if it exists, so it
+    covers rows loaded since. Search it with `db[table].search(...)` or
+    `MATCH`. Return the names of the tables indexed.
+    """
+    indexed = []
+    for table in {table for field in fields for table in tables_with_column(db, field)}:
+        columns = [field for field in fields if field in db[table].columns_dict]
+        if db[table].detect_fts():
+            db[table].rebuild_fts()
+        else:
+            db[table].enable_fts(columns, fts_version="FTS5")
+        indexed.append(table)
+    return sorted(indexed)
+
+
+def mentioned_columns(text, columns):
+    """Return the names in columns found in text, in order of appearance."""
+    found = {}
+    for column in columns:
+        # dotted field names must be quoted to be used as SQL identifiers
+        match = re.search(rf'"{re.escape(column)}"|\b{re.escape(column)}\b', text)
+        if match:
+            found[column] = match.start()
+    return sorted(found, key=found.get)
+
+
+def referenced_columns(query, columns):
+    """Return the names in columns that query mentions, filtered ones first.
+
+    Columns mentioned after the query's WHERE come first, in the order they
+    appear, then columns only selected or ordered by.
+    """
+    parts = WHERE.split(query, maxsplit=1)
+    filtered = mentioned_columns(parts[1] if len(parts) > 1 else "", columns)
+    return [
+        *filtered,
+        *(
+            column
+            for column in mentioned_columns(query, columns)
+            if column not in filtered
+        ),
+    ]
+
+
+def recommend_indexes(db, queries):
+    """Return list of (table, columns) covering indexes that queries lack.
+
+    Each query's plan is checked for tables read with a full scan. The index
+    recommended for such a table leads with the columns the query filters on
+    and includes every other column of the table it uses, so the query can
+    be answered from the index alone.
+    """
+    recommended = []
+    for query in queries:
+        plan = db.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+        for *_ids, detail in plan:
+            match = FULL_SCAN.match(detail)
+            if not match or match[1] not in db.table_names():
+                continue
+            table = match[1]
+            # unless keyed by source too, the frame number is the rowid,
+            # which every index holds
+            rowid = (
+                [ingest.FRAME_NUMBER] if db[table].pks == [ingest.FRAME_NUMBER] else []
+            )
+            columns = [
+                column
+                for column in referenced_columns(query, db[table].columns_dict)
+                if column not in rowid
+            ]
+            if columns and (table, columns) not in recommended:
+                recommended.append((table, columns))
+    return recommended
+
+
+def create_indexes(db, recommended):
+    """Create recommended (table, columns) indexes, then ANALYZE."""
+    for table, columns in recommended:
+        db[table].create_index(columns, index_name(table, columns), if_not_exists=True)
+    db.analyze()
+
+
+def index_statement(table, columns):
+    """Return the CREATE INDEX statement for an index of columns of table."""
+    column_list = ", ".join(ingest.quote(column) for column in columns)
+    return (
+        f"CREATE INDEX {ingest.quote(index_name(table, columns))} "
+        f"ON {ingest.quote(table)} ({column_list});"
+    )
+
+
+PARSER = argparse.ArgumentParser(
+    description="Index a SQLite database of wireshark digests.",
+)
+PARSER.add_argument("database", help="path to SQLite database", type=pathlib.Path)
+PARSER.add_argument(
+    "--query",
+    help="query to recommend covering indexes for, may be repeated",
+    action="append",
+    default=[],
+)
+PARSER.add_argument(
+    "--create",
+    help="create the recommended indexes instead of printing them",
+    action="store_true",
+)
+
+
+def main(db_path, queries, create=False):
+    """Create default indexes in db_path and recommend ones for queries."""
+    db = sqlite_utils.Database(db_path)
+    created = create_default_indexes(db)
+    full_text = enable_full_text(db)
+    logging.info("Created indexes %s and full-text search on %s.", created, full_text)
+
+    recommended = recommend_indexes(db, queries)
+    if create:
+        create_indexes(db, recommended)
+    else:
+        for table, columns in recommended:
+            print(index_statement(table, columns))
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+    main(args.database, args.query, args.create)
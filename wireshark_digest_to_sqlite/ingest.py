@@ -0,0 +1,649 @@
+"""Load the packets of a json wireshark digest into a SQLite database.
+
+Each protocol layer of a packet (`frame`, `eth`, `ip`, `tcp`, ...) becomes a
+row in a table named after the layer. The nested trees of a layer are
+flattened into columns named by their wireshark field names, and every row is
+keyed by the frame number of its packet, and by its source file when
+loaded from one, so a database can hold many files (e.g. a ring buffer's),
+each numbering its frames from 1. Leaves keyed by text labels rather
+than field names (e.g. the lines of an HTTP body) are gathered into a JSON
+`_labels` column, so a capture's text can't add columns without bound. TCP
+and UDP conversations are summed up into a `flows` table as packets are
+loaded (see flows).
+
+Progress through each source file is recorded in a checkpoint table in the
+same transactions that write its packets, so an interrupted load resumes
+after the last committed frame and a finished file is skipped until it grows.
+"""
+
+import argparse
+import collections
+import functools
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import (
+    digest,
+    fieldtypes,
+    flows,
+    indexes,
+    shard,
+    stream,
+)
+
+FRAME_NUMBER = "frame_number"
+SOURCE = flows.SOURCE
+LABELS = "_labels"
+# Wireshark field names (e.g. `ip.flags.df`, `_ws.expert.message`), unlike
+# labels such as `GET / HTTP/1.1\r\n` or the lines of a text body
+FIELD_NAME = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.\-]*")
+FIELD_NAME_CACHE_SIZE = 1 << 16
+BATCH_SIZE = 20_000
+CHECKPOINT_TABLE = "_checkpoints"
+# Hash only the head of a file to recognize it; hashing all of a file that
+# is only being appended to would cost as much I/O as reloading it. The
+# length hashed is checkpointed, so a file shorter than this that grows
+# is recognized by the same bytes.
+HASHED_HEAD_BYTES = 1 << 20
+# Memory a parallel load may hold in shards being decoded or waiting to be
+# written. Flattened rows take about FLATTENED_GROWTH times the digest
+# text they come from, and shards aren't made smaller than MIN_SHARD_BYTES.
+PARALLEL_MEMORY_BYTES = 1 << 30
+FLATTENED_GROWTH = 3
+MIN_SHARD_BYTES = 1 << 20
+
+# Trade durability of an interrupted load for insert speed.
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "cache_size": -256_000,  # negative values are in KiB
+}
+
+
+def quote(identifier):
+    """Return identifier quoted for use as a SQLite table or column name."""
+    escaped = identifier.replace('"', '""')
+    return f'"{escaped}"'
+
+
+def leaf_items(json_data, key=None):
+    """Return iterable of (key, value) for each leaf node in a JSON.
+
+    The key of a leaf is the label of the dictionary holding it, or of the
+    nearest dictionary enclosing its array.
+    """
+    return (
+        (label, value)
+        for label, value in digest.keyed_nodes({key: json_data})
+        # empty dicts and arrays hold no fields
+        if not isinstance(value, (dict, list))
+    )
+
+
+@functools.lru_cache(maxsize=FIELD_NAME_CACHE_SIZE)
+def is_field_name(key):
+    """Return if a key is a wireshark field name rather than a text label."""
+    return FIELD_NAME.fullmatch(key) is not None
+
+
+def _add_value(row, key, value):
+    """Add value under key, gathering values of a repeated key into a list."""
+    if key not in row:
+        row[key] = value
+    elif isinstance(row[key], list):
+        row[key].append(value)
+    else:
+        row[key] = [row[key], value]
+
+
+def flatten_layer(name, layer):
+    """Return a dict of field name to value for every leaf in a layer.
+
+    Wireshark field names are fully qualified (e.g. `ip.flags.df`), so the
+    tree a leaf sits in is dropped. Fields that occur more than once in the
+    layer are gathered into a list. Leaves keyed by labels are gathered the
+    same way into a JSON object of label to value under LABELS.
+    """
+    row = {}
+    labels = {}
+    for key, value in leaf_items(layer, name):
+        _add_value(row if is_field_name(key) else labels, key, value)
+    if labels:
+        row[LABELS] = json.dumps(labels, ensure_ascii=False)
+    return row
+
+
+def frame_number(packet):
+    """Return the frame number of a packet, or None if it has none."""
+    frame = packet["_source"]["layers"].get("frame")
+    if isinstance(frame, dict) and "frame.number" in frame:
+        return int(frame["frame.number"])
+    return None
+
+
+def flatten_packet(packet):
+    """Return a dict of layer name to flattened layer for a packet."""
+    return {
+        name: flatten_layer(name, layer)
+        for name, layer in packet["_source"]["layers"].items()
+    }
+
+
+def ingest_fields(fields):
+    """Return the fields to select from packets when loading, None for all.
+
+    The frame number is always selected since it keys every row.
+    """
+    if not fields:
+        return None
+    return frozenset([*fields, "frame.number"])
+
+
+class ChangedSourceFile(Exception):
+    """Raise when a checkpointed source file no longer has the same content."""
+
+
+class UnsourcedTable(Exception):
+    """Raise when rows of a source file would go into tables without sources."""
+
+
+def head_hash(path, hashed_bytes):
+    """Return the hash of the first hashed_bytes bytes of a file."""
+    with path.open("rb") as source_file:
+        return hashlib.sha256(source_file.read(hashed_bytes)).hexdigest()
+
+
+def file_fingerprint(path):
+    """Return the identifying details of a source file for a checkpoint."""
+    stat = path.stat()
+    hashed_bytes = min(stat.st_size, HASHED_HEAD_BYTES)
+    return {
+        "source_path": str(path.resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hashed_bytes": hashed_bytes,
+        "content_hash": head_hash(path, hashed_bytes),
+    }
+
+
+def ensure_checkpoint_table(db):
+    """Create the checkpoint table if db doesn't have one."""
+    db.execute(
+        f"CREATE TABLE IF NOT EXISTS {quote(CHECKPOINT_TABLE)} ("
+        "source_path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+        "hashed_bytes INTEGER, content_hash TEXT, last_frame_number INTEGER, "
+        "complete INTEGER)"
+    )
+
+
+def read_checkpoint(db, source_path):
+    """Return the checkpoint row for source_path, or None if there is none."""
+    ensure_checkpoint_table(db)
+    cursor = db.execute(
+        f"SELECT * FROM {quote(CHECKPOINT_TABLE)} WHERE source_path = ?",
+        [source_path],
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([column[0] for column in cursor.description], row))
+
+
+def write_checkpoint(db, fingerprint, last_frame_number, complete=False):
+    """Record how far through the file with fingerprint db has been loaded."""
+    db.execute(
+        f"INSERT OR REPLACE INTO {quote(CHECKPOINT_TABLE)} "
+        "(source_path, size, mtime_ns, hashed_bytes, content_hash, "
+        "last_frame_number, complete) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            fingerprint["source_path"],
+            fingerprint["size"],
+            fingerprint["mtime_ns"],
+            fingerprint["hashed_bytes"],
+            fingerprint["content_hash"],
+            last_frame_number,
+            int(complete),
+        ],
+    )
+
+
+def layer_tables(db):
+    """Return the names of the tables in db that hold packet layers."""
+    # unlike checkpoint, field type and full-text search tables
+    return [
+        table for table in db.table_names() if FRAME_NUMBER in db[table].columns_dict
+    ]
+
+
+def max_frame_number(db):
+    """Return the highest frame number of the rows in db, 0 if it has none."""
+    return max(
+        (
+            db.execute(
+                f"SELECT max({quote(FRAME_NUMBER)}) FROM {quote(table)}"
+            ).fetchone()[0]
+            or 0
+            for table in layer_tables(db)
+        ),
+        default=0,
+    )
+
+
+def tune_for_bulk_load(db, pragmas=None):
+    """Apply pragmas that speed up large inserts to a database."""
+    for pragma, value in (pragmas or BULK_LOAD_PRAGMAS).items():
+        db.execute(f"PRAGMA {pragma} = {value}")
+
+
+class Ingester:
+    """Buffer flattened packets and insert them into SQLite in batches.
+
+    Rows are grouped by layer table and written with one `executemany` per
+    table inside a single transaction once batch_size packets are pending.
+    Tables and columns are created as new layers and fields are seen. Use as a
+    context manager so the last partial batch is written.
+
+    When given the fingerprint of the source file, the frame number reached is
+    checkpointed in the same transaction as each batch.
+
+    Given a source (file path), rows and flows are keyed by it as well as
+    the frame number, in tables created so; tables made without sources
+    can't take them.
+
+    When typed, the kind of each new field is inferred from its first batch
+    and recorded, and its values are stored as that kind (see fieldtypes).
+    Fields that were loaded untyped before stay text.
+
+    The flows of each batch's packets are added to the flows table in the
+    batch's transaction (see flows.FlowAggregator).
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        db,
+        batch_size=BATCH_SIZE,
+        fingerprint=None,
+        last_frame=0,
+        typed=False,
+        *,
+        source=None,
+    ):
+        """Initialize with a sqlite_utils.Database to load packets into."""
+        self.db = db
+        self.source = source
+        self.batch_size = batch_size
+        self.fingerprint = fingerprint
+        self.last_frame_number = last_frame
+        self.pending = {}
+        self.pending_packets = 0
+        self.packets_added = 0
+        self.columns = {
+            table: set(self.db[table].columns_dict) for table in self.db.table_names()
+        }
+        if source:
+            unsourced = [
+                table
+                for table in [*layer_tables(db), flows.FLOWS_TABLE]
+                if table in self.columns and SOURCE not in self.columns[table]
+            ]
+            if unsourced:
+                raise UnsourcedTable(
+                    f"Tables {', '.join(unsourced)} were loaded without source "
+                    f"files, so `{source}` can't be added to them."
+                )
+        self.kinds = fieldtypes.read_catalog(db) if typed else None
+        self.flows = flows.FlowAggregator(source)
+        if typed:
+            for table, columns in self.columns.items():
+                table_kinds = self.kinds.setdefault(table, {})
+                for column in columns - {FRAME_NUMBER, SOURCE}:
+                    table_kinds.setdefault(column, fieldtypes.TEXT)
+
+    def add_packet(self, packet):
+        """Queue the layers of a packet, writing a batch once one is full."""
+        number = frame_number(packet)
+        if number is None:
+            number = self.last_frame_number + 1
+        self.add_rows(number, flatten_packet(packet))
+
+    def add_rows(self, number, flattened):
+        """Queue already flattened layers for the packet with frame number."""
+        for table, row in flattened.items():
+            row[FRAME_NUMBER] = number
+            if self.source:
+                row[SOURCE] = self.source
+            self.pending.setdefault(table, []).append(row)
+        self.flows.add(number, flattened)
+        self.last_frame_number = max(self.last_frame_number, number)
+        self.packets_added += 1
+        self.pending_packets += 1
+        if self.pending_packets >= self.batch_size:
+            self.flush()
+
+    def ensure_columns(self, table, rows):
+        """Create table or any of its columns that rows need but lack."""
+        needed = set().union(*rows)
+        known = self.columns.get(table)
+        if known is None and self.source:
+            self.db.execute(
+                f"CREATE TABLE {quote(table)} ({SOURCE} TEXT, "
+                f"{quote(FRAME_NUMBER)} INTEGER, "
+                f"PRIMARY KEY ({SOURCE}, {quote(FRAME_NUMBER)}))"
+            )
+            known = self.columns[table] = {SOURCE, FRAME_NUMBER}
+        elif known is None:
+            self.db.execute(
+                f"CREATE TABLE {quote(table)} "
+                f"({quote(FRAME_NUMBER)} INTEGER PRIMARY KEY)"
+            )
+            known = self.columns[table] = {FRAME_NUMBER}
+        new_columns = sorted(needed - known)
+        for column in new_columns:
+            self.db.execute(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(column)}")
+            known.add(column)
+        if self.kinds is not None and new_columns:
+            kinds = {
+                column: fieldtypes.infer_kind(row.get(column) for row in rows)
+                for column in new_columns
+            }
+            self.kinds.setdefault(table, {}).update(kinds)
+            fieldtypes.write_catalog(self.db, table, kinds)
+
+    def write_rows(self, table, rows):
+        """Insert rows into table with a single executemany."""
+        columns = sorted(set().union(*rows))
+        table_kinds = (self.kinds or {}).get(table, {})
+        kinds = [table_kinds.get(column, fieldtypes.TEXT) for column in columns]
+        column_list = ", ".join(quote(column) for column in columns)
+        placeholders = ", ".join("?" for _ in columns)
+        self.db.conn.executemany(
+            f"INSERT INTO {quote(table)} ({column_list}) VALUES ({placeholders})",
+            (
+                tuple(
+                    fieldtypes.to_sqlite_value(row.get(column), kind)
+                    for column, kind in zip(columns, kinds)
+                )
+                for row in rows
+            ),
+        )
+
+    def flush(self):
+        """Write all queued rows in one transaction."""
+        if not self.pending:
+            return
+        with self.db.conn:
+            for table, rows in self.pending.items():
+                self.ensure_columns(table, rows)
+                self.write_rows(table, rows)
+            self.flows.write(self.db)
+            if self.fingerprint:
+                write_checkpoint(self.db, self.fingerprint, self.last_frame_number)
+        logging.debug("Wrote batch of %d packets.", self.pending_packets)
+        self.pending = {}
+        self.pending_packets = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+
+def ingest_packets(db, packets, batch_size=BATCH_SIZE, fields=None, typed=False):
+    """Load packets into db and return how many were loaded.
+
+    With fields, only those fields or layers of each packet are loaded, see
+    stream.select_fields, and flows are summed up from them alone (include
+    flows.FLOW_FIELDS for complete flows). When typed, values are stored by the kinds
+    inferred for their fields, see Ingester.
+    """
+    fields = ingest_fields(fields)
+    if fields:
+        packets = (stream.select_fields(packet, fields) for packet in packets)
+    tune_for_bulk_load(db)
+    with Ingester(db, batch_size, typed=typed) as ingester:
+        for packet in packets:
+            ingester.add_packet(packet)
+    return ingester.packets_added
+
+
+def resume_point(db, digest_path, fingerprint):
+    """Return the frame number to resume loading a file after.
+
+    Return None if the file was completely loaded and hasn't changed size or
+    modification time since. The head hashed for the checkpoint is hashed
+    again, so a file that has grown since is still recognized.
+    """
+    checkpoint = read_checkpoint(db, fingerprint["source_path"])
+    if not checkpoint:
+        return 0
+    if checkpoint["content_hash"] != head_hash(digest_path, checkpoint["hashed_bytes"]):
+        raise ChangedSourceFile(
+            f"`{digest_path}` differs from when it was last loaded."
+        )
+    unchanged = all(checkpoint[key] == fingerprint[key] for key in ["size", "mtime_ns"])
+    if checkpoint["complete"] and unchanged:
+        return None
+    return checkpoint["last_frame_number"]
+
+
+def ingest_file(db, digest_path, batch_size=BATCH_SIZE, fields=None, typed=False):
+    """Load the digest at digest_path into db, resuming from its checkpoint.
+
+    Packets at or before the checkpointed frame number are skipped. A file
+    that was fully loaded and hasn't changed size or modification time since
+    is skipped entirely. Fields are selected and typed as for ingest_packets,
+    and the values of repeated keys are all kept (see
+    digest.merge_duplicate_keys). The digest can be in any format
+    stream.read_packets reads. Rows are keyed by the file's resolved path
+    in a `source` column, so many files can be loaded into one db. Return
+    how many packets were loaded.
+    """
+    fingerprint = file_fingerprint(digest_path)
+    last_frame = resume_point(db, digest_path, fingerprint)
+    if last_frame is None:
+        logging.info("Skipping already loaded %s.", digest_path)
+        return 0
+
+    tune_for_bulk_load(db)
+    ingester = Ingester(
+        db,
+        batch_size,
+        fingerprint,
+        last_frame,
+        typed,
+        source=fingerprint["source_path"],
+    )
+    with stream.open_digest(digest_path) as digest_file, ingester:
+        packets = stream.read_packets(
+            digest_file,
+            fields=ingest_fields(fields),
+            object_pairs_hook=digest.merge_duplicate_keys,
+        )
+        for position, packet in enumerate(packets, 1):
+            number = frame_number(packet)
+            if (position if number is None else number) > last_frame:
+                ingester.add_packet(packet)
+    with db.conn:
+        write_checkpoint(db, fingerprint, ingester.last_frame_number, complete=True)
+    return ingester.packets_added
+
+
+def flatten_shard(digest_path, start, end, last_frame=0, fields=None):
+    """Return list of (frame number, flattened layers) for a digest shard.
+
+    Packets at or before last_frame are left out, and fields are selected as
+    for ingest_packets. Run in worker processes by ingest_file_parallel.
+    """
+    packets = shard.read_shard(
+        digest_path, start, end, object_pairs_hook=digest.merge_duplicate_keys
+    )
+    fields = ingest_fields(fields)
+    if fields:
+        packets = (stream.select_fields(packet, fields) for packet in packets)
+    flattened = []
+    for packet in packets:
+        number = frame_number(packet)
+        if number is None or number > last_frame:
+            flattened.append((number, flatten_packet(packet)))
+    return flattened
+
+
+def _bounded_map(executor, function, arg_tuples, in_flight):
+    """Return iterable of results of function in order of arg_tuples.
+
+    At most in_flight calls are queued or held in memory at once.
+    """
+    futures = collections.deque()
+    for args in arg_tuples:
+        futures.append(executor.submit(function, *args))
+        if len(futures) >= in_flight:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def ingest_file_parallel(  # noqa: PLR0913
+    db,
+    digest_path,
+    workers=None,
+    batch_size=BATCH_SIZE,
+    *,
+    shard_bytes=None,
+    memory_bytes=PARALLEL_MEMORY_BYTES,
+    fields=None,
+    typed=False,
+):
+    """Load the digest at digest_path into db, decoding it in worker processes.
+
+    The digest is split into byte ranges of whole packets that are decoded and
+    flattened in a process pool, while this process alone writes to db in
+    packet order. Checkpoints work as for ingest_file and fields are selected
+    and typed as for ingest_packets. Return how many packets were loaded.
+
+    At most workers + 1 shards are decoded or waiting at once, so the rows
+    held peak at about (workers + 1) * FLATTENED_GROWTH * shard_bytes.
+    Unless given, shard_bytes is sized for that to fit in memory_bytes (at
+    most shard.SHARD_BYTES, at least MIN_SHARD_BYTES).
+    """
+    fingerprint = file_fingerprint(digest_path)
+    last_frame = resume_point(db, digest_path, fingerprint)
+    if last_frame is None:
+        logging.info("Skipping already loaded %s.", digest_path)
+        return 0
+
+    tune_for_bulk_load(db)
+    ingester = Ingester(
+        db,
+        batch_size,
+        fingerprint,
+        last_frame,
+        typed,
+        source=fingerprint["source_path"],
+    )
+    workers = workers or os.cpu_count()
+    in_flight = workers + 1
+    if shard_bytes is None:
+        shard_bytes = memory_bytes // (in_flight * FLATTENED_GROWTH)
+        shard_bytes = max(MIN_SHARD_BYTES, min(shard.SHARD_BYTES, shard_bytes))
+    ranges = shard.shard_ranges(digest_path, shard_bytes)
+    shard_args = (
+        (digest_path, start, end, last_frame, fields) for start, end in ranges
+    )
+    with ProcessPoolExecutor(workers) as executor, ingester:
+        for flattened in _bounded_map(executor, flatten_shard, shard_args, in_flight):
+            for number, layers in flattened:
+                if number is None:
+                    ingester.add_rows(ingester.last_frame_number + 1, layers)
+                else:
+                    ingester.add_rows(number, layers)
+    with db.conn:
+        write_checkpoint(db, fingerprint, ingester.last_frame_number, complete=True)
+    return ingester.packets_added
+
+
+PARSER = argparse.ArgumentParser(
+    description="Load a json wireshark digest into a SQLite database.",
+)
+PARSER.add_argument("input", help="path to digest to load", type=pathlib.Path)
+PARSER.add_argument("output", help="path to SQLite database", type=pathlib.Path)
+PARSER.add_argument(
+    "--batch-size",
+    help="packets to insert per transaction",
+    type=int,
+    default=BATCH_SIZE,
+)
+PARSER.add_argument(
+    "--workers",
+    help="processes decoding the digest in parallel, 1 to decode in-process",
+    type=int,
+    default=1,
+)
+PARSER.add_argument(
+    "--fields",
+    help="wireshark fields (e.g. `ip.src`) or layers (e.g. `tls`) to load, "
+    "instead of all of them",
+    nargs="+",
+)
+PARSER.add_argument(
+    "--no-indexes",
+    help="skip creating default and full-text indexes after loading",
+    dest="index",
+    action="store_false",
+)
+PARSER.add_argument(
+    "--typed",
+    help="store values as integers, reals or bytes by their fields' kinds",
+    action="store_true",
+)
+
+
+def main(  # noqa: PLR0913
+    digest_path,
+    db_path,
+    batch_size=BATCH_SIZE,
+    workers=1,
+    *,
+    fields=None,
+    index=True,
+    typed=False,
+):
+    """
+    Load the wireshark digest at digest_path into the database at db_path.
+
+    Unless index is False, default and full-text indexes are made once the
+    load is done, since maintaining them would slow the inserts.
+    """
+    db = sqlite_utils.Database(db_path)
+    if workers > 1:
+        loaded = ingest_file_parallel(
+            db, digest_path, workers, batch_size, fields=fields, typed=typed
+        )
+    else:
+        loaded = ingest_file(db, digest_path, batch_size, fields, typed)
+    logging.info("Loaded %d packets into %s.", loaded, db_path)
+    if index:
+        indexes.create_default_indexes(db)
+        indexes.enable_full_text(db)
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+    main(
+        args.input,
+        args.output,
+        args.batch_size,
+        args.workers,
+        fields=args.fields,
+        index=args.index,
+        typed=args.typed,
+    )
@@ -0,0 +1,94 @@
+"""Prefix-preserving anonymization of IPv4 and IPv6 addresses.
+
+Addresses are mapped as in Crypto-PAn: bit i of an address is flipped by a
+pseudorandom function of the i bits before it, so two addresses sharing an
+n-bit prefix map to addresses sharing an n-bit prefix, and subnets stay
+recognizable without revealing the networks. HMAC-SHA256 under a key stands
+in for Crypto-PAn's AES, so the same key always gives the same mapping.
+
+Working out the flips of a prefix takes one HMAC per bit. The mapped prefix
+of each /24 (IPv4) or /48 (IPv6) is cached, so only the bits after it are
+worked out for each new address in a network already seen.
+"""
+
+import functools
+import hashlib
+import hmac
+import ipaddress
+import secrets
+
+IPV4_CACHED_PREFIX_BITS = 24
+IPV6_CACHED_PREFIX_BITS = 48
+KEY_BYTES = 32
+PARSE_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_ip_addr(text):
+    """Return an IPv4Address or IPv6Address for text, or None if it isn't one."""
+    try:
+        return ipaddress.ip_address(text)
+    except ValueError:
+        return None
+
+
+class PrefixPreservingMap:
+    """Map integers of a number of bits so that common prefixes are kept."""
+
+    def __init__(self, key, bits, cached_prefix_bits):
+        """Initialize with a key (bytes) and the length of prefixes to cache."""
+        self.key = key
+        self.bits = bits
+        self.cached_prefix_bits = cached_prefix_bits
+        self.prefix_bytes = (bits + 7) // 8
+        self.prefixes = {}
+
+    def flips(self, value, start, end):
+        """Return the flips of bits start to end of value, as an integer."""
+        flips = 0
+        for length in range(start, end):
+            prefix = value >> (self.bits - length)
+            data = bytes([length]) + prefix.to_bytes(self.prefix_bytes, "big")
+            flips = (flips << 1) | (hmac.digest(self.key, data, hashlib.sha256)[0] & 1)
+        return flips
+
+    def map(self, value):
+        """Return the integer value maps to."""
+        rest_bits = self.bits - self.cached_prefix_bits
+        prefix = value >> rest_bits
+        mapped_prefix = self.prefixes.get(prefix)
+        if mapped_prefix is None:
+            mapped_prefix = self.prefixes[prefix] = prefix ^ self.flips(
+                value, 0, self.cached_prefix_bits
+            )
+        rest = value & ((1 << rest_bits) - 1)
+        rest_flips = self.flips(value, self.cached_prefix_bits, self.bits)
+        return (mapped_prefix << rest_bits) | (rest ^ rest_flips)
+
+
+class IpAnonymizer:
+    """Map IPv4 and IPv6 addresses to prefix-preserving pseudonyms.
+
+    Without a key, a random one is made, so mappings only hold for the
+    lifetime of the IpAnonymizer (e.g. one run).
+    """
+
+    def __init__(self, key=None):
+        """Initialize with a secret key (bytes) to derive pseudonyms from."""
+        key = key or secrets.token_bytes(KEY_BYTES)
+        # separate keys, so IPv4 and IPv6 mappings don't share flips
+        self.maps = {
+            version: PrefixPreservingMap(
+                hmac.digest(key, f"ipv{version}".encode(), hashlib.sha256),
+                bits,
+                cached_prefix_bits,
+            )
+            for version, bits, cached_prefix_bits in [
+                (4, ipaddress.IPV4LENGTH, IPV4_CACHED_PREFIX_BITS),
+                (6, ipaddress.IPV6LENGTH, IPV6_CACHED_PREFIX_BITS),
+            ]
+        }
+
+    def anonymize(self, addr):
+        """Return the pseudonym of an IPv4Address or IPv6Address as text."""
+        return str(type(addr)(self.maps[addr.version].map(int(addr))))
@@ -0,0 +1,289 @@
+"""Index where each packet of a digest starts, for reading packets directly.
+
+A digest is scanned once, and the byte offset of every packet is written to
+a sidecar file next to it (`capture.json.offsets`), optionally with each
+packet's frame number and epoch time. The sidecar is a header followed by
+arrays of 8 byte values in native byte order:
+
+    python -m wireshark_digest_to_sqlite.offsets capture.json --frame 4381220
+
+A DigestIndex memory maps the digest and its sidecar, so any packet, frame
+or span of time is found without reading the packets before it, and only
+the packets asked for are decoded. The offsets also split a digest into
+shards without searching for packet boundaries (see shard.shard_ranges).
+"""
+
+import argparse
+import array
+import bisect
+import contextlib
+import io
+import itertools
+import json
+import math
+import mmap
+import pathlib
+import struct
+import sys
+
+from wireshark_digest_to_sqlite import compressed, ek, stream
+
+SUFFIX = ".offsets"
+MAGIC = b"WDOX"
+VERSION = 1
+# magic, version, flags, packet count, digest size and modification time
+HEADER = struct.Struct("=4sHHQQq")
+
+HAS_FRAMES = 1
+HAS_TIMES = 2
+FRAMES_SORTED = 4
+TIMES_SORTED = 8
+
+OFFSET_TYPE = "Q"
+FRAME_TYPE = "Q"
+TIME_TYPE = "d"
+# Stands in for a packet without a frame number or time
+NO_FRAME = 0
+NO_TIME = math.nan
+
+
+class StaleIndex(Exception):
+    """Raise when a sidecar doesn't match the digest it indexes."""
+
+
+def index_path(digest_path):
+    """Return the path of the sidecar holding a digest's offsets."""
+    return digest_path.with_name(f"{digest_path.name}{SUFFIX}")
+
+
+def _frame_field(packet, field):
+    """Return a field of a packet's frame layer, or None if it has none."""
+    frame = packet["_source"]["layers"].get("frame")
+    return frame.get(field) if isinstance(frame, dict) else None
+
+
+def _is_sorted(values):
+    """Return if values never decrease."""
+    return all(first <= second for first, second in itertools.pairwise(values))
+
+
+def build_index(digest_path, sidecar_path=None, frames=True, times=True):
+    """Scan a digest and write the offsets of its packets to a sidecar.
+
+    The digest can be in any format stream.read_packets reads. With frames
+    and times, each packet's frame number and epoch time are stored too.
+    Return the number of packets indexed. Compressed digests can't be
+    indexed, since their packets can't be read in place.
+    """
+    if compressed.compression(digest_path):
+        raise ValueError("Compressed digests are split by block, not indexed.")
+    offsets = array.array(OFFSET_TYPE)
+    frame_numbers = array.array(FRAME_TYPE)
+    epoch_times = array.array(TIME_TYPE)
+    stat = digest_path.stat()
+    with digest_path.open("rb") as digest_file:
+        # latin-1 decodes each byte to one character, so the text offsets
+        # are byte offsets, and the ASCII fields read are decoded correctly
+        text_file = io.TextIOWrapper(digest_file, encoding="latin-1", newline="")
+        for offset, packet in stream.read_packet_offsets(text_file, strict=False):
+            offsets.append(offset)
+            if frames:
+                number = _frame_field(packet, "frame.number")
+                frame_numbers.append(int(number) if number else NO_FRAME)
+            if times:
+                epoch = _frame_field(packet, "frame.time_epoch")
+                epoch_times.append(float(epoch) if epoch else NO_TIME)
+
+    flags = (HAS_FRAMES if frames else 0) | (HAS_TIMES if times else 0)
+    if frames and _is_sorted(frame_numbers):
+        flags |= FRAMES_SORTED
+    # nan compares false, so times with gaps never count as sorted
+    if times and _is_sorted(epoch_times):
+        flags |= TIMES_SORTED
+    header = HEADER.pack(
+        MAGIC, VERSION, flags, len(offsets), stat.st_size, stat.st_mtime_ns
+    )
+    with (sidecar_path or index_path(digest_path)).open("wb") as sidecar:
+        sidecar.write(header)
+        for values in (offsets, frame_numbers, epoch_times):
+            values.tofile(sidecar)
+    return len(offsets)
+
+
+class DigestIndex:
+    """Read the packets of a digest by position, frame number or time.
+
+    Use as a context manager, or close() when done, to unmap the files.
+    Keyword arguments are passed to json.JSONDecoder, and ek packets are
+    normalized with known_names as by stream.read_packets.
+    """
+
+    def __init__(
+        self, digest_path, sidecar_path=None, known_names=None, **decoder_kwargs
+    ):
+        """Map a digest and its sidecar, which must be up to date."""
+        self.known_names = known_names
+        self.decoder = json.JSONDecoder(**decoder_kwargs)
+        with (sidecar_path or index_path(digest_path)).open("rb") as sidecar:
+            self.sidecar = mmap.mmap(sidecar.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.flags, count, size, mtime_ns = HEADER.unpack_from(
+            self.sidecar
+        )
+        stat = digest_path.stat()
+        if (magic, version) != (MAGIC, VERSION) or (size, mtime_ns) != (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            self.sidecar.close()
+            raise StaleIndex(f"The offsets of `{digest_path}` are out of date.")
+        with digest_path.open("rb") as digest_file:
+            # an empty file can't be mapped, and holds no packets anyway
+            self.digest = (
+                mmap.mmap(digest_file.fileno(), 0, access=mmap.ACCESS_READ)
+                if size
+                else b""
+            )
+
+        self.views = []
+        position = HEADER.size
+        self.offsets, position = self._view(position, count, OFFSET_TYPE)
+        self.frames, position = self._view(
+            position, count if self.flags & HAS_FRAMES else 0, FRAME_TYPE
+        )
+        self.times, position = self._view(
+            position, count if self.flags & HAS_TIMES else 0, TIME_TYPE
+        )
+
+    def _view(self, position, count, typecode):
+        """Return a view of count values in the sidecar and where they end."""
+        end = position + count * array.array(typecode).itemsize
+        view = memoryview(self.sidecar)[position:end].cast(typecode)
+        self.views.append(view)
+        return view, end
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def packet(self, position):
+        """Return the packet at position (0 for the first) in the digest."""
+        start = self.offsets[position]
+        end = self.offsets[position + 1] if position + 1 < len(self) else None
+        text = self.digest[start:end].decode("utf-8")
+        document, end = self.decoder.raw_decode(text)
+        index = None
+        if ek.is_index_line(document):
+            # an ek index line is followed by the document it indexes
+            index = document
+            document, _ = self.decoder.raw_decode(text[end:].lstrip(stream.WHITESPACE))
+        if ek.is_ek_document(document):
+            return ek.normalize_packet(document, index, self.known_names)
+        return document
+
+    def packets(self, start=0, stop=None):
+        """Return iterable of the packets at positions start up to stop."""
+        return map(self.packet, range(*slice(start, stop).indices(len(self))))
+
+    def frame(self, number):
+        """Return the packet with frame number, or None if there is none."""
+        if not self.flags & HAS_FRAMES:
+            raise ValueError("The offsets were indexed without frame numbers.")
+        if self.flags & FRAMES_SORTED:
+            position = bisect.bisect_left(self.frames, number)
+            found = position < len(self) and self.frames[position] == number
+        else:
+            position = next(
+                (i for i, frame in enumerate(self.frames) if frame == number), None
+            )
+            found = position is not None
+        return self.packet(position) if found else None
+
+    def time_range(self, start, end):
+        """Return iterable of the packets with start <= epoch time < end."""
+        if not self.flags & HAS_TIMES:
+            raise ValueError("The offsets were indexed without times.")
+        if self.flags & TIMES_SORTED:
+            return self.packets(
+                bisect.bisect_left(self.times, start),
+                bisect.bisect_left(self.times, end),
+            )
+        return map(
+            self.packet,
+            [i for i, time in enumerate(self.times) if start <= time < end],
+        )
+
+    def shard_ranges(self, shard_bytes):
+        """Return list of (start, end) byte ranges as shard.shard_ranges does."""
+        size = len(self.digest)
+        starts = []
+        offset = 0
+        while offset < size:
+            position = bisect.bisect_left(self.offsets, offset)
+            if position >= len(self):
+                break
+            starts.append(self.offsets[position])
+            # the next multiple of shard_bytes after this start
+            offset = (starts[-1] // shard_bytes + 1) * shard_bytes
+        return list(zip(starts, [*starts[1:], size]))
+
+    def close(self):
+        """Unmap the digest and sidecar."""
+        for view in self.views:
+            view.release()
+        self.sidecar.close()
+        if isinstance(self.digest, mmap.mmap):
+            self.digest.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_index(digest_path, **kwargs):
+    """Return the DigestIndex of a digest, or None if it has none up to date."""
+    if not index_path(digest_path).exists():
+        return None
+    with contextlib.suppress(StaleIndex):
+        return DigestIndex(digest_path, **kwargs)
+    return None
+
+
+PARSER = argparse.ArgumentParser(
+    description="Index the packet offsets of a wireshark digest.",
+)
+PARSER.add_argument("digest", help="path to digest to index", type=pathlib.Path)
+PARSER.add_argument(
+    "--no-frames",
+    help="leave out frame numbers",
+    dest="frames",
+    action="store_false",
+)
+PARSER.add_argument(
+    "--no-times",
+    help="leave out packet times",
+    dest="times",
+    action="store_false",
+)
+PARSER.add_argument(
+    "--frame",
+    help="print the packet with this frame number, indexing first if needed",
+    type=int,
+)
+
+
+def main(digest_path, frames=True, times=True, frame=None):
+    """Index digest_path unless it is indexed, then print a frame if given."""
+    index = open_index(digest_path)
+    if index is None:
+        build_index(digest_path, frames=frames, times=times)
+        index = DigestIndex(digest_path)
+    with index:
+        if frame is not None:
+            json.dump(index.frame(frame), sys.stdout, indent=2, ensure_ascii=False)
+            print()
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+    main(args.digest, args.frames, args.times, args.frame)
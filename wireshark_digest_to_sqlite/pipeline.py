@@ -0,0 +1,111 @@
+"""Dissect a capture with tshark and anonymize it into SQLite or a digest.
+
+tshark's output is decoded as it is written, and each packet is anonymized
+and written out before the next is read, so no intermediate digest ever
+touches the disk:
+
+    python -m wireshark_digest_to_sqlite.pipeline curl.pcap curl.db \\
+        --tshark-args '-n -2 -o tls.keylog_file:sslkeys.log'
+"""
+
+import argparse
+import logging
+import pathlib
+import shlex
+
+import sqlite_utils
+
+from wireshark_digest_to_sqlite import anonymize, indexes, ingest, stream, tshark
+
+SQLITE = "sqlite"
+OUTPUT_FORMATS = (SQLITE, *stream.OUTPUT_FORMATS)
+TSHARK_FORMATS = ("json", "ek")
+
+
+def write_packets(packets, output_path, output_format=SQLITE):
+    """Write packets to a database or digest at output_path as they come.
+
+    Return the number of packets written.
+    """
+    if output_format != SQLITE:
+        with stream.open_digest(output_path, "w") as output_file:
+            return stream.write_packets(packets, output_file, output_format)
+
+    db = sqlite_utils.Database(output_path)
+    written = ingest.ingest_packets(db, packets)
+    indexes.create_default_indexes(db)
+    indexes.enable_full_text(db)
+    return written
+
+
+PARSER = argparse.ArgumentParser(
+    description="Anonymize a capture dissected by tshark into SQLite or a digest.",
+)
+PARSER.add_argument("input", help="path to capture (pcap) to dissect")
+PARSER.add_argument(
+    "output", help="path to place output, `-` for stdout", type=pathlib.Path
+)
+PARSER.add_argument(
+    "--format",
+    help="layout of the output, a SQLite database or a digest",
+    choices=OUTPUT_FORMATS,
+    default=SQLITE,
+)
+PARSER.add_argument(
+    "--key-file",
+    help="file holding a secret key to derive consistent pseudonyms from",
+    type=pathlib.Path,
+)
+PARSER.add_argument(
+    "--tshark-args",
+    help="further arguments to tshark, e.g. `-n -2`",
+    type=shlex.split,
+    default=[],
+)
+PARSER.add_argument(
+    "--tshark-format",
+    help="output format to have tshark write",
+    choices=TSHARK_FORMATS,
+    default="json",
+)
+PARSER.add_argument("--tshark", help="tshark executable", default=tshark.TSHARK)
+
+
+def main(  # noqa: PLR0913
+    pcap_path,
+    output_path,
+    output_format=SQLITE,
+    key=None,
+    *,
+    tshark_args=(),
+    tshark_format="json",
+    tshark_path=tshark.TSHARK,
+):
+    """
+    Dissect the capture at pcap_path with tshark, anonymize its packets, and
+    write them to output_path as they are dissected. Keys work as for
+    anonymize.main.
+    """
+    anonymizer = anonymize.Anonymizer(share_trees=True, key=key)
+    packets = tshark.capture_packets(pcap_path, tshark_args, tshark_format, tshark_path)
+    written = write_packets(
+        anonymize.anonymize_packets(packets, anonymizer), output_path, output_format
+    )
+    logging.info("Wrote %d packets from %s.", written, pcap_path)
+    try:
+        anonymizer.verify()
+    except anonymize.ScrubbingException:
+        logging.error("Failed to remove all instances of the original addresses!")
+
+
+if __name__ == "__main__":
+    args = PARSER.parse_args()
+    main(
+        args.input,
+        args.output,
+        args.format,
+        args.key_file.read_bytes() if args.key_file else None,
+        tshark_args=args.tshark_args,
+        tshark_format=args.tshark_format,
+        tshark_path=args.tshark,
+    )
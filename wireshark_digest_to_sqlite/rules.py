@@ -0,0 +1,189 @@
+"""Anonymize wireshark fields by rules mapping field names to transforms.
+
+Rules are a JSON object of field names, or glob patterns of them, to one of
+the transforms `hash`, `redact`, `pseudonymize` or `drop`:
+
+    {
+        "http.host": "pseudonymize",
+        "tls.handshake.extensions_server_name": "hash",
+        "http.cookie": "redact",
+        "eth.*": "drop"
+    }
+
+A transform applies to every value under a matching key, so a rule for a
+tree (e.g. `eth.src_tree`) covers the fields in it, and `drop` removes the
+key with all it holds. Exact names take precedence over patterns, and
+patterns are tried in the order given. Only the values of matching keys are
+transformed; a value also written into another field (e.g. a cookie in
+`http.request.line`) needs a rule of its own.
+"""
+
+import fnmatch
+import functools
+import hashlib
+import hmac
+import json
+import re
+import secrets
+
+from wireshark_digest_to_sqlite import ethernet, ipaddr
+
+HASH = "hash"
+REDACT = "redact"
+PSEUDONYMIZE = "pseudonymize"
+DROP = "drop"
+TRANSFORMS = (HASH, REDACT, PSEUDONYMIZE, DROP)
+GLOB_CHARS = "*?["
+
+REDACTED = "REDACTED"
+PSEUDONYM_PREFIX = "anon-"
+PSEUDONYM_HEX_DIGITS = 12
+KEY_BYTES = 32
+MEMO_SIZE = 1 << 16
+# Labels (e.g. `GET / HTTP/1.1\r\n`) are keys too, so don't remember the
+# actions of keys without bound
+DISPATCH_SIZE = 1 << 16
+
+# Stands in for a dropped key's value while a tree is rewritten
+_DROPPED = object()
+
+
+class InvalidRule(Exception):
+    """Raise when a rule names a transform that doesn't exist."""
+
+
+def is_pattern(name):
+    """Return if a rule's name is a glob pattern rather than a field name."""
+    return any(char in name for char in GLOB_CHARS)
+
+
+class RuleTable:
+    """Rules compiled into a table of each key's transform.
+
+    The transform of a key is worked out from the rules the first time the
+    key is seen, and looked up after that.
+    """
+
+    def __init__(self, rules):
+        """Initialize with a dict of field name or glob pattern to transform."""
+        for name, transform in rules.items():
+            if transform not in TRANSFORMS:
+                raise InvalidRule(f"`{name}` has unknown transform `{transform}`.")
+        self.dispatch = {
+            name: transform for name, transform in rules.items() if not is_pattern(name)
+        }
+        self.patterns = [
+            (re.compile(fnmatch.translate(name)), transform)
+            for name, transform in rules.items()
+            if is_pattern(name)
+        ]
+
+    def action(self, key):
+        """Return the transform for key, or None if no rule matches it."""
+        try:
+            return self.dispatch[key]
+        except KeyError:
+            pass
+        action = next(
+            (
+                transform
+                for pattern, transform in self.patterns
+                if pattern.fullmatch(key)
+            ),
+            None,
+        )
+        if len(self.dispatch) < DISPATCH_SIZE:
+            self.dispatch[key] = action
+        return action
+
+
+def load_rules(rules_path):
+    """Return the RuleTable of the JSON rules file at rules_path."""
+    return RuleTable(json.loads(rules_path.read_text()))
+
+
+class RuleAnonymizer:
+    """Apply a RuleTable to packets in one pass over each packet.
+
+    Transformed values are remembered, so each distinct value is worked out
+    once per transform. Hashes and pseudonyms are derived from a key, so
+    runs given the same key agree. Pseudonyms of ethernet and IP addresses
+    are addresses, the same ones anonymize.Anonymizer gives with that key.
+    """
+
+    def __init__(self, rules, key=None, ip_anonymizer=None):
+        """Initialize with a RuleTable, or a dict of rules, and a key (bytes).
+
+        IP addresses are pseudonymized by ip_anonymizer if given, so they
+        match those of another anonymizer without a key.
+        """
+        self.table = rules if isinstance(rules, RuleTable) else RuleTable(rules)
+        self.key = key or secrets.token_bytes(KEY_BYTES)
+        self.ip_anonymizer = ip_anonymizer or ipaddr.IpAnonymizer(self.key)
+        self.transform = functools.lru_cache(maxsize=MEMO_SIZE)(self._transform)
+
+    def _transform(self, action, value):
+        """Return a single string value transformed by action."""
+        if action == REDACT:
+            return REDACTED
+        digest = hmac.new(self.key, value.encode(), hashlib.sha256).hexdigest()
+        if action == HASH:
+            return digest
+        addr = ipaddr.parse_ip_addr(value)
+        if addr is not None:
+            return self.ip_anonymizer.anonymize(addr)
+        try:
+            data = ethernet.parse_eth_addr(value).normalized
+        except (ethernet.UnrecognizedEthernetAddressFormat, ValueError):
+            return f"{PSEUDONYM_PREFIX}{digest[:PSEUDONYM_HEX_DIGITS]}"
+        return str(
+            ethernet.EthAddr.keyed_eth_addr(self.key, data, local=True, group=False)
+        )
+
+    def transform_all(self, value, action):
+        """Return value with every string in it transformed by action."""
+        if isinstance(value, str):
+            return self.transform(action, value)
+        if isinstance(value, list):
+            return [self.transform_all(entry, action) for entry in value]
+        if isinstance(value, dict):
+            return {
+                key: self.transform_all(entry, action) for key, entry in value.items()
+            }
+        return value
+
+    def rewrite(self, value):
+        """Return value with the rules applied to the trees in it.
+
+        Trees are copied only where something changes, so trees shared
+        between packets (see anonymize.Anonymizer) are never modified.
+        """
+        if isinstance(value, list):
+            rewritten = [self.rewrite(entry) for entry in value]
+            changed = any(new is not old for new, old in zip(rewritten, value))
+            return rewritten if changed else value
+        if not isinstance(value, dict):
+            return value
+        changes = {}
+        for key, entry in value.items():
+            action = self.table.action(key)
+            if action is None:
+                new = self.rewrite(entry)
+            elif action == DROP:
+                new = _DROPPED
+            else:
+                new = self.transform_all(entry, action)
+            if new is not entry:
+                changes[key] = new
+        if not changes:
+            return value
+        return {
+            key: changes.get(key, entry)
+            for key, entry in value.items()
+            if changes.get(key) is not _DROPPED
+        }
+
+    def anonymize_packet(self, packet):
+        """Apply the rules to the layers of a packet."""
+        source = packet["_source"]
+        source["layers"] = self.rewrite(source["layers"])
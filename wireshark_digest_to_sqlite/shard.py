@@ -0,0 +1,184 @@
+"""Split json wireshark digests into byte ranges holding whole packets.
+
+A digest is one large JSON array, so a byte offset picked at random usually
+lands inside some packet. To split one, look forward from the offset for a
+`{` that follows a `[` or `,` and accept the first that decodes as a whole
+packet followed by another `,` or the closing `]`. A digest with an up to
+date offsets index (see offsets.py) is split at the offsets in it instead,
+and a compressed one between its blocks (see compressed.py).
+
+Newline delimited digests are split at the start of a line instead. In
+`tshark -T ek` output each packet is an index line and the document after
+it, so there only index lines start a shard.
+"""
+
+import io
+import json
+import re
+
+from wireshark_digest_to_sqlite import compressed, ek, offsets, stream
+
+SEARCH_BYTES = 1 << 16
+MAX_PACKET_BYTES = 1 << 26
+SHARD_BYTES = 1 << 26
+
+PACKET_START = re.compile(rb"[\[,]\s*\{")
+# A match that begins in the overlap is found again after the next read
+SEARCH_OVERLAP = 256
+# Lines that may be ek index lines, which are decoded to make sure
+INDEX_LINE_START = re.compile(rb'\s*\{\s*"index"\s*:')
+
+
+def _is_packet_at(digest_file, offset):
+    """Return if a whole packet object begins at offset in digest_file."""
+    decoder = json.JSONDecoder(strict=False)
+    size = SEARCH_BYTES
+    while True:
+        digest_file.seek(offset)
+        raw = digest_file.read(size)
+        at_eof = len(raw) < size
+        text = raw.decode("utf-8", errors="ignore")
+        try:
+            packet, end = decoder.raw_decode(text)
+        except json.JSONDecodeError as error:
+            truncated = error.pos >= len(text) or error.msg.startswith(
+                "Unterminated string"
+            )
+            if at_eof or not truncated or size >= MAX_PACKET_BYTES:
+                return False
+            size *= 2
+            continue
+        following = text[end:].lstrip()[:1]
+        if not following and not at_eof:
+            size *= 2
+            continue
+        return (
+            isinstance(packet, dict) and "_source" in packet and following in (",", "]")
+        )
+
+
+def find_packet_start(digest_file, offset):
+    """Return the offset of the first packet starting after offset, or None.
+
+    digest_file must be a seekable binary file. An offset inside a packet's
+    `[` or `,` delimiter still finds the packet that follows it.
+    """
+    position = max(offset - 1, 0)
+    while True:
+        digest_file.seek(position)
+        raw = digest_file.read(SEARCH_BYTES)
+        for match in PACKET_START.finditer(raw):
+            candidate = position + match.end() - 1
+            if candidate >= offset and _is_packet_at(digest_file, candidate):
+                return candidate
+        if len(raw) < SEARCH_BYTES:
+            return None
+        position += SEARCH_BYTES - SEARCH_OVERLAP
+
+
+def _is_index_line(line):
+    """Return if a line of a newline delimited digest is an ek index line."""
+    if not INDEX_LINE_START.match(line):
+        return False
+    try:
+        return ek.is_index_line(json.loads(line))
+    except json.JSONDecodeError:
+        return False
+
+
+def find_line_start(digest_file, offset, paired=False):
+    """Return the offset of the first packet line starting at offset, or None.
+
+    digest_file must be a seekable binary file of newline delimited JSON.
+    Blank lines are skipped and, when paired (ek output), so are lines other
+    than index lines.
+    """
+    if offset:
+        # the line holding the byte before offset ends where the next starts
+        digest_file.seek(offset - 1)
+        digest_file.readline()
+    else:
+        digest_file.seek(0)
+    while True:
+        start = digest_file.tell()
+        line = digest_file.readline()
+        if not line:
+            return None
+        if line.strip() and (not paired or _is_index_line(line)):
+            return start
+
+
+def _line_starts(digest_path, size, shard_bytes):
+    """Return list of the offsets that split a newline delimited digest."""
+    starts = []
+    with digest_path.open("rb") as digest_file:
+        paired = _is_index_line(digest_file.readline())
+        for offset in range(0, size, shard_bytes):
+            if starts and offset <= starts[-1]:
+                continue
+            start = find_line_start(digest_file, offset, paired)
+            if start is None:
+                break
+            if not starts or start > starts[-1]:
+                starts.append(start)
+    return starts
+
+
+def _starts_array(digest_path):
+    """Return if a digest is a JSON array rather than newline delimited."""
+    with stream.open_digest(digest_path) as digest_file:
+        return stream.starts_array(digest_file)
+
+
+def shard_ranges(digest_path, shard_bytes=SHARD_BYTES):
+    """Return list of (start, end) byte ranges that split a digest's packets.
+
+    Each range begins at a packet and ends where the next range begins, so
+    every packet falls in exactly one range. Ranges are about shard_bytes
+    long, longer when a single packet is bigger than that. Ranges of a
+    compressed digest hold about shard_bytes of text in whole blocks.
+    Newline delimited digests are split at lines, keeping ek pairs whole.
+    """
+    if compressed.compression(digest_path):
+        return compressed.shard_ranges(digest_path, shard_bytes)
+    index = offsets.open_index(digest_path)
+    if index is not None:
+        with index:
+            return index.shard_ranges(shard_bytes)
+    size = digest_path.stat().st_size
+    if not _starts_array(digest_path):
+        starts = _line_starts(digest_path, size, shard_bytes)
+        return list(zip(starts, [*starts[1:], size]))
+    starts = []
+    with digest_path.open("rb") as digest_file:
+        for offset in range(0, size, shard_bytes):
+            if starts and offset <= starts[-1]:
+                continue
+            start = find_packet_start(digest_file, offset)
+            if start is None:
+                break
+            if not starts or start > starts[-1]:
+                starts.append(start)
+    return list(zip(starts, [*starts[1:], size]))
+
+
+def read_shard(digest_path, start, end, **decoder_kwargs):
+    """Return the list of packets in the byte range [start, end) of a digest.
+
+    Keyword arguments are passed to json.loads, or for newline delimited
+    digests to stream.read_packets.
+    """
+    if compressed.compression(digest_path):
+        raw = compressed.read_blocks(digest_path, start, end)
+        # the first block also holds the array's opening `[`
+        text = raw.decode("utf-8").strip().removeprefix("[")
+    else:
+        with digest_path.open("rb") as digest_file:
+            digest_file.seek(start)
+            text = digest_file.read(end - start).decode("utf-8").rstrip()
+    if not _starts_array(digest_path):
+        return list(stream.read_packets(io.StringIO(text), **decoder_kwargs))
+    # the range ends with the `,` before the next packet or the closing `]`
+    if text.endswith(","):
+        text = text[:-1] + "]"
+    return json.loads(f"[{text}", **decoder_kwargs)
@@ -0,0 +1,267 @@
+"""Read and write wireshark json digests a packet at a time."""
+
+import contextlib
+import json
+import operator
+import pathlib
+import sys
+
+from wireshark_digest_to_sqlite import compressed, digest, ek
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = " \t\n\r"
+STDIO_PATH = "-"
+
+
+class MalformedDigest(Exception):
+    """Raise when a digest is not a top-level JSON array of packets."""
+
+
+class _ChunkReader:
+    """Buffer a text file so JSON values can be decoded from it piecewise.
+
+    Only the unconsumed tail of what has been read is kept, so the buffer
+    stays about the size of the value currently being decoded.
+    """
+
+    def __init__(self, text_file, chunk_size):
+        self.text_file = text_file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        # characters dropped from the front of the buffer so far
+        self.dropped = 0
+
+    def read_more(self, size=None):
+        """Drop consumed text from the buffer and append the next chunk."""
+        chunk = self.text_file.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.dropped += self.pos
+        self.pos = 0
+
+    def offset(self):
+        """Return the position in the file of the next non-whitespace character."""
+        self.skip_whitespace()
+        return self.dropped + self.pos
+
+    def skip_whitespace(self):
+        """Advance past whitespace, reading more text as needed."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return
+            self.read_more()
+
+    def next_char(self):
+        """Return the next non-whitespace character, or "" at the end."""
+        self.skip_whitespace()
+        if self.pos >= len(self.buffer):
+            return ""
+        char = self.buffer[self.pos]
+        self.pos += 1
+        return char
+
+    def peek_char(self):
+        """Return the next non-whitespace character without consuming it."""
+        self.skip_whitespace()
+        return self.buffer[self.pos : self.pos + 1]
+
+    def decode(self, decoder):
+        """Decode and return the JSON value starting at the next character."""
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as error:
+                if self.eof:
+                    raise MalformedDigest(str(error)) from error
+            else:
+                # a value ending exactly at the buffer end may be truncated
+                # (e.g. a number), so only trust it once more text is seen
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            # grow reads with the pending value to avoid quadratic retries
+            self.read_more(max(self.chunk_size, len(self.buffer) - self.pos))
+
+
+def select_fields(packet, fields):
+    """Return a copy of packet with only the given fields of its layers.
+
+    fields holds wireshark field names (e.g. `ip.src`), kept wherever they
+    occur in a layer's trees, or layer names (e.g. `tls`) to keep a layer
+    whole. Layers without any of the fields are dropped.
+    """
+    source = packet["_source"]
+    layers = digest.select(source["layers"], fields)
+    return {**packet, "_source": {**source, "layers": layers}}
+
+
+def iter_packets(digest_file, chunk_size=CHUNK_SIZE, fields=None, **decoder_kwargs):
+    """Return iterable of the packets in the top-level array of a digest.
+
+    Read digest_file (a text file object holding `tshark -T json` output) in
+    chunks and decode one packet at a time, so memory use is bounded by the
+    largest packet rather than the size of the digest. Keyword arguments are
+    passed to json.JSONDecoder, e.g. `strict=False` or an `object_hook`.
+
+    With fields, each packet is cut down by select_fields as soon as it is
+    decoded, so the rest of its layers are never held past that packet.
+    """
+    decoder = json.JSONDecoder(**decoder_kwargs)
+    reader = _ChunkReader(digest_file, chunk_size)
+    if reader.next_char() != "[":
+        raise MalformedDigest("Expected a digest to start with `[`.")
+    yield from map(_PACKET, _iter_array(reader, decoder, fields))
+
+
+# Picks the packet out of the (offset, packet) pairs read below
+_PACKET = operator.itemgetter(1)
+
+
+def _iter_array(reader, decoder, fields=None):
+    """Return iterable of (offset, packet) of an array whose `[` was consumed.
+
+    offset is where the packet starts in the file.
+    """
+    if fields:
+        fields = frozenset(fields)
+    if reader.peek_char() == "]":
+        reader.next_char()
+        return
+
+    while True:
+        offset = reader.offset()
+        packet = reader.decode(decoder)
+        yield offset, select_fields(packet, fields) if fields else packet
+        separator = reader.next_char()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise MalformedDigest(
+                f"Expected `,` or `]` between packets, found `{separator}`."
+            )
+
+
+def _iter_documents(reader, decoder, fields=None, known_names=None):
+    """Return iterable of (offset, packet) in newline delimited JSON.
+
+    offset is where the packet's line starts in the file, or that of the ek
+    index line before it.
+    """
+    if fields:
+        fields = frozenset(fields)
+    index = offset = None
+    while reader.peek_char():
+        if index is None:
+            offset = reader.offset()
+        document = reader.decode(decoder)
+        if ek.is_index_line(document):
+            index = document
+            continue
+        if ek.is_ek_document(document):
+            packet = ek.normalize_packet(document, index, known_names)
+        elif isinstance(document, dict) and "_source" in document:
+            packet = document
+        else:
+            raise MalformedDigest("Expected a packet or ek document on each line.")
+        index = None
+        yield offset, select_fields(packet, fields) if fields else packet
+
+
+def starts_array(digest_file):
+    """Return if a digest starts with `[`, as `-T json` output does."""
+    return _ChunkReader(digest_file, CHUNK_SIZE).peek_char() == "["
+
+
+def read_packets(
+    digest_file, chunk_size=CHUNK_SIZE, fields=None, known_names=None, **decoder_kwargs
+):
+    """Return iterable of the packets of a digest in any format tshark writes.
+
+    A digest starting with `[` is read as by iter_packets. Others are read
+    as newline delimited JSON, holding either packets in the `-T json` shape
+    (as write_packets lays out `ndjson`) or `tshark -T ek` output, whose
+    documents are normalized by ek.normalize_packet with known_names. Either
+    way, packets are decoded one at a time and fields are selected as for
+    iter_packets.
+    """
+    yield from map(
+        _PACKET,
+        read_packet_offsets(
+            digest_file, chunk_size, fields, known_names, **decoder_kwargs
+        ),
+    )
+
+
+def read_packet_offsets(
+    digest_file, chunk_size=CHUNK_SIZE, fields=None, known_names=None, **decoder_kwargs
+):
+    """Return iterable of (offset, packet) for the packets of a digest.
+
+    Packets are read as by read_packets, and offset is the position in
+    digest_file where each one starts (for ek, where its index line does).
+    """
+    decoder = json.JSONDecoder(**decoder_kwargs)
+    reader = _ChunkReader(digest_file, chunk_size)
+    if reader.peek_char() == "[":
+        reader.next_char()
+        yield from _iter_array(reader, decoder, fields)
+    else:
+        yield from _iter_documents(reader, decoder, fields, known_names)
+
+
+def open_digest(path, mode="r"):
+    """Return a context manager for the text file of a digest at path.
+
+    A path of `-` uses stdin or stdout, which are left open afterwards, so
+    tools can run as filters in a pipe. Paths ending in `.gz` or `.zst` are
+    decompressed or compressed on the fly (see compressed.py).
+    """
+    if str(path) == STDIO_PATH:
+        return contextlib.nullcontext(sys.stdout if "w" in mode else sys.stdin)
+    if compressed.compression(pathlib.Path(path)):
+        return compressed.open_text(pathlib.Path(path), mode)
+    return open(path, mode)
+
+
+def _indented(packet):
+    """Return packet as JSON indented to sit inside an indented array."""
+    # strings can't hold a raw newline, so every newline starts indentation
+    return json.dumps(packet, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+
+
+def _compact(packet):
+    """Return packet as JSON on a single line."""
+    return json.dumps(packet, ensure_ascii=False)
+
+
+# serializer, opening, separator, closing and empty output of each format.
+# `json` is laid out as by json.dumps(digest, indent=2), `single-line` as by
+# json.dumps(digest) and `ndjson` has one packet per line with no array.
+OUTPUT_LAYOUTS = {
+    "json": (_indented, "[\n  ", ",\n  ", "\n]", "[]"),
+    "single-line": (_compact, "[", ", ", "]", "[]"),
+    "ndjson": (_compact, "", "\n", "\n", ""),
+}
+OUTPUT_FORMATS = tuple(OUTPUT_LAYOUTS)
+
+
+def write_packets(packets, output_file, output_format="json"):
+    """Write packets to a text file as each is produced.
+
+    Only one packet is serialized at a time, so an iterable such as
+    iter_packets is never held in memory. Return the number of packets.
+    """
+    serialize, opening, separator, closing, empty = OUTPUT_LAYOUTS[output_format]
+    written = 0
+    for packet in packets:
+        output_file.write(separator if written else opening)
+        output_file.write(serialize(packet))
+        written += 1
+    output_file.write(closing if written else empty)
+    return written
@@ -0,0 +1,72 @@
+"""Run tshark and read what it reports."""
+
+import contextlib
+import subprocess
+
+from wireshark_digest_to_sqlite import digest, ek, stream
+
+TSHARK = "tshark"
+
+
+def field_names(glossary_lines, protocols=None):
+    """Return iterable of field names in `tshark -G fields` output lines.
+
+    Field lines are tab separated: `F`, the field's description, its name,
+    and further details. With protocols, only fields of those protocols (the
+    part of the name before the first `.`) are returned.
+    """
+    for line in glossary_lines:
+        kind, _, rest = line.partition("\t")
+        if kind != "F":
+            continue
+        _description, _, rest = rest.partition("\t")
+        name, _, _ = rest.partition("\t")
+        if protocols is None or name.partition(".")[0] in protocols:
+            yield name
+
+
+def glossary_field_names(protocols=None, tshark=TSHARK):
+    """Return the list of field names known to tshark, see field_names."""
+    glossary = subprocess.run(
+        [tshark, "-G", "fields"], capture_output=True, text=True, check=True
+    ).stdout
+    return list(field_names(glossary.splitlines(), protocols))
+
+
+@contextlib.contextmanager
+def dissect(pcap_path, options=(), output_format="json", tshark=TSHARK):
+    """Return a context manager for tshark's dissection of a capture.
+
+    tshark is run as `tshark -r pcap_path -T output_format *options` and the
+    context manager gives the text stream of its output, so it can be read as
+    it is written without landing on disk. tshark is killed if the block
+    fails, and CalledProcessError is raised if it exits with an error.
+    """
+    command = [tshark, "-r", str(pcap_path), "-T", output_format, *options]
+    with subprocess.Popen(command, stdout=subprocess.PIPE, encoding="utf-8") as process:
+        try:
+            yield process.stdout
+        except BaseException:
+            process.kill()
+            raise
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def capture_packets(pcap_path, options=(), output_format="json", tshark=TSHARK):
+    """Return iterable of the packets tshark dissects from a capture.
+
+    Packets are decoded from tshark's `json` or `ek` output one at a time as
+    it is written, in the `-T json` shape and keeping every value of
+    repeated keys. The field names of ek output are restored from tshark's
+    glossary.
+    """
+    known_names = None
+    if output_format == "ek":
+        known_names = ek.ek_field_names(glossary_field_names(tshark=tshark))
+    with dissect(pcap_path, options, output_format, tshark) as dissection:
+        yield from stream.read_packets(
+            dissection,
+            known_names=known_names,
+            object_pairs_hook=digest.merge_duplicate_keys,
+        )